@@ -0,0 +1,198 @@
+# backend/ci_analytics.py
+"""
+Deploy pipeline analytics over workflow run history.
+
+Completed runs (and their jobs/steps) never change, so they are fetched once and
+kept as compact records per workflow (the newest CI_ANALYTICS_MAX_RUNS); each
+refresh pages through the run list newest-first until the requested window is
+covered by known and new runs, so the pages already cached are not fetched again. Aggregation is vectorized
+with numpy (imported on first use, to keep it out of cold starts): per-workflow
+duration/queue-time percentiles and failure rate, and per-step percentiles and
+failure rates from one sorted array of step samples split into groups. A step is flagged as regressed when the median of its most recent
+CI_ANALYTICS_RECENT_RUNS runs exceeds the median of the CI_ANALYTICS_BASELINE_RUNS
+runs before them by more than CI_ANALYTICS_REGRESSION_RATIO (and
+CI_ANALYTICS_REGRESSION_MIN_SECONDS).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import config
+import github_api
+import tracing
+
+logger = logging.getLogger(__name__)
+
+_FAILED_CONCLUSIONS = ("failure", "timed_out", "startup_failure")
+
+_runs = {} # workflow filename -> {run_id: record}; completed runs only
+_workflow_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _compact_run(run, jobs):
+    """Keeps only the fields the analytics use."""
+    return {
+        "id": run.get("id"),
+        "run_number": run.get("run_number"),
+        "conclusion": run.get("conclusion"),
+        "created_at": run.get("created_at"),
+        "run_started_at": run.get("run_started_at") or run.get("created_at"),
+        "updated_at": run.get("updated_at"),
+        "jobs": [{
+            "name": job.get("name"),
+            "started_at": job.get("started_at"),
+            "steps": [{
+                "name": step.get("name"),
+                "conclusion": step.get("conclusion"),
+                "started_at": step.get("started_at"),
+                "completed_at": step.get("completed_at"),
+            } for step in job.get("steps") or []],
+        } for job in jobs or []],
+    }
+
+
+def _workflow_lock(workflow_filename):
+    with _locks_guard:
+        return _workflow_locks.setdefault(workflow_filename, threading.Lock())
+
+
+def refresh_runs(pat, workflow_filename, max_runs=None):
+    """
+    Pages through the workflow's completed runs newest-first until the newest max_runs
+    are all cached or fetched (or history ends), then fetches jobs for the new ones
+    concurrently. The cache keeps the newest CI_ANALYTICS_MAX_RUNS whatever max_runs is.
+    Returns (fetch stats dict, error or None).
+    """
+    max_runs = min(max_runs or config.CI_ANALYTICS_MAX_RUNS, config.CI_ANALYTICS_MAX_RUNS)
+    per_page = min(100, max_runs)
+    with _workflow_lock(workflow_filename):
+        known = _runs.setdefault(workflow_filename, {})
+        new_runs, seen, pages = [], 0, 0
+        while seen < max_runs:
+            pages += 1
+            runs, err = github_api.list_workflow_runs(
+                pat, workflow_filename, per_page=per_page, page=pages, status="completed",
+                priority=github_api.PRIORITY_BACKGROUND, use_cache=pages == 1) # Page 1 revalidates with its ETag
+            if err:
+                return {"pages": pages, "new_runs": len(new_runs), "cached_runs": len(known)}, err
+            new_runs.extend(run for run in runs if run.get("id") not in known)
+            seen += len(runs)
+            reached_known = any(run.get("id") in known for run in runs)
+            if len(runs) < per_page: # End of history
+                break
+            if reached_known and len(known) + len(new_runs) >= max_runs:
+                break # Known runs continue the window below this page (they were fetched newest-first too)
+
+        def fetch_jobs(run):
+            jobs, err = github_api.get_run_jobs(pat, run["id"], priority=github_api.PRIORITY_BACKGROUND, use_cache=False)
+            if err:
+                logger.warning(f"CI analytics: skipping jobs of run {run['id']}: {err}")
+            return run, jobs
+
+        with ThreadPoolExecutor(max_workers=config.CI_ANALYTICS_FETCH_WORKERS) as pool:
+            for run, jobs in pool.map(tracing.propagate(fetch_jobs), new_runs[:max_runs]):
+                if jobs is not None: # Retried on the next refresh otherwise
+                    known[run["id"]] = _compact_run(run, jobs)
+        # Keep the newest CI_ANALYTICS_MAX_RUNS (ids grow over time)
+        for run_id in sorted(known)[:-config.CI_ANALYTICS_MAX_RUNS] if len(known) > config.CI_ANALYTICS_MAX_RUNS else []:
+            del known[run_id]
+        return {"pages": pages, "new_runs": len(new_runs), "cached_runs": len(known)}, None
+
+
+def _epoch_seconds(values):
+    """ISO 8601 strings ('Z' or offsets; None allowed) -> float epoch seconds array, NaN for missing values."""
+    import numpy as np
+    return np.array([datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp() if v else np.nan for v in values], dtype=float)
+
+
+def _seconds_between(starts, ends):
+    return _epoch_seconds(ends) - _epoch_seconds(starts)
+
+
+def _percentiles(values):
+    import numpy as np
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return None
+    p50, p90, p95 = np.percentile(values, [50, 90, 95])
+    return {"p50": round(float(p50), 1), "p90": round(float(p90), 1), "p95": round(float(p95), 1),
+            "mean": round(float(values.mean()), 1), "count": int(values.size)}
+
+
+def analyze_runs(records):
+    """Aggregates compact run records (any order) into workflow and per-step statistics."""
+    import numpy as np
+    records = sorted(records, key=lambda r: r["created_at"] or "") # Oldest first, for the rolling baseline
+    if not records:
+        return {"runs": 0}
+    durations = _seconds_between([r["run_started_at"] for r in records], [r["updated_at"] for r in records])
+    first_job_start = [min((j["started_at"] for j in r["jobs"] if j["started_at"]), default=None) for r in records]
+    queue = _seconds_between([r["created_at"] for r in records], first_job_start)
+    failed = np.isin(np.array([r["conclusion"] or "" for r in records]), _FAILED_CONCLUSIONS)
+
+    # One flat sample per executed step: (step key, run position, duration, failed)
+    keys, positions, starts, ends, step_failed = [], [], [], [], []
+    for position, record in enumerate(records):
+        for job in record["jobs"]:
+            for step in job["steps"]:
+                if step["conclusion"] == "skipped" or not step["started_at"]:
+                    continue
+                keys.append((job["name"], step["name"])); positions.append(position)
+                starts.append(step["started_at"]); ends.append(step["completed_at"])
+                step_failed.append(step["conclusion"] in _FAILED_CONCLUSIONS)
+    steps, regressions = [], []
+    if keys:
+        unique_keys, codes = np.unique(np.array([f"{job}\x1f{step}" for job, step in keys]), return_inverse=True)
+        step_durations = _seconds_between(starts, ends)
+        step_failed = np.array(step_failed)
+        order = np.lexsort((np.array(positions), codes)) # Group by step, chronological within a step
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        recent_n, baseline_n = config.CI_ANALYTICS_RECENT_RUNS, config.CI_ANALYTICS_BASELINE_RUNS
+        for group in np.split(order, boundaries):
+            job_name, step_name = unique_keys[codes[group[0]]].split("\x1f", 1)
+            values = step_durations[group]
+            entry = {"job": job_name, "step": step_name, "duration": _percentiles(values),
+                     "failure_rate": round(float(step_failed[group].mean()), 3)}
+            valid = values[~np.isnan(values)]
+            if valid.size >= recent_n + max(3, baseline_n // 2): # Enough history for a baseline
+                recent = float(np.median(valid[-recent_n:]))
+                baseline = float(np.median(valid[-(recent_n + baseline_n):-recent_n]))
+                entry.update({"recent_p50": round(recent, 1), "baseline_p50": round(baseline, 1)})
+                entry["regressed"] = bool(recent > baseline * (1 + config.CI_ANALYTICS_REGRESSION_RATIO)
+                                          and recent - baseline >= config.CI_ANALYTICS_REGRESSION_MIN_SECONDS)
+                if entry["regressed"]:
+                    regressions.append({"job": job_name, "step": step_name, "baseline_p50": entry["baseline_p50"],
+                                        "recent_p50": entry["recent_p50"], "change": round(recent / baseline - 1, 3) if baseline else None})
+            steps.append(entry)
+        steps.sort(key=lambda e: -(e["duration"] or {}).get("p50", 0))
+
+    return {
+        "runs": len(records),
+        "window": {"from": records[0]["created_at"], "to": records[-1]["created_at"]},
+        "duration": _percentiles(durations),
+        "queue_time": _percentiles(queue),
+        "failure_rate": round(float(failed.mean()), 3),
+        "steps": steps,
+        "regressions": regressions,
+    }
+
+
+def get_workflow_analytics(pat, workflow_filename, max_runs=None):
+    """
+    Refreshes the workflow's run cache incrementally and returns (analytics dict, error or None)
+    over its newest max_runs runs.
+    A failed refresh still returns analytics for the runs already cached, with the error.
+    """
+    started = time.perf_counter()
+    max_runs = min(max_runs or config.CI_ANALYTICS_MAX_RUNS, config.CI_ANALYTICS_MAX_RUNS)
+    fetch, err = refresh_runs(pat, workflow_filename, max_runs)
+    with _workflow_lock(workflow_filename):
+        cached = _runs.get(workflow_filename, {})
+        records = [cached[run_id] for run_id in sorted(cached)[-max_runs:]] # Newest max_runs
+    with tracing.span("ci.analyze", runs=len(records)):
+        analytics = analyze_runs(records)
+    fetch["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    analytics["fetch"] = fetch
+    return analytics, err
@@ -1,6 +1,7 @@
 # backend/config.py
 import os
 import logging
+import tempfile
 
 # --- Basic Logging Setup ---
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -16,6 +17,23 @@ GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID")
 # Region can have a default as it's less critical for basic function if not set,
 # though deployment might fail if not specified there either.
 REGION = os.environ.get("GCP_REGION", "us-central1")
+# Secret Manager values are cached in-process; a GitHub 401 invalidates the PAT early
+SECRET_CACHE_TTL_SECONDS = float(os.environ.get("SECRET_CACHE_TTL_SECONDS", "300"))
+SECRET_PREFETCH_ON_START = os.environ.get("SECRET_PREFETCH_ON_START", "true").lower() == "true"
+# Heavy client libraries are imported on first use; after the first response a background
+# thread imports them ahead of time so later requests on a warm instance do not pay for it
+PREWARM_IMPORTS_AFTER_FIRST_REQUEST = os.environ.get("PREWARM_IMPORTS_AFTER_FIRST_REQUEST", "true").lower() == "true"
+# Cloud Logging queries for /get_logs are bounded to this window unless the caller asks otherwise
+LOG_QUERY_DEFAULT_WINDOW_MINUTES = float(os.environ.get("LOG_QUERY_DEFAULT_WINDOW_MINUTES", "1440"))
+LOG_QUERY_MAX_WINDOW_MINUTES = 7 * 24 * 60
+# Infrastructure noise excluded in the logging query itself
+LOG_QUERY_EXCLUDE_PATTERNS = ["Function execution started", "Function execution took"]
+# Per-instance ring buffer behind the cursor-based log tail (/get_logs?tail=true)
+LOG_TAIL_BUFFER_SIZE = int(os.environ.get("LOG_TAIL_BUFFER_SIZE", "2000"))
+LOG_TAIL_SEED_LINES = 200 # Lines loaded into an empty buffer (max /get_logs limit)
+LOG_TAIL_FETCH_MAX = 500 # Max new entries read per refresh
+LOG_TAIL_REFRESH_SECONDS = float(os.environ.get("LOG_TAIL_REFRESH_SECONDS", "3")) # Min time between Cloud Logging queries
+LOG_TAIL_MAX_WAIT_SECONDS = 25 # Long-poll cap, below the frontend/GCF request timeouts
 
 # --- Vertex AI Settings ---
 MODEL_NAME = os.environ.get("VERTEX_MODEL_NAME", "gemini-2.5-flash-preview-04-17") # Updated model name (check availability)
@@ -23,12 +41,40 @@ GENERATION_CONFIG_CHAT = {"temperature": 0.7, "max_output_tokens": 2048}
 # Increased max_output_tokens for plan generation to accommodate potentially larger outputs
 GENERATION_CONFIG_PLAN = {"temperature": 0.15, "max_output_tokens": 8192} # Low temp for JSON/code/patches
 GENERATION_CONFIG_ANALYZE = {"temperature": 0.4, "max_output_tokens": 4096}
+# Logs longer than this are template-mined (log_miner) before analysis instead of sent raw
+LOG_ANALYSIS_MINE_THRESHOLD_CHARS = int(os.environ.get("LOG_ANALYSIS_MINE_THRESHOLD_CHARS", "4000"))
+# Map-reduce analysis for logs whose templates still exceed one prompt
+LOG_ANALYSIS_MAP_REDUCE_MIN_CHARS = int(os.environ.get("LOG_ANALYSIS_MAP_REDUCE_MIN_CHARS", "50000"))
+LOG_ANALYSIS_CHUNK_CHARS = int(os.environ.get("LOG_ANALYSIS_CHUNK_CHARS", "60000")) # Raw chars per map call
+LOG_ANALYSIS_MAP_WORKERS = int(os.environ.get("LOG_ANALYSIS_MAP_WORKERS", "8")) # Concurrent map calls
+LOG_ANALYSIS_CACHE_SIZE = int(os.environ.get("LOG_ANALYSIS_CACHE_SIZE", "256")) # Cached chunk summaries
 
 # --- Firestore Settings ---
 FIRESTORE_COLLECTION = os.environ.get("FIRESTORE_COLLECTION", "conversations")
 # Changed CONVERSATION_DOC_ID default for clarity, ensure it matches credentials if needed
 CONVERSATION_DOC_ID = os.environ.get("CONVERSATION_DOC_ID", "main_chat_history_v3")
+# Messages live as individual documents under the conversation document
+FIRESTORE_MESSAGES_SUBCOLLECTION = os.environ.get("FIRESTORE_MESSAGES_SUBCOLLECTION", "messages")
 HISTORY_LIMIT = 30 # Number of messages to fetch for context
+HISTORY_PAGE_MAX = 100 # Upper bound for a single UI history page
+# Write-behind buffer for history messages (flushed in one batch per request)
+HISTORY_WRITE_BUFFER_ENABLED = os.environ.get("HISTORY_WRITE_BUFFER_ENABLED", "true").lower() == "true"
+HISTORY_FLUSH_MAX_MESSAGES = int(os.environ.get("HISTORY_FLUSH_MAX_MESSAGES", "20")) # Flush early once this many are queued
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.environ.get("HISTORY_FLUSH_INTERVAL_SECONDS", "2.0")) # Background flush for idle buffers
+HISTORY_BUFFER_MAX_PENDING = int(os.environ.get("HISTORY_BUFFER_MAX_PENDING", "1000")) # Beyond this writers flush synchronously (nothing is dropped)
+HISTORY_BUFFER_FULL_WAIT_SECONDS = float(os.environ.get("HISTORY_BUFFER_FULL_WAIT_SECONDS", "5")) # Max time a writer retries flushing a full buffer
+# In-process window cache of the newest messages, validated against the conversation doc's update time
+HISTORY_CACHE_ENABLED = os.environ.get("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+HISTORY_CACHE_SIZE = max(HISTORY_LIMIT, int(os.environ.get("HISTORY_CACHE_SIZE", "100")))
+HISTORY_CACHE_TTL_SECONDS = float(os.environ.get("HISTORY_CACHE_TTL_SECONDS", "30")) # Max time between version checks
+HISTORY_CACHE_MAX_CONVERSATIONS = int(os.environ.get("HISTORY_CACHE_MAX_CONVERSATIONS", "64")) # Per-session caches kept (LRU)
+# Large message bodies are stored zlib-compressed instead of truncated
+HISTORY_COMPRESS_THRESHOLD_CHARS = int(os.environ.get("HISTORY_COMPRESS_THRESHOLD_CHARS", "2048"))
+HISTORY_COMPRESSION_LEVEL = int(os.environ.get("HISTORY_COMPRESSION_LEVEL", "6"))
+HISTORY_INLINE_MAX_BYTES = int(os.environ.get("HISTORY_INLINE_MAX_BYTES", str(512 * 1024))) # Compressed bytes kept in the message doc
+HISTORY_CHUNK_BYTES = int(os.environ.get("HISTORY_CHUNK_BYTES", str(512 * 1024))) # Chunk doc size for larger payloads
+# Job state documents for asynchronous modification requests (jobs.py)
+FIRESTORE_JOBS_COLLECTION = os.environ.get("FIRESTORE_JOBS_COLLECTION", "ecko_jobs")
 
 # --- GitHub Settings ---
 # These are in REQUIRED_ENV_VARS, so no defaults here
@@ -44,7 +90,78 @@ GITHUB_REPO_URL_TEMPLATE = os.environ.get("GITHUB_REPO_URL_TEMPLATE", "https://{
 COMMIT_AUTHOR_NAME = os.environ.get("COMMIT_AUTHOR_NAME", "Ecko Agent")
 BACKEND_WORKFLOW_FILENAME = os.environ.get("BACKEND_WORKFLOW_FILENAME", "deploy-backend.yml")
 FRONTEND_WORKFLOW_FILENAME = os.environ.get("FRONTEND_WORKFLOW_FILENAME", "deploy-frontend.yml")
-GITHUB_API_BASE_URL = "https://api.github.com"
+GITHUB_API_BASE_URL = os.environ.get("GITHUB_API_BASE_URL", "https://api.github.com") # Overridable for GHE or a local fake
+# Pooled HTTP session for GitHub API calls
+GITHUB_HTTP_POOL_SIZE = int(os.environ.get("GITHUB_HTTP_POOL_SIZE", "10")) # Keep-alive connections per host
+GITHUB_HTTP_MAX_RETRIES = int(os.environ.get("GITHUB_HTTP_MAX_RETRIES", "3")) # Retries on 5xx (adapter) and on rate limits (_make_request)
+GITHUB_HTTP_BACKOFF_FACTOR = float(os.environ.get("GITHUB_HTTP_BACKOFF_FACTOR", "0.5"))
+GITHUB_RETRY_AFTER_MAX_SECONDS = float(os.environ.get("GITHUB_RETRY_AFTER_MAX_SECONDS", "30")) # Longer waits fail fast instead
+# ETag / Last-Modified cache for GitHub GETs (304s do not count against the rate limit)
+GITHUB_HTTP_CACHE_ENABLED = os.environ.get("GITHUB_HTTP_CACHE_ENABLED", "true").lower() == "true"
+GITHUB_HTTP_CACHE_SIZE = int(os.environ.get("GITHUB_HTTP_CACHE_SIZE", "256"))
+# Rate limit scheduler: concurrency cap, budget kept back from background calls, max queueing time per priority
+GITHUB_MAX_CONCURRENT_REQUESTS = int(os.environ.get("GITHUB_MAX_CONCURRENT_REQUESTS", "6"))
+GITHUB_BACKGROUND_RESERVE = int(os.environ.get("GITHUB_BACKGROUND_RESERVE", "500")) # Requests left for interactive calls only
+GITHUB_INTERACTIVE_MAX_WAIT_SECONDS = float(os.environ.get("GITHUB_INTERACTIVE_MAX_WAIT_SECONDS", "10"))
+GITHUB_BACKGROUND_MAX_WAIT_SECONDS = float(os.environ.get("GITHUB_BACKGROUND_MAX_WAIT_SECONDS", "120"))
+# Run log archives: spooled to memory up to the first limit, then to a temp file (on GCF /tmp counts
+# against instance memory, hence the hard download cap); only the tail of each member is kept
+LOG_ARCHIVE_SPOOL_MEMORY_BYTES = int(os.environ.get("LOG_ARCHIVE_SPOOL_MEMORY_BYTES", str(4 * 1024 * 1024)))
+LOG_ARCHIVE_MAX_DOWNLOAD_BYTES = int(os.environ.get("LOG_ARCHIVE_MAX_DOWNLOAD_BYTES", str(256 * 1024 * 1024)))
+LOG_ARCHIVE_MEMBER_TAIL_BYTES = int(os.environ.get("LOG_ARCHIVE_MEMBER_TAIL_BYTES", str(128 * 1024)))
+LOG_ARCHIVE_READ_CHUNK_BYTES = int(os.environ.get("LOG_ARCHIVE_READ_CHUNK_BYTES", str(64 * 1024)))
+# Extracted logs of completed runs, cached on local disk by run ID (GCF's /tmp is memory-backed, keep it small)
+RUN_LOG_CACHE_ENABLED = os.environ.get("RUN_LOG_CACHE_ENABLED", "true").lower() == "true"
+RUN_LOG_CACHE_DIR = os.environ.get("RUN_LOG_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ecko_run_logs"))
+RUN_LOG_CACHE_MAX_BYTES = int(os.environ.get("RUN_LOG_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Log search (/search_logs): index cache and limits
+LOG_SEARCH_INDEX_CACHE_SIZE = int(os.environ.get("LOG_SEARCH_INDEX_CACHE_SIZE", "8"))
+LOG_SEARCH_INDEX_TTL_SECONDS = float(os.environ.get("LOG_SEARCH_INDEX_TTL_SECONDS", "30")) # Function log indexes; run indexes are immutable
+LOG_SEARCH_GCF_MAX_LINES = int(os.environ.get("LOG_SEARCH_GCF_MAX_LINES", "5000"))
+LOG_SEARCH_ANALYZE_MAX_LINES = int(os.environ.get("LOG_SEARCH_ANALYZE_MAX_LINES", "2000")) # Matches sent to the LLM
+LOG_SEARCH_MAX_REGEX_CHARS = int(os.environ.get("LOG_SEARCH_MAX_REGEX_CHARS", "200"))
+LOG_SEARCH_MAX_REGEX_REPEATS = int(os.environ.get("LOG_SEARCH_MAX_REGEX_REPEATS", "3")) # Unbounded '*', '+', '{n,}' per regex
+LOG_SEARCH_MAX_SCAN_SECONDS = float(os.environ.get("LOG_SEARCH_MAX_SCAN_SECONDS", "2")) # Regex scans stop here (results marked truncated)
+# Deploy watcher: run correlation and adaptive status polling after a dispatch
+DEPLOY_WATCH_MIN_INTERVAL_SECONDS = float(os.environ.get("DEPLOY_WATCH_MIN_INTERVAL_SECONDS", "2"))
+DEPLOY_WATCH_MAX_INTERVAL_SECONDS = float(os.environ.get("DEPLOY_WATCH_MAX_INTERVAL_SECONDS", "30"))
+DEPLOY_WATCH_BACKOFF_FACTOR = float(os.environ.get("DEPLOY_WATCH_BACKOFF_FACTOR", "1.5")) # Per unchanged poll
+DEPLOY_WATCH_TIMEOUT_SECONDS = float(os.environ.get("DEPLOY_WATCH_TIMEOUT_SECONDS", "3600"))
+DEPLOY_WATCH_CLOCK_SKEW_SECONDS = float(os.environ.get("DEPLOY_WATCH_CLOCK_SKEW_SECONDS", "10")) # Slack for run created_at vs our clock
+DEPLOY_WATCH_RETENTION_SECONDS = float(os.environ.get("DEPLOY_WATCH_RETENTION_SECONDS", "600")) # Finished watches kept for late pollers
+DEPLOY_EVENTS_MAX_WAIT_SECONDS = float(os.environ.get("DEPLOY_EVENTS_MAX_WAIT_SECONDS", "25"))
+# CI analytics (/ci_analytics): run history window, job fetch concurrency, step regression detection
+CI_ANALYTICS_MAX_RUNS = int(os.environ.get("CI_ANALYTICS_MAX_RUNS", "200"))
+CI_ANALYTICS_FETCH_WORKERS = int(os.environ.get("CI_ANALYTICS_FETCH_WORKERS", "4"))
+CI_ANALYTICS_RECENT_RUNS = int(os.environ.get("CI_ANALYTICS_RECENT_RUNS", "5"))
+CI_ANALYTICS_BASELINE_RUNS = int(os.environ.get("CI_ANALYTICS_BASELINE_RUNS", "20"))
+CI_ANALYTICS_REGRESSION_RATIO = float(os.environ.get("CI_ANALYTICS_REGRESSION_RATIO", "0.25")) # Recent median vs baseline median
+CI_ANALYTICS_REGRESSION_MIN_SECONDS = float(os.environ.get("CI_ANALYTICS_REGRESSION_MIN_SECONDS", "10"))
+# Asynchronous modification jobs: '/ecko' modification commands return a job ID and run on this pool.
+# Jobs keep running after the response, so only enable them where the instance keeps its CPU
+# outside requests (Cloud Run '--no-cpu-throttling', see deploy-backend.yml)
+MODIFICATION_JOBS_ENABLED = os.environ.get("MODIFICATION_JOBS_ENABLED", "false").lower() == "true"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2")) # Concurrent jobs per instance (clone + LLM + push each)
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", "8")) # Jobs waiting for a worker before new ones are refused
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "3600")) # Finished jobs kept in memory
+JOB_STATUS_MAX_WAIT_SECONDS = float(os.environ.get("JOB_STATUS_MAX_WAIT_SECONDS", "25"))
+# Unfinished jobs re-write their state every JOB_HEARTBEAT_SECONDS; a stored job not refreshed for
+# JOB_LEASE_SECONDS lost its instance (recycled or throttled) and is reported as failed
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "20"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "120"))
+JOB_EVENTS_STREAM_MAX_SECONDS = float(os.environ.get("JOB_EVENTS_STREAM_MAX_SECONDS", "300")) # Clients reconnect with Last-Event-ID
+JOB_EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("JOB_EVENTS_HEARTBEAT_SECONDS", "15"))
+# Intermediate modification steps ("Generating modification plan..." etc.) are streamed as job
+# events; writing them to conversation history as well is optional (final results always are)
+MODIFICATION_PROGRESS_HISTORY = os.environ.get("MODIFICATION_PROGRESS_HISTORY", "true").lower() == "true"
+# Pushes rejected as non-fast-forward are retried after re-validating the plan on the new head
+MODIFICATION_PUSH_ATTEMPTS = int(os.environ.get("MODIFICATION_PUSH_ATTEMPTS", "3"))
+# Tracing: sampled requests/jobs record spans, returned in a Server-Timing header and logged as JSON
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1")) # Fraction of requests/jobs traced
+TRACE_FORCE_HEADER_NAME = "X-Ecko-Trace" # Requests sending this header (any value) are always traced
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "200")) # Spans kept per trace; totals still cover all
+TRACE_SERVER_TIMING_MAX_METRICS = int(os.environ.get("TRACE_SERVER_TIMING_MAX_METRICS", "30"))
 
 # --- Agent & Command Configuration ---
 AGENT_NAME = "Ecko"
@@ -77,6 +194,7 @@ ALLOWED_OPS = [
 # ECKO_SHARED_SECRET_ENV_VAR name itself is not secret
 ECKO_SHARED_SECRET_ENV_VAR = "ECKO_SHARED_SECRET" # Name of env var holding the shared secret value
 AUTH_HEADER_NAME = "X-Ecko-Auth" # Name of the custom header
+SESSION_HEADER_NAME = "X-Ecko-Session" # Client session ID; each session gets its own conversation document
 # ALLOWED_ORIGIN is in REQUIRED_ENV_VARS, so no default here
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN") # The specific frontend URL (e.g., https://owner.github.io)
 
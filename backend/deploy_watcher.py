@@ -0,0 +1,200 @@
+# backend/deploy_watcher.py
+"""
+Server-side tracking of dispatched deployments.
+
+A workflow_dispatch call returns no run ID, so each dispatch starts a watch that
+correlates its run by timestamp: the oldest workflow_dispatch run on the branch
+created at or after the dispatch time (minus DEPLOY_WATCH_CLOCK_SKEW_SECONDS)
+that no other watch has claimed. A background thread then follows that run,
+polling quickly while nothing is known and backing off while the run sits in the
+same state (run lookups are conditional requests, so unchanged polls cost no rate
+limit). Every state transition becomes an event that clients receive through
+wait_for_events() long-polls.
+
+Watches live in instance memory. Cloud Functions may throttle CPU between
+requests, but a client long-polling a watch keeps its instance active for
+exactly the period the watch matters.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+import config
+import github_api
+
+logger = logging.getLogger(__name__)
+
+_watches = {} # watch_id -> DeployWatch
+_watches_lock = threading.Lock()
+_claimed_run_ids = set()
+_stats = {"started": 0, "correlated": 0, "completed": 0, "timed_out": 0, "polls": 0}
+
+
+class DeployWatch:
+    """One dispatched deployment: its correlated run, its state and the ordered event log."""
+    def __init__(self, target, workflow_filename, dispatched_at):
+        self.watch_id = uuid.uuid4().hex
+        self.target = target
+        self.workflow_filename = workflow_filename
+        self.dispatched_at = dispatched_at
+        self.run_id = None
+        self.state = "dispatched" # dispatched -> queued/waiting/in_progress -> completed | timed_out | error
+        self.conclusion = None
+        self.html_url = None
+        self.done = False
+        self.finished_at = None
+        self.events = []
+        self._changed = threading.Condition()
+
+    def publish(self, state, message=None, conclusion=None, done=False):
+        """Appends a transition event and wakes waiting clients."""
+        with self._changed:
+            self.state, self.done = state, done
+            if conclusion is not None:
+                self.conclusion = conclusion
+            if done:
+                self.finished_at = time.time()
+            event = {
+                "seq": len(self.events) + 1,
+                "state": state,
+                "conclusion": self.conclusion,
+                "run_id": self.run_id,
+                "html_url": self.html_url,
+                "message": message,
+                "at": datetime.now(timezone.utc).isoformat(),
+            }
+            self.events.append(event)
+            self._changed.notify_all()
+        logger.info(f"Deploy watch {self.watch_id} ({self.target}): {state}" + (f" ({self.conclusion})" if self.conclusion else ""))
+
+    def wait(self, after_seq, wait_seconds):
+        """Returns events with seq > after_seq, waiting up to wait_seconds for one to arrive."""
+        deadline = time.monotonic() + wait_seconds
+        with self._changed:
+            while len(self.events) <= after_seq and not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return list(self.events[after_seq:]), self.done
+
+    def snapshot(self):
+        return {"watch_id": self.watch_id, "target": self.target, "state": self.state, "conclusion": self.conclusion,
+                "run_id": self.run_id, "html_url": self.html_url, "done": self.done}
+
+
+def _correlate_run(watch, pat):
+    """Returns the run created by this watch's dispatch, claiming it, or None if it has not appeared yet."""
+    since = watch.dispatched_at - timedelta(seconds=config.DEPLOY_WATCH_CLOCK_SKEW_SECONDS)
+    runs, err = github_api.list_workflow_runs(
+        pat, watch.workflow_filename, event="workflow_dispatch",
+        created_since=since.strftime('%Y-%m-%dT%H:%M:%SZ'), priority=github_api.PRIORITY_BACKGROUND)
+    if err:
+        logger.warning(f"Deploy watch {watch.watch_id}: run lookup failed: {err}")
+        return None
+    with _watches_lock:
+        for run in sorted(runs or [], key=lambda r: (r.get("created_at") or "", r.get("id") or 0)): # Oldest first
+            if run.get("id") not in _claimed_run_ids:
+                _claimed_run_ids.add(run["id"])
+                _stats["correlated"] += 1
+                return run
+    return None
+
+
+def _run_watch(watch, pat_provider):
+    """Poller thread body: correlates the run, then follows it until it completes or the watch times out."""
+    interval = config.DEPLOY_WATCH_MIN_INTERVAL_SECONDS
+    started = time.monotonic()
+    last_status = None
+    try:
+        while time.monotonic() - started < config.DEPLOY_WATCH_TIMEOUT_SECONDS:
+            time.sleep(interval)
+            pat, err_pat = pat_provider()
+            if err_pat:
+                watch.publish("error", message=f"PAT Error: {err_pat}", done=True)
+                return
+            with _watches_lock:
+                _stats["polls"] += 1
+            if watch.run_id is None:
+                run = _correlate_run(watch, pat)
+            else:
+                run, err = github_api.get_workflow_run(pat, watch.run_id, priority=github_api.PRIORITY_BACKGROUND)
+                if err:
+                    logger.warning(f"Deploy watch {watch.watch_id}: status lookup failed: {err}")
+                    run = None
+            if run is None:
+                if watch.run_id is None:
+                    # Not correlated yet: the run usually appears within seconds, so keep polling briskly
+                    interval = config.DEPLOY_WATCH_MIN_INTERVAL_SECONDS
+                else: # Status lookup failed: back off as for an unchanged state
+                    interval = min(interval * config.DEPLOY_WATCH_BACKOFF_FACTOR, config.DEPLOY_WATCH_MAX_INTERVAL_SECONDS)
+                continue
+            watch.run_id, watch.html_url = run.get("id"), run.get("html_url") or watch.html_url
+            status = run.get("status")
+            if status == "completed":
+                watch.publish("completed", conclusion=run.get("conclusion"), done=True)
+                with _watches_lock:
+                    _stats["completed"] += 1
+                return
+            if status and status != last_status:
+                watch.publish(status)
+                last_status = status
+                interval = config.DEPLOY_WATCH_MIN_INTERVAL_SECONDS
+            else: # Same state as last poll: back off
+                interval = min(interval * config.DEPLOY_WATCH_BACKOFF_FACTOR, config.DEPLOY_WATCH_MAX_INTERVAL_SECONDS)
+        watch.publish("timed_out", message="Deployment was not seen completing in time.", done=True)
+        with _watches_lock:
+            _stats["timed_out"] += 1
+    except Exception as e:
+        logger.error(f"Deploy watch {watch.watch_id} failed: {e}", exc_info=True)
+        watch.publish("error", message=str(e), done=True)
+
+
+def _prune_finished():
+    """Drops finished watches older than DEPLOY_WATCH_RETENTION_SECONDS. Caller holds the lock."""
+    cutoff = time.time() - config.DEPLOY_WATCH_RETENTION_SECONDS
+    for watch_id in [w.watch_id for w in _watches.values() if w.done and w.finished_at < cutoff]:
+        _watches.pop(watch_id)
+
+
+def start_watch(target, workflow_filename, dispatched_at, pat_provider):
+    """
+    Starts tracking a deployment dispatched at 'dispatched_at' (aware datetime).
+    pat_provider() -> (pat, error) is called on every poll so a rotated PAT is picked up.
+    Returns the new DeployWatch.
+    """
+    watch = DeployWatch(target, workflow_filename, dispatched_at)
+    with _watches_lock:
+        _prune_finished()
+        _watches[watch.watch_id] = watch
+        _stats["started"] += 1
+    watch.publish("dispatched")
+    threading.Thread(target=_run_watch, args=(watch, pat_provider), name=f"deploy-watch-{target}", daemon=True).start()
+    return watch
+
+
+def get_watch(watch_id):
+    with _watches_lock:
+        return _watches.get(watch_id)
+
+
+def wait_for_events(watch_id, after_seq=0, wait_seconds=0):
+    """
+    Long-poll for a watch's events after 'after_seq'.
+
+    Returns:
+        dict or None: {"events", "done", "watch"} or None if the watch is unknown on this instance.
+    """
+    watch = get_watch(watch_id)
+    if watch is None:
+        return None
+    events, done = watch.wait(max(0, after_seq), wait_seconds)
+    return {"events": events, "done": done, "watch": watch.snapshot()}
+
+
+def get_stats():
+    with _watches_lock:
+        stats = dict(_stats)
+        stats["active"] = sum(1 for w in _watches.values() if not w.done)
+    return stats
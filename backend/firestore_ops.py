@@ -1,13 +1,61 @@
 # backend/firestore_ops.py
 import logging
-from datetime import datetime, timezone
-import google.cloud.firestore
-from google.api_core.exceptions import NotFound
+import atexit
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from datetime import datetime, timezone, timedelta
 import config
+import tracing
 
 logger = logging.getLogger(__name__)
 firestore_db = None # Initialize as None
 
+def _firestore():
+    """google.cloud.firestore, imported on first use (it pulls in grpc and the protobuf stubs)."""
+    import google.cloud.firestore
+    return google.cloud.firestore
+
+# --- Write-behind history buffer ---
+# Messages are queued here and written in one batch at request end, when the
+# buffer reaches HISTORY_FLUSH_MAX_MESSAGES, or by the background flusher.
+_history_lock = threading.Lock()
+_pending_messages = [] # List of (conversation_id, doc_id, message_dict, enqueued_monotonic), oldest first
+_last_timestamp = None # Last timestamp handed out, keeps buffered messages strictly ordered
+_flusher_thread = None
+_flusher_wakeup = threading.Event()
+_history_write_stats = {
+    "messages_enqueued": 0,
+    "messages_written": 0,
+    "batch_commits": 0,
+    "round_trips_saved": 0, # Single-message writes avoided by batching
+    "failed_flushes": 0,
+    "full_buffer_waits": 0, # Writers held back because the buffer was full
+}
+
+# --- History window cache ---
+# Per conversation: the newest HISTORY_CACHE_SIZE messages (stored + buffered), kept
+# current by write-through from add_to_conversation_history. The conversation
+# document's update_time acts as the version: our own batch commits carry a
+# precondition on the version we last saw, so a write by another instance is
+# detected either at commit time (precondition fails) or by the periodic version check.
+class _ConversationCache:
+    """Window cache state for one conversation document."""
+    __slots__ = ("entries", "valid", "stale", "complete", "version", "checked_at")
+
+    def __init__(self):
+        self.entries = deque(maxlen=config.HISTORY_CACHE_SIZE) # (doc_id, message_dict), oldest first
+        self.valid = False    # Loaded at least once and not invalidated
+        self.stale = False    # Another writer may have added messages; reload before serving
+        self.complete = False # Cache holds the whole conversation (no older messages exist)
+        self.version = None   # Conversation doc update_time matching the cache contents
+        self.checked_at = 0.0 # Monotonic time of the last validation
+
+_history_caches = OrderedDict() # conversation_id -> _ConversationCache, least recently used first
+_history_cache_stats = {"hits": 0, "reloads": 0, "version_checks": 0, "external_writes_detected": 0, "evictions": 0}
+
 def _get_db():
     """Initializes Firestore client if needed."""
     global firestore_db
@@ -16,7 +64,7 @@ def _get_db():
         try:
             # Project ID should be inferred from the environment when running on GCP
             # Passing the project ID explicitly can sometimes help in local/non-standard environments
-            firestore_db = google.cloud.firestore.Client(project=config.GCP_PROJECT_ID)
+            firestore_db = _firestore().Client(project=config.GCP_PROJECT_ID)
             logger.info("Firestore client initialized.")
         except Exception as e:
             logger.error(f"Failed to initialize Firestore client: {e}", exc_info=True)
@@ -25,90 +73,663 @@ def _get_db():
     # Return the current state of the client (either the client object or None)
     return firestore_db
 
-def get_conversation_history(limit=config.HISTORY_LIMIT):
-    """Fetches the last 'limit' messages from Firestore."""
+def session_conversation_id(session_id):
+    """
+    Returns the conversation document ID for a client session. Each session writes
+    to its own document, so concurrent sessions do not contend on one document.
+    Without a session the shared default conversation is used.
+    """
+    if not session_id:
+        return config.CONVERSATION_DOC_ID
+    return f"{config.CONVERSATION_DOC_ID}__{session_id}"
+
+def _conversation_ref(db, conversation_id=None):
+    """Returns the conversation document reference (parent of the messages subcollection)."""
+    return db.collection(config.FIRESTORE_COLLECTION).document(conversation_id or config.CONVERSATION_DOC_ID)
+
+def _messages_ref(db, conversation_id=None):
+    """Returns the messages subcollection; one document per message, indexed on 'timestamp'."""
+    return _conversation_ref(db, conversation_id).collection(config.FIRESTORE_MESSAGES_SUBCOLLECTION)
+
+def _cache_for(conversation_id):
+    """Returns the window cache for a conversation, evicting the least recently used. Caller must hold _history_lock."""
+    cache = _history_caches.get(conversation_id)
+    if cache is None:
+        cache = _history_caches[conversation_id] = _ConversationCache()
+        while len(_history_caches) > config.HISTORY_CACHE_MAX_CONVERSATIONS:
+            _history_caches.popitem(last=False)
+            _history_cache_stats["evictions"] += 1
+    else:
+        _history_caches.move_to_end(conversation_id)
+    return cache
+
+def _normalize_timestamp(ts):
+    """Returns a timezone-aware datetime for a stored timestamp (datetime or legacy string)."""
+    # Handle both datetime objects and potential string representations if legacy data exists
+    if isinstance(ts, datetime):
+        # Ensure timezone-aware for proper comparison (assume UTC if naive)
+        return ts.replace(tzinfo=ts.tzinfo or timezone.utc)
+    elif isinstance(ts, str):
+        try:
+             # Attempt to parse common formats, ensuring timezone awareness
+             dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+             return dt.replace(tzinfo=dt.tzinfo or timezone.utc) # Ensure UTC
+        except ValueError:
+             # Fallback for unparseable strings
+             return datetime.min.replace(tzinfo=timezone.utc)
+    # Fallback for missing/invalid timestamp
+    return datetime.min.replace(tzinfo=timezone.utc)
+
+class CompressedMessage:
+    """
+    A zlib-compressed history message body, decompressed only when str() is called
+    (e.g. when the message actually enters the LLM prompt or the UI).
+    len() returns the original character count without decompressing.
+    Bodies too large for one document are loaded from their chunk documents on first use.
+    """
+    __slots__ = ("length", "_data", "_chunk_loader")
+
+    def __init__(self, length, data=None, chunk_loader=None):
+        self.length = length
+        self._data = data
+        self._chunk_loader = chunk_loader
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(len(text), data=zlib.compress(text.encode("utf-8"), config.HISTORY_COMPRESSION_LEVEL))
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = b"".join(self._chunk_loader())
+        return self._data
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return zlib.decompress(self.data).decode("utf-8")
+
+    def __repr__(self):
+        return f"CompressedMessage(length={self.length})"
+
+def _encode_message_body(text):
+    """Returns the text as-is, or a CompressedMessage when that saves space above the threshold."""
+    if len(text) < config.HISTORY_COMPRESS_THRESHOLD_CHARS:
+        return text
+    encoded_size = len(text.encode("utf-8"))
+    compressed = CompressedMessage.from_text(text)
+    # Incompressible payloads stay plain text unless they are too big for one document
+    if len(compressed.data) < encoded_size or encoded_size > config.HISTORY_INLINE_MAX_BYTES:
+        return compressed
+    return text
+
+def _to_stored_document(message_ref, msg):
+    """
+    Converts an in-memory message into its Firestore representation.
+
+    Returns:
+        tuple: (message document dict, list of (chunk doc ref, chunk dict) to write first)
+    """
+    body = msg.get("message", "")
+    if not isinstance(body, CompressedMessage):
+        return msg, []
+    stored = {"sender": msg.get("sender"), "timestamp": msg.get("timestamp"), "encoding": "zlib", "length": body.length}
+    data = body.data
+    if len(data) <= config.HISTORY_INLINE_MAX_BYTES:
+        stored["message_z"] = data
+        return stored, []
+    # Spill oversized payloads into chunk documents under the message document
+    chunk_size = config.HISTORY_CHUNK_BYTES
+    chunk_writes = [
+        (message_ref.collection("chunks").document(f"{i:05d}"), {"data": data[offset:offset + chunk_size]})
+        for i, offset in enumerate(range(0, len(data), chunk_size))
+    ]
+    stored["chunk_count"] = len(chunk_writes)
+    return stored, chunk_writes
+
+def _from_stored_document(message_ref, stored):
+    """Converts a stored message document back into an in-memory message (body left compressed)."""
+    if stored.get("encoding") != "zlib":
+        return stored
+    if "message_z" in stored:
+        body = CompressedMessage(stored.get("length", 0), data=stored["message_z"])
+    else:
+        def load_chunks():
+            chunk_docs = message_ref.collection("chunks").stream() # Returned in document ID order
+            return [doc.to_dict().get("data", b"") for doc in chunk_docs]
+        body = CompressedMessage(stored.get("length", 0), chunk_loader=load_chunks)
+    return {"sender": stored.get("sender"), "message": body, "timestamp": stored.get("timestamp"),
+            "conversation_id": stored.get("conversation_id")}
+
+def get_conversation_page(limit=config.HISTORY_LIMIT, before=None, conversation_id=None):
+    """
+    Fetches one page of messages, newest page first, using an indexed query on the
+    messages subcollection (order_by timestamp + limit) instead of reading everything.
+
+    Args:
+        limit (int): Maximum number of messages in the page.
+        before (str): Opaque cursor (a message document ID) returned by a previous
+                      call; the page then holds the messages older than it.
+        conversation_id (str): Conversation document ID (default: the shared conversation).
+
+    Returns:
+        tuple: (list of messages oldest-first, cursor for the next older page or None)
+    """
     db = _get_db()
     # Check if db client is available (not None)
     if not db:
         logger.error("Firestore client not available, cannot fetch history.")
-        return []
+        return [], None
+    conversation_id = conversation_id or config.CONVERSATION_DOC_ID
     try:
-        doc_ref = db.collection(config.FIRESTORE_COLLECTION).document(config.CONVERSATION_DOC_ID)
-        doc = doc_ref.get()
-        if doc.exists:
-            all_messages = doc.to_dict().get("messages", [])
-            # Sort by timestamp (most recent first), limit, then reverse
-            def get_timestamp(msg):
-                ts = msg.get('timestamp')
-                # Handle both datetime objects and potential string representations if legacy data exists
-                if isinstance(ts, datetime):
-                    # Ensure timezone-aware for proper comparison (assume UTC if naive)
-                    return ts.replace(tzinfo=ts.tzinfo or timezone.utc)
-                elif isinstance(ts, str):
-                    try:
-                         # Attempt to parse common formats, ensuring timezone awareness
-                         dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                         return dt.replace(tzinfo=dt.tzinfo or timezone.utc) # Ensure UTC
-                    except ValueError:
-                         # Fallback for unparseable strings
-                         return datetime.min.replace(tzinfo=timezone.utc)
-                # Fallback for missing/invalid timestamp
-                return datetime.min.replace(tzinfo=timezone.utc)
-
-            sorted_messages = sorted(all_messages, key=get_timestamp, reverse=True)
-            limited_messages = sorted_messages[:limit]
-            history = limited_messages[::-1] # Oldest first for LLM context
-            logger.info(f"Fetched {len(history)} messages from Firestore history.")
-            return history
-        else:
-            logger.info(f"Conversation document '{config.CONVERSATION_DOC_ID}' does not exist.")
-            return []
+        messages_ref = _messages_ref(db, conversation_id)
+        if not before:
+            # Buffered messages are newer than anything stored; make sure they never
+            # fill the whole page so the page's oldest entry is always a stored doc
+            with _history_lock:
+                pending_count = sum(1 for entry in _pending_messages if entry[0] == conversation_id)
+            if pending_count >= limit:
+                flush_conversation_history()
+            cached_page = _get_cached_page(db, limit, conversation_id)
+            if cached_page is not None:
+                return cached_page
+
+        query = messages_ref.order_by("timestamp", direction=_firestore().Query.DESCENDING)
+        if before:
+            cursor_snapshot = messages_ref.document(before).get()
+            if not cursor_snapshot.exists:
+                logger.warning(f"History cursor '{before}' not found; returning an empty page.")
+                return [], None
+            query = query.start_after(cursor_snapshot)
+        with tracing.span("firestore.history_query", limit=limit):
+            docs = list(query.limit(limit).stream())
+
+        entries = [(doc.id, _from_stored_document(doc.reference, doc.to_dict())) for doc in reversed(docs)] # Oldest first for LLM context
+        has_more = len(docs) == limit
+        if not before:
+            # Read-your-writes: include messages still waiting in the write buffer
+            with _history_lock:
+                pending = [(doc_id, msg) for conv_id, doc_id, msg, _ in _pending_messages if conv_id == conversation_id]
+            if pending:
+                stored_ids = {doc_id for doc_id, _ in entries}
+                entries += [e for e in pending if e[0] not in stored_ids]
+                entries.sort(key=lambda e: _normalize_timestamp(e[1].get('timestamp')))
+                has_more = has_more or len(entries) > limit
+                entries = entries[-limit:]
+
+        history = [msg for _, msg in entries]
+        next_cursor = entries[0][0] if has_more and entries else None
+        logger.info(f"Fetched {len(history)} messages from Firestore history.")
+        return history, next_cursor
     except Exception as e:
         logger.error(f"Error getting conversation history: {e}", exc_info=True)
-        return []
+        return [], None
+
+def _get_cached_page(db, limit, conversation_id):
+    """
+    Serves the newest page from the conversation's window cache, reloading the cache
+    first if it was never loaded, another writer was detected, or the version check
+    (done at most once per HISTORY_CACHE_TTL_SECONDS) shows the conversation changed.
 
-def add_to_conversation_history(sender, message):
-    """Adds a message to the Firestore history."""
+    Returns:
+        tuple or None: (messages oldest-first, next cursor), or None if the cache cannot serve.
+    """
+    if not config.HISTORY_CACHE_ENABLED or limit > config.HISTORY_CACHE_SIZE:
+        return None
+    with _history_lock:
+        cache = _cache_for(conversation_id)
+        needs_reload = not cache.valid or cache.stale
+        needs_check = (time.monotonic() - cache.checked_at) >= config.HISTORY_CACHE_TTL_SECONDS
+        known_version = cache.version
+
+    if not needs_reload and needs_check:
+        with tracing.span("firestore.history_version_check"):
+            conv_snapshot = _conversation_ref(db, conversation_id).get(field_paths=["message_count"])
+        with _history_lock:
+            _history_cache_stats["version_checks"] += 1
+            if conv_snapshot.update_time != known_version:
+                _history_cache_stats["external_writes_detected"] += 1
+                needs_reload = True
+            else:
+                cache.checked_at = time.monotonic()
+    if needs_reload:
+        _reload_history_cache(db, conversation_id, cache)
+
+    with _history_lock:
+        if not cache.valid:
+            return None
+        entries = list(cache.entries)[-limit:]
+        has_more = len(cache.entries) > limit or not cache.complete
+        _history_cache_stats["hits"] += 1
+    history = [msg for _, msg in entries]
+    next_cursor = entries[0][0] if has_more and entries else None
+    logger.info(f"Served {len(history)} history messages from the in-process cache.")
+    return history, next_cursor
+
+@tracing.traced("firestore.history_reload")
+def _reload_history_cache(db, conversation_id, cache):
+    """Reloads a conversation's window cache from Firestore (plus still-buffered messages)."""
+    # Read the version first: a write landing in between makes the next check reload again
+    conv_snapshot = _conversation_ref(db, conversation_id).get(field_paths=["message_count"])
+    docs = list(_messages_ref(db, conversation_id).order_by("timestamp", direction=_firestore().Query.DESCENDING)
+                .limit(config.HISTORY_CACHE_SIZE).stream())
+    entries = [(doc.id, _from_stored_document(doc.reference, doc.to_dict())) for doc in reversed(docs)]
+    with _history_lock:
+        stored_ids = {doc_id for doc_id, _ in entries}
+        entries += [(doc_id, msg) for conv_id, doc_id, msg, _ in _pending_messages
+                    if conv_id == conversation_id and doc_id not in stored_ids]
+        entries.sort(key=lambda e: _normalize_timestamp(e[1].get('timestamp')))
+        cache.complete = len(docs) < config.HISTORY_CACHE_SIZE and len(entries) <= config.HISTORY_CACHE_SIZE
+        cache.entries.clear()
+        cache.entries.extend(entries)
+        cache.version = conv_snapshot.update_time if conv_snapshot.exists else None
+        cache.valid = True
+        cache.stale = False
+        cache.checked_at = time.monotonic()
+        _history_cache_stats["reloads"] += 1
+    logger.info(f"Reloaded history cache for '{conversation_id}' with {len(entries)} messages.")
+
+def get_history_cache_stats():
+    """Returns hit/reload counters for the history window caches."""
+    with _history_lock:
+        stats = dict(_history_cache_stats)
+        stats.update({
+            "conversations": len(_history_caches),
+            "size": sum(len(cache.entries) for cache in _history_caches.values()),
+            "stale": sum(1 for cache in _history_caches.values() if cache.stale),
+        })
+    return stats
+
+def get_conversation_history(limit=config.HISTORY_LIMIT, conversation_id=None):
+    """Fetches the last 'limit' messages from Firestore."""
+    history, _ = get_conversation_page(limit, conversation_id=conversation_id)
+    return history
+
+def get_audit_page(limit=config.HISTORY_LIMIT):
+    """
+    Global audit view across all conversations: the newest 'limit' messages from every
+    messages subcollection (collection group query, needs the collection-group
+    'timestamp' index). Only stored messages are included.
+
+    Returns:
+        list: Messages oldest-first, each carrying its 'conversation_id'.
+    """
     db = _get_db()
-    # Check if db client is available (not None)
     if not db:
-        logger.error("Firestore client not available, cannot add message to history.")
+        logger.error("Firestore client not available, cannot fetch audit history.")
+        return []
+    try:
+        query = (db.collection_group(config.FIRESTORE_MESSAGES_SUBCOLLECTION)
+                 .order_by("timestamp", direction=_firestore().Query.DESCENDING).limit(limit))
+        with tracing.span("firestore.audit_query", limit=limit):
+            docs = list(query.stream())
+        return [_from_stored_document(doc.reference, doc.to_dict()) for doc in reversed(docs)]
+    except Exception as e:
+        logger.error(f"Error getting audit history: {e}", exc_info=True)
+        return []
+
+def _next_timestamp():
+    """Returns a strictly increasing UTC timestamp. Caller must hold _history_lock."""
+    global _last_timestamp
+    now = datetime.now(timezone.utc)
+    if _last_timestamp is not None and now <= _last_timestamp:
+        now = _last_timestamp + timedelta(microseconds=1)
+    _last_timestamp = now
+    return now
+
+def _cache_write_through(conversation_id, doc_id, message):
+    """Appends a new message to the conversation's window cache. Caller must hold _history_lock."""
+    cache = _history_caches.get(conversation_id)
+    if cache is None or not cache.valid:
         return
+    if len(cache.entries) == cache.entries.maxlen:
+        cache.complete = False # Oldest cached message is about to be evicted
+    cache.entries.append((doc_id, message))
+
+def add_to_conversation_history(sender, message, conversation_id=None):
+    """
+    Queues a message for the Firestore history (write-behind) of the given
+    conversation (default: the shared conversation).
+    The message is persisted by the next flush: at request end, once the buffer
+    holds HISTORY_FLUSH_MAX_MESSAGES, or by the background flusher.
+    """
     try:
-        doc_ref = db.collection(config.FIRESTORE_COLLECTION).document(config.CONVERSATION_DOC_ID)
-        timestamp = datetime.now(timezone.utc) # Use timezone-aware UTC timestamp
-
-        # Truncate potentially very long messages before storing
-        # Firestore has document size limits (~1MB)
-        MAX_MSG_LENGTH = 15000 # Adjust as needed, consider average message size and history length
-        truncated_message = message
-        if isinstance(message, str) and len(message) > MAX_MSG_LENGTH:
-            truncated_message = message[:MAX_MSG_LENGTH] + "...[truncated]"
-            logger.warning(f"Message from {sender} truncated to {MAX_MSG_LENGTH} chars for history.")
-        elif not isinstance(message, str):
+        if not isinstance(message, str):
              # Convert non-strings, but log a warning
              logger.warning(f"Non-string message from {sender} being converted to string for history: {type(message)}")
-             truncated_message = str(message) # Simple conversion
-             if len(truncated_message) > MAX_MSG_LENGTH:
-                  truncated_message = truncated_message[:MAX_MSG_LENGTH] + "...[truncated]"
+             message = str(message) # Simple conversion
+        # Large bodies (log dumps, modification results) are compressed instead of truncated
+        body = _encode_message_body(message)
+        if isinstance(body, CompressedMessage):
+            logger.info(f"Compressed message from {sender}: {len(message)} chars -> {len(body.data)} bytes.")
+
+        with _history_lock:
+            # Doc ID is fixed at enqueue time so a retried flush overwrites instead of duplicating
+            new_message = {"sender": sender, "message": body, "timestamp": _next_timestamp()}
+            doc_id = uuid.uuid4().hex
+            conversation_id = conversation_id or config.CONVERSATION_DOC_ID
+            _pending_messages.append((conversation_id, doc_id, new_message, time.monotonic()))
+            _history_write_stats["messages_enqueued"] += 1
+            _cache_write_through(conversation_id, doc_id, new_message)
+            pending_count = len(_pending_messages)
+        logger.debug(f"Queued message from {sender} for Firestore ({pending_count} pending).")
+
+        if pending_count > config.HISTORY_BUFFER_MAX_PENDING:
+            _flush_full_buffer()
+        elif not config.HISTORY_WRITE_BUFFER_ENABLED or pending_count >= config.HISTORY_FLUSH_MAX_MESSAGES:
+            flush_conversation_history()
+        else:
+            _ensure_flusher_started()
+
+    except Exception as e:
+        # Catch errors preparing the message itself
+        logger.error(f"Error preparing message for Firestore history: {e}", exc_info=True)
 
+def flush_conversation_history():
+    """
+    Writes all buffered messages in batched commits (one round-trip per conversation
+    per 500 messages; conversations are independent documents).
+    Failed batches are put back at the front of the buffer and retried on the next
+    flush (at-least-once; fixed doc IDs make retries idempotent).
 
-        new_message = {"sender": sender, "message": truncated_message, "timestamp": timestamp}
+    Returns:
+        int: Number of messages written.
+    """
+    with _history_lock:
+        if not _pending_messages:
+            return 0
+        to_write = list(_pending_messages)
+        _pending_messages.clear()
+
+    db = _get_db()
+    if not db:
+        logger.error("Firestore client not available, keeping history messages buffered.")
+        _requeue_messages(to_write)
+        return 0
 
-        # Use FieldValue.array_union to atomically add the message
-        # This requires the document to exist. Handle NotFound.
+    written = 0
+    by_conversation = OrderedDict()
+    for entry in to_write:
+        by_conversation.setdefault(entry[0], []).append(entry)
+    groups = [(conversation_id, group) for conversation_id, entries in by_conversation.items()
+              for group in _group_for_batches(_messages_ref(db, conversation_id), entries)]
+    for index, (conversation_id, group) in enumerate(groups):
         try:
-            doc_ref.update({"messages": google.cloud.firestore.FieldValue.array_union([new_message])})
-            logger.info(f"Appended message from {sender} to Firestore.")
-        except NotFound:
-            # Document doesn't exist, create it with the first message
-            logger.info(f"Creating conversation document '{config.CONVERSATION_DOC_ID}' with first message.")
-            doc_ref.set({"messages": [new_message]})
-        except Exception as update_err:
-             # Catch potential errors during update (e.g., document size limit exceeded)
-             logger.error(f"Error updating conversation document: {update_err}", exc_info=True)
-             # Potentially add a fallback or retry mechanism if needed
+            _commit_history_batch(db, conversation_id, group)
+            written += len(group)
+            with _history_lock:
+                _history_write_stats["messages_written"] += len(group)
+                _history_write_stats["batch_commits"] += 1
+                _history_write_stats["round_trips_saved"] += len(group) - 1
+        except Exception as e:
+            unsaved = [item[0] for _, remaining in groups[index:] for item in remaining]
+            logger.error(f"Error committing history batch ({len(unsaved)} messages re-queued): {e}", exc_info=True)
+            with _history_lock:
+                _history_write_stats["failed_flushes"] += 1
+            _requeue_messages(unsaved)
+            break
+
+    if written:
+        logger.info(f"Flushed {written} history messages to Firestore.")
+    return written
+
+def _flush_full_buffer():
+    """
+    Backpressure for a buffer over HISTORY_BUFFER_MAX_PENDING (i.e. flushes keep failing):
+    the writer retries the flush synchronously, backing off, for up to
+    HISTORY_BUFFER_FULL_WAIT_SECONDS. Messages are never dropped; if Firestore is still
+    failing after that they stay buffered beyond the limit until a flush succeeds.
+    """
+    with _history_lock:
+        _history_write_stats["full_buffer_waits"] += 1
+    deadline = time.monotonic() + config.HISTORY_BUFFER_FULL_WAIT_SECONDS
+    delay = 0.1
+    while True:
+        flush_conversation_history()
+        with _history_lock:
+            pending_count = len(_pending_messages)
+        remaining = deadline - time.monotonic()
+        if pending_count <= config.HISTORY_BUFFER_MAX_PENDING or remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay *= 2
+    if pending_count > config.HISTORY_BUFFER_MAX_PENDING:
+        logger.error(f"History buffer full and Firestore writes still failing; keeping {pending_count} unsaved messages buffered.")
+
+# Firestore allows 500 writes per batch (one is the conversation version marker)
+# and ~10MiB per request; stay well under both.
+_MAX_BATCH_WRITES = 499
+_MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+def _stored_size(stored, chunk_writes):
+    """Rough byte size of a message's writes, used to keep batches under the request limit."""
+    body = stored.get("message_z") or stored.get("message") or ""
+    return len(body) + sum(len(data["data"]) for _, data in chunk_writes) + 256
+
+def _group_for_batches(messages_ref, to_write):
+    """
+    Splits buffered entries into batch-sized groups.
+
+    Returns:
+        list: Groups of (pending entry, stored document dict, chunk writes).
+    """
+    groups, current, ops, size = [], [], 0, 0
+    for entry in to_write:
+        conversation_id, doc_id, msg, _ = entry
+        stored, chunk_writes = _to_stored_document(messages_ref.document(doc_id), msg)
+        # Lets a collection group query over all conversations serve as the audit view
+        stored = dict(stored, conversation_id=conversation_id)
+        entry_ops, entry_size = 1 + len(chunk_writes), _stored_size(stored, chunk_writes)
+        if current and (ops + entry_ops > _MAX_BATCH_WRITES or size + entry_size > _MAX_BATCH_BYTES):
+            groups.append(current); current, ops, size = [], 0, 0
+        current.append((entry, stored, chunk_writes))
+        ops += entry_ops; size += entry_size
+    if current:
+        groups.append(current)
+    return groups
+
+def _commit_chunk_writes(db, chunk_writes):
+    """Writes spilled chunk documents ahead of their message docs, in size-bounded batches."""
+    batch, ops, size = db.batch(), 0, 0
+    for ref, data in chunk_writes:
+        if ops and (ops >= _MAX_BATCH_WRITES or size + len(data["data"]) > _MAX_BATCH_BYTES):
+            batch.commit(); batch, ops, size = db.batch(), 0, 0
+        batch.set(ref, data); ops += 1; size += len(data["data"])
+    if ops:
+        batch.commit()
+
+@tracing.traced("firestore.history_commit")
+def _commit_history_batch(db, conversation_id, group):
+    """
+    Commits one batch of messages together with a bump of the conversation document,
+    whose update_time versions the history cache. When the cache is in sync, the bump
+    is conditional on the version we know; if that precondition fails another instance
+    wrote in the meantime, so the batch is re-sent unconditionally and the cache is
+    marked stale.
+    """
+    from google.api_core.exceptions import NotFound, FailedPrecondition
+    conv_ref = _conversation_ref(db, conversation_id)
+    messages_ref = _messages_ref(db, conversation_id)
+    marker = {"message_count": _firestore().Increment(len(group)),
+              "updated_at": _firestore().SERVER_TIMESTAMP}
+    with _history_lock:
+        cache = _history_caches.get(conversation_id)
+        expected_version = cache.version if (cache is not None and cache.valid and not cache.stale) else None
+
+    # Chunks go in the same batch when they fit; otherwise they are committed first,
+    # so a message document never references chunks that do not exist yet
+    chunk_writes = [write for _, _, writes in group for write in writes]
+    group_size = sum(_stored_size(stored, writes) for _, stored, writes in group)
+    if chunk_writes and (len(group) + len(chunk_writes) > _MAX_BATCH_WRITES or group_size > _MAX_BATCH_BYTES):
+        _commit_chunk_writes(db, chunk_writes)
+        chunk_writes = []
+
+    def build_batch(precondition):
+        batch = db.batch()
+        for ref, data in chunk_writes:
+            batch.set(ref, data)
+        for (_, doc_id, _, _), stored, _ in group:
+            batch.set(messages_ref.document(doc_id), stored)
+        if precondition is not None:
+            batch.update(conv_ref, marker, option=db.write_option(last_update_time=precondition))
+        else:
+            batch.set(conv_ref, marker, merge=True)
+        return batch
+
+    cache_in_sync = expected_version is not None
+    try:
+        results = build_batch(expected_version).commit()
+    except (FailedPrecondition, NotFound):
+        if expected_version is None:
+            raise
+        logger.info("Conversation changed since the history cache was validated; marking cache stale.")
+        results = build_batch(None).commit()
+        cache_in_sync = False
+        with _history_lock:
+            _history_cache_stats["external_writes_detected"] += 1
+
+    if cache is None:
+        return
+    with _history_lock:
+        cache.version = results[-1].update_time if results else cache.version
+        if not cache_in_sync:
+            cache.stale = True
+
+def _requeue_messages(entries):
+    """Puts unsaved entries back at the front of the buffer, preserving order."""
+    with _history_lock:
+        _pending_messages[:0] = entries
+
+def _ensure_flusher_started():
+    """Starts the background thread that flushes messages older than the flush interval."""
+    global _flusher_thread
+    with _history_lock:
+        if _flusher_thread is not None and _flusher_thread.is_alive():
+            return
+        _flusher_thread = threading.Thread(target=_flusher_loop, name="history-flusher", daemon=True)
+        _flusher_thread.start()
+
+def _flusher_loop():
+    interval = config.HISTORY_FLUSH_INTERVAL_SECONDS
+    while True:
+        _flusher_wakeup.wait(interval)
+        _flusher_wakeup.clear()
+        with _history_lock:
+            oldest_age = time.monotonic() - _pending_messages[0][3] if _pending_messages else 0
+        if oldest_age >= interval:
+            try:
+                flush_conversation_history()
+            except Exception as e:
+                logger.error(f"Background history flush failed: {e}", exc_info=True)
 
+def get_history_write_stats():
+    """Returns counters for buffered history writes (incl. round-trips saved by batching)."""
+    with _history_lock:
+        stats = dict(_history_write_stats)
+        stats["pending"] = len(_pending_messages)
+    return stats
+
+# Flush whatever is still buffered when the instance shuts down
+atexit.register(flush_conversation_history)
+
+# --- Job state documents (see jobs.py) ---
+def save_job(job):
+    """
+    Writes a job's state (jobs.Job.to_dict()) as one document in FIRESTORE_JOBS_COLLECTION.
+
+    Returns:
+        str or None: Error message on failure.
+    """
+    db = _get_db()
+    if not db:
+        return "Firestore client not available."
+    try:
+        with tracing.span("firestore.job_write"):
+            db.collection(config.FIRESTORE_JOBS_COLLECTION).document(job["job_id"]).set(job)
+        return None
     except Exception as e:
-        # Catch errors preparing the message itself
-        logger.error(f"Error preparing message for Firestore history: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Error saving job {job.get('job_id')}: {e}", exc_info=True)
+        return f"Error saving job state: {e}"
+
+def get_job(job_id):
+    """
+    Reads a job's last persisted state.
+
+    Returns:
+        tuple: (job dict or None if it does not exist, error message or None)
+    """
+    db = _get_db()
+    if not db:
+        return None, "Firestore client not available."
+    try:
+        with tracing.span("firestore.job_read"):
+            doc = db.collection(config.FIRESTORE_JOBS_COLLECTION).document(job_id).get()
+        return (doc.to_dict() if doc.exists else None), None
+    except Exception as e:
+        logger.error(f"Error reading job {job_id}: {e}", exc_info=True)
+        return None, f"Error reading job state: {e}"
+
+def migrate_legacy_conversation(delete_legacy_field=False, dry_run=False, batch_size=400):
+    """
+    One-shot migration of the legacy 'messages' array on the conversation document
+    into the messages subcollection.
+
+    Document IDs are derived from the message's position in timestamp order
+    ('legacy-000042'), so re-running the migration overwrites instead of duplicating.
+
+    Args:
+        delete_legacy_field (bool): Remove the 'messages' array once copied.
+        dry_run (bool): Only count what would be migrated.
+        batch_size (int): Writes per batch (Firestore allows at most 500).
+
+    Returns:
+        tuple: (number of messages migrated, error message string or None)
+    """
+    from google.api_core.exceptions import NotFound
+    db = _get_db()
+    if not db:
+        return 0, "Firestore client not available."
+    try:
+        doc_ref = _conversation_ref(db)
+        doc = doc_ref.get()
+        if not doc.exists:
+            logger.info(f"Conversation document '{config.CONVERSATION_DOC_ID}' does not exist. Nothing to migrate.")
+            return 0, None
+        legacy_messages = doc.to_dict().get("messages", [])
+        if not legacy_messages:
+            logger.info("No legacy messages array found. Nothing to migrate.")
+            return 0, None
+
+        ordered = sorted(legacy_messages, key=lambda m: _normalize_timestamp(m.get('timestamp')))
+        logger.info(f"Migrating {len(ordered)} legacy messages to subcollection '{config.FIRESTORE_MESSAGES_SUBCOLLECTION}' (dry_run={dry_run}).")
+        if dry_run:
+            return len(ordered), None
+
+        messages_ref = _messages_ref(db)
+        batch = db.batch(); pending = 0
+        for index, msg in enumerate(ordered):
+            migrated = {
+                "sender": msg.get("sender", "Unknown"),
+                "message": msg.get("message", ""),
+                # Legacy string timestamps become real timestamps so they sort with new messages
+                "timestamp": _normalize_timestamp(msg.get("timestamp")),
+                "conversation_id": config.CONVERSATION_DOC_ID,
+            }
+            batch.set(messages_ref.document(f"legacy-{index:06d}"), migrated)
+            pending += 1
+            if pending >= batch_size:
+                batch.commit(); batch = db.batch(); pending = 0
+        if pending:
+            batch.commit()
+
+        if delete_legacy_field:
+            doc_ref.update({"messages": _firestore().DELETE_FIELD})
+            logger.info("Removed legacy 'messages' array from conversation document.")
+        logger.info(f"Migrated {len(ordered)} legacy messages.")
+        return len(ordered), None
+    except NotFound:
+        return 0, f"Conversation document '{config.CONVERSATION_DOC_ID}' disappeared during migration."
+    except Exception as e:
+        logger.error(f"Error migrating legacy conversation: {e}", exc_info=True)
+        return 0, f"Migration failed: {e}"
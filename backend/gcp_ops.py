@@ -3,21 +3,51 @@ import logging
 import re # Keep re import in case it's needed elsewhere or in future changes
 import os
 import json
-from google.cloud import secretmanager, logging as cloud_logging
-from google.api_core.exceptions import NotFound, PermissionDenied
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone, timedelta
 import config # Use centralized config
+import tracing
+from log_search import SEVERITIES # Cloud Logging severities, lowest first; shared with the log search filters
+
+# The google.cloud client libraries (and grpc under them) are imported on first use:
+# they dominate cold-start import time and most requests need at most one of them.
 
 logger = logging.getLogger(__name__)
 
+# Same values as google.cloud.logging.DESCENDING / ASCENDING
+_LOG_ORDER_DESCENDING = "timestamp desc"
+_LOG_ORDER_ASCENDING = "timestamp asc"
+_LOG_MAX_PAGE_SIZE = 1000 # entries.list rejects larger pages; max_results pages through the rest
+
 secret_manager_client = None
 logging_client = None
 
-def _init_clients():
-    """Initializes GCP clients if not already initialized."""
+# --- Secret cache ---
+# Secret values are kept for SECRET_CACHE_TTL_SECONDS so requests do not each pay a
+# Secret Manager round-trip. Concurrent misses for the same secret share one fetch.
+_secret_cache_lock = threading.Lock()
+_secret_cache = {}    # (secret_id, version) -> (value, fetched_monotonic)
+_secret_fetches = {}  # (secret_id, version) -> _SecretFetch in progress
+_secret_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "fetch_errors": 0}
+
+class _SecretFetch:
+    """One in-flight Secret Manager fetch; waiters read its result once 'done' is set."""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+def _init_clients(secrets=True, logs=True):
+    """Initializes the requested GCP clients if not already initialized."""
     global secret_manager_client, logging_client
     # Check if initialization is needed (is None)
-    if secret_manager_client is None:
+    if secrets and secret_manager_client is None:
         try:
+            from google.cloud import secretmanager
             secret_manager_client = secretmanager.SecretManagerServiceClient()
             logger.info("Secret Manager client initialized.")
         except Exception as e:
@@ -25,8 +55,9 @@ def _init_clients():
             # Mark as None on failure to allow potential retries if needed
             secret_manager_client = None
     # Check if initialization is needed (is None)
-    if logging_client is None:
+    if logs and logging_client is None:
         try:
+            from google.cloud import logging as cloud_logging
             # Project ID should be picked up automatically from the environment in GCF/Cloud Run
             logging_client = cloud_logging.Client()
             logger.info("Cloud Logging client initialized.")
@@ -36,8 +67,77 @@ def _init_clients():
             logging_client = None
 
 def get_gcp_secret(secret_id, version="latest"):
+    """
+    Retrieves a secret value, served from the in-process cache while younger than
+    SECRET_CACHE_TTL_SECONDS. On a miss only one thread fetches from Secret Manager;
+    concurrent callers for the same secret wait for its result. Errors are not cached.
+    """
+    key = (secret_id, version)
+    with _secret_cache_lock:
+        cached = _secret_cache.get(key)
+        if cached is not None and (time.monotonic() - cached[1]) < config.SECRET_CACHE_TTL_SECONDS:
+            _secret_cache_stats["hits"] += 1
+            return cached[0], None
+        fetch = _secret_fetches.get(key)
+        is_leader = fetch is None
+        if is_leader:
+            fetch = _secret_fetches[key] = _SecretFetch()
+            _secret_cache_stats["misses"] += 1
+        else:
+            _secret_cache_stats["coalesced"] += 1
+
+    if not is_leader:
+        # The client call has its own timeout; this only guards against a stuck leader
+        if not fetch.done.wait(timeout=60):
+            return None, f"Timed out waiting for secret '{secret_id}'."
+        return fetch.value, fetch.error
+
+    try:
+        fetch.value, fetch.error = _fetch_gcp_secret(secret_id, version)
+    except Exception as e: # Never leave waiters hanging
+        fetch.value, fetch.error = None, f"Unexpected error accessing secret '{secret_id}': {e}"
+    finally:
+        with _secret_cache_lock:
+            if fetch.error is None and fetch.value is not None:
+                _secret_cache[key] = (fetch.value, time.monotonic())
+            else:
+                _secret_cache_stats["fetch_errors"] += 1
+            _secret_fetches.pop(key, None)
+        fetch.done.set()
+    return fetch.value, fetch.error
+
+def invalidate_secret(secret_id=None):
+    """Drops cached values for one secret (all versions), or every secret if secret_id is None."""
+    with _secret_cache_lock:
+        keys = [key for key in _secret_cache if secret_id is None or key[0] == secret_id]
+        for key in keys:
+            del _secret_cache[key]
+        _secret_cache_stats["invalidations"] += 1
+    logger.info(f"Invalidated cached secret(s): {secret_id or 'all'} ({len(keys)} entries).")
+
+def invalidate_github_pat():
+    """Forces the next get_cleaned_github_pat() to re-read the PAT (e.g. after a GitHub 401)."""
+    invalidate_secret(config.GCP_GITHUB_PAT_SECRET_NAME)
+
+def prefetch_secrets():
+    """Warms the secret cache in a background thread so the first request skips the fetch."""
+    def _prefetch():
+        _, error = get_cleaned_github_pat()
+        if error:
+            logger.warning(f"Secret prefetch failed (will retry on first use): {error}")
+    threading.Thread(target=_prefetch, name="secret-prefetch", daemon=True).start()
+
+def get_secret_cache_stats():
+    """Returns hit/miss counters for the secret cache."""
+    with _secret_cache_lock:
+        stats = dict(_secret_cache_stats)
+        stats["cached"] = len(_secret_cache)
+    return stats
+
+@tracing.traced("gcp.secret_fetch")
+def _fetch_gcp_secret(secret_id, version="latest"):
     """Retrieves a secret value from GCP Secret Manager."""
-    _init_clients()
+    _init_clients(logs=False)
     # Check if the client failed to initialize (is None)
     if secret_manager_client is None:
         logger.error("Secret Manager client is not available.")
@@ -48,6 +148,7 @@ def get_gcp_secret(secret_id, version="latest"):
 
     secret_name = f"projects/{config.GCP_PROJECT_ID}/secrets/{secret_id}/versions/{version}"
     logger.info(f"Attempting to access secret: {secret_name}")
+    from google.api_core.exceptions import NotFound, PermissionDenied
 
     try:
         response = secret_manager_client.access_secret_version(request={"name": secret_name})
@@ -104,74 +205,112 @@ def get_cleaned_github_pat():
         return None, error_msg
 
 
-def get_gcf_logs(limit=50):
-    """Retrieves the latest logs for the current Cloud Function."""
-    _init_clients()
+def _quote_log_filter_value(value):
+    """Quotes a user-supplied string for use in a Cloud Logging filter expression."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def build_gcf_log_filter(resource_type, label_key, function_name, since_minutes=None,
+                         min_severity="INFO", text=None, exclude=None, since_timestamp=None):
+    """
+    Builds the Cloud Logging filter for this function's logs. All narrowing happens
+    server-side so only the lines we return are read and transferred.
+
+    Args:
+        since_minutes (float): Time window; defaults to LOG_QUERY_DEFAULT_WINDOW_MINUTES.
+        min_severity (str): Lowest severity to include (e.g. 'INFO', 'ERROR').
+        text (str): Only entries whose text or JSON message contains this substring.
+        exclude (list): Substrings whose entries are dropped; defaults to LOG_QUERY_EXCLUDE_PATTERNS.
+        since_timestamp (str): RFC 3339 lower bound (inclusive); overrides since_minutes.
+    """
+    severity = (min_severity or "INFO").upper()
+    if severity not in SEVERITIES:
+        raise ValueError(f"Unknown severity '{min_severity}'. Use one of: {', '.join(SEVERITIES)}")
+    if since_timestamp:
+        since = since_timestamp
+    else:
+        window = since_minutes if since_minutes else config.LOG_QUERY_DEFAULT_WINDOW_MINUTES
+        since = (datetime.now(timezone.utc) - timedelta(minutes=window)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    clauses = [
+        f'resource.type="{resource_type}"',
+        f'resource.labels.{label_key}={_quote_log_filter_value(function_name)}',
+        f'severity>={severity}',
+        f'timestamp>="{since}"',
+    ]
+    if text:
+        quoted = _quote_log_filter_value(text)
+        clauses.append(f'(textPayload:{quoted} OR jsonPayload.message:{quoted})')
+    for pattern in (config.LOG_QUERY_EXCLUDE_PATTERNS if exclude is None else exclude):
+        clauses.append(f'NOT textPayload:{_quote_log_filter_value(pattern)}')
+    return " AND ".join(clauses)
+
+def _function_log_resource():
+    """Returns (resource_type, label_key, function_name) identifying this function's logs."""
+    # Determine resource filter based on environment (prefer K_SERVICE for Gen2/Cloud Run)
+    # Use a default function name if needed, though it might not be accurate
+    default_func_name = 'ecko-http-function' # Fallback if no env var found
+    function_name = os.environ.get('K_SERVICE', os.environ.get('FUNCTION_NAME', default_func_name))
+
+    if os.environ.get('K_SERVICE'): # Gen2 / Cloud Run
+        return "cloud_run_revision", "service_name", function_name
+    # Assume Gen1 or fallback
+    if function_name == default_func_name and not os.environ.get('FUNCTION_NAME'):
+        logger.warning(f"Using default function name '{default_func_name}' for logs as no specific env var was found.")
+    return "cloud_function", "function_name", function_name
+
+def _format_log_entry(entry):
+    """Formats a Cloud Logging entry as a single '[time] [SEVERITY] message' line."""
+    timestamp_str = entry.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC') if entry.timestamp else '?'
+    severity = getattr(entry, 'severity', 'DEFAULT') # Handle entries without severity
+    message = ""
+    payload = entry.payload # Can be dict, string, etc.
+
+    # Handle different payload types
+    if isinstance(payload, dict):
+        # Try common keys, fallback to JSON dump
+        message = payload.get('message', payload.get('textPayload', json.dumps(payload)))
+    elif payload is not None:
+        message = str(payload)
+
+    # Basic cleaning: replace newlines within message for single-line display in monitor
+    # Avoid modifying structured JSON logs too much if that's the format
+    if not isinstance(payload, dict):
+        message = ' '.join(message.splitlines())
+
+    return f"[{timestamp_str}] [{str(severity).upper()}] {message}"
+
+def get_gcf_logs(limit=50, since_minutes=None, min_severity="INFO", text=None, exclude=None):
+    """
+    Retrieves the latest logs for the current Cloud Function, newest 'limit' entries
+    matching the filters (see build_gcf_log_filter), returned oldest first.
+    """
+    _init_clients(secrets=False)
     # Check if the client failed to initialize (is None)
     if logging_client is None:
         logger.error("Cloud Logging client is not available.")
         return ["Error: Cloud Logging client unavailable."], "Logging client error."
+    from google.api_core.exceptions import PermissionDenied
 
     try:
-        # Determine resource filter based on environment (prefer K_SERVICE for Gen2/Cloud Run)
-        # Use a default function name if needed, though it might not be accurate
-        default_func_name = 'ecko-http-function' # Fallback if no env var found
-        function_name = os.environ.get('K_SERVICE', os.environ.get('FUNCTION_NAME', default_func_name))
-
-        if os.environ.get('K_SERVICE'): # Gen2 / Cloud Run
-            resource_type = "cloud_run_revision"
-            label_key = "service_name"
-        else: # Assume Gen1 or fallback
-             resource_type = "cloud_function"
-             label_key = "function_name"
-             if function_name == default_func_name and not os.environ.get('FUNCTION_NAME'):
-                 logger.warning(f"Using default function name '{default_func_name}' for logs as no specific env var was found.")
-
-
-        filter_str = f'resource.type="{resource_type}" AND resource.labels.{label_key}="{function_name}" AND severity >= INFO'
+        resource_type, label_key, function_name = _function_log_resource()
+        try:
+            filter_str = build_gcf_log_filter(resource_type, label_key, function_name, since_minutes=since_minutes,
+                                              min_severity=min_severity, text=text, exclude=exclude)
+        except ValueError as e:
+            return [f"Error: {e}"], str(e)
 
         logger.info(f"Fetching GCF logs with filter: {filter_str} and limit: {limit}")
 
-        # Fetch entries using the client
-        log_entries_iterator = logging_client.list_entries(
-            filter_=filter_str,
-            order_by=cloud_logging.DESCENDING
-            # page_size argument is deprecated for list_entries, use max_results instead if limiting is critical here
-            # For simplicity, fetch default pages and limit in Python after retrieval
-        )
-
-        log_lines = []
-        count = 0
-        # Iterate pages and entries
-        for entry in log_entries_iterator:
-             if count >= limit:
-                 break # Stop once the desired limit is reached
-
-             timestamp_str = entry.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC') if entry.timestamp else '?'
-             severity = getattr(entry, 'severity', 'DEFAULT') # Handle entries without severity
-             message = ""
-             payload = entry.payload # Can be dict, string, etc.
-
-             # Handle different payload types
-             if isinstance(payload, dict):
-                 # Try common keys, fallback to JSON dump
-                 message = payload.get('message', payload.get('textPayload', json.dumps(payload)))
-             elif payload is not None:
-                 message = str(payload)
-
-             # Basic cleaning: replace newlines within message for single-line display in monitor
-             # Avoid modifying structured JSON logs too much if that's the format
-             if not isinstance(payload, dict):
-                 message = ' '.join(message.splitlines())
-
-             # Optional: Filter out noisy infrastructure messages
-             # Convert severity to string for comparison if needed
-             severity_str = str(severity).upper()
-             if severity_str == "DEBUG" and ("Function execution started" in message or "Function execution took" in message):
-                 continue # Skip only noisy DEBUG messages
-
-             log_lines.append(f"[{timestamp_str}] [{severity_str}] {message}")
-             count += 1
+        # Pages of up to 'limit' entries (one page for UI-sized limits): the server stops once it has them
+        with tracing.span("gcp.logs_query", limit=limit) as query_span:
+            log_entries_iterator = logging_client.list_entries(
+                filter_=filter_str,
+                order_by=_LOG_ORDER_DESCENDING,
+                max_results=limit,
+                page_size=min(limit, _LOG_MAX_PAGE_SIZE),
+            )
+
+            log_lines = [_format_log_entry(entry) for entry in log_entries_iterator]
+            query_span.set(entries=len(log_lines))
 
         # Reverse the list to show oldest first in the UI
         log_lines.reverse()
@@ -188,4 +327,120 @@ def get_gcf_logs(limit=50):
     except Exception as e:
         error_msg = f"Error retrieving GCF logs: {e}"
         logger.error(error_msg, exc_info=True)
-        return [f"Error: {error_msg}"], error_msg
\ No newline at end of file
+        return [f"Error: {error_msg}"], error_msg
+
+# --- Log tail ---
+# Recently formatted lines for the default filter, shared by all clients of this
+# instance. Each line has a cursor '<RFC 3339 timestamp>|<insertId>' that orders
+# entries; clients pass back the last cursor they saw and get only newer lines.
+# The buffer is topped up with an incremental query (timestamp >= newest cursor)
+# at most once per LOG_TAIL_REFRESH_SECONDS, whatever the number of clients.
+_log_tail_lock = threading.Lock()
+_log_tail_refreshed = threading.Condition(_log_tail_lock) # Notified after every refresh
+_log_tail = deque(maxlen=config.LOG_TAIL_BUFFER_SIZE) # (cursor_key, line), oldest first
+_log_tail_state = {"refreshed_at": 0.0, "refreshing": False, "complete": False}
+
+def _log_cursor_key(cursor):
+    """Parses a client cursor into a comparable (timestamp, insert_id) tuple."""
+    timestamp, _, insert_id = cursor.partition("|")
+    return (timestamp, insert_id)
+
+def _entry_cursor_key(entry):
+    timestamp = entry.timestamp.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ') if entry.timestamp else ""
+    return (timestamp, getattr(entry, 'insert_id', None) or "")
+
+@tracing.traced("gcp.logs_tail_refresh")
+def _refresh_log_tail():
+    """Appends entries newer than the buffer's newest line (or seeds an empty buffer)."""
+    resource_type, label_key, function_name = _function_log_resource()
+    with _log_tail_lock:
+        newest = _log_tail[-1][0] if _log_tail else None
+    if newest is None:
+        # Seed with the newest lines so the first page can be served from the buffer
+        filter_str = build_gcf_log_filter(resource_type, label_key, function_name)
+        entries = list(logging_client.list_entries(filter_=filter_str, order_by=_LOG_ORDER_DESCENDING,
+                                                   max_results=config.LOG_TAIL_SEED_LINES, page_size=config.LOG_TAIL_SEED_LINES))
+        entries.reverse()
+    else:
+        filter_str = build_gcf_log_filter(resource_type, label_key, function_name, since_timestamp=newest[0])
+        entries = list(logging_client.list_entries(filter_=filter_str, order_by=_LOG_ORDER_ASCENDING,
+                                                   max_results=config.LOG_TAIL_FETCH_MAX, page_size=config.LOG_TAIL_FETCH_MAX))
+    new_lines = [(key, _format_log_entry(entry)) for entry in entries
+                 for key in [_entry_cursor_key(entry)] if newest is None or key > newest]
+    with _log_tail_lock:
+        if newest is None:
+            # Fewer entries than asked for means nothing older exists in the window
+            _log_tail_state["complete"] = len(entries) < config.LOG_TAIL_SEED_LINES
+        _log_tail.extend(new_lines)
+    return len(new_lines)
+
+def _maybe_refresh_log_tail():
+    """Refreshes the tail if it is older than LOG_TAIL_REFRESH_SECONDS; one refresh at a time."""
+    with _log_tail_lock:
+        if _log_tail_state["refreshing"] or (time.monotonic() - _log_tail_state["refreshed_at"]) < config.LOG_TAIL_REFRESH_SECONDS:
+            return
+        _log_tail_state["refreshing"] = True
+    try:
+        added = _refresh_log_tail()
+        if added: logger.debug(f"Log tail refreshed with {added} new lines.")
+    finally:
+        with _log_tail_lock:
+            _log_tail_state["refreshing"] = False
+            _log_tail_state["refreshed_at"] = time.monotonic()
+            _log_tail_refreshed.notify_all()
+
+def _read_log_tail(cursor, limit):
+    """Returns (lines, next cursor, reset) from the buffer. Caller must hold _log_tail_lock."""
+    if not _log_tail:
+        return [], cursor, False
+    newest_cursor = "|".join(_log_tail[-1][0])
+    if not cursor:
+        return [line for _, line in list(_log_tail)[-limit:]], newest_cursor, False
+    key = _log_cursor_key(cursor)
+    if key < _log_tail[0][0] and not _log_tail_state["complete"]:
+        # The client fell behind what the buffer holds: hand it the newest page to start over
+        return [line for _, line in list(_log_tail)[-limit:]], newest_cursor, True
+    newer = [(k, line) for k, line in _log_tail if k > key]
+    if not newer:
+        return [], cursor, False
+    page = newer[:limit] # Oldest first, so a capped page can be continued from its last cursor
+    return [line for _, line in page], "|".join(page[-1][0]), False
+
+def tail_gcf_logs(cursor=None, limit=50, wait_seconds=0):
+    """
+    Cursor-based tail of this function's logs (default filter).
+
+    Args:
+        cursor (str): Cursor returned by the previous call; None for the newest 'limit' lines.
+        limit (int): Maximum lines returned.
+        wait_seconds (float): Long-poll: if nothing is newer than the cursor, wait up to this
+                              long for new lines before returning an empty page.
+
+    Returns:
+        tuple: (lines oldest-first, next cursor, reset flag, error message or None).
+               'reset' means the cursor was too old and the lines replace the client's view.
+    """
+    _init_clients(secrets=False)
+    if logging_client is None:
+        logger.error("Cloud Logging client is not available.")
+        return [], cursor, False, "Logging client error."
+    from google.api_core.exceptions import PermissionDenied
+    deadline = time.monotonic() + max(0.0, wait_seconds)
+    try:
+        while True:
+            _maybe_refresh_log_tail()
+            with _log_tail_lock:
+                lines, next_cursor, reset = _read_log_tail(cursor, limit)
+                remaining = deadline - time.monotonic()
+                if lines or reset or remaining <= 0:
+                    return lines, next_cursor, reset, None
+                # Sleep until the next refresh is due (or another waiter refreshed)
+                _log_tail_refreshed.wait(min(remaining, config.LOG_TAIL_REFRESH_SECONDS))
+    except PermissionDenied:
+        error_msg = "Permission denied reading logs. Check Service Account roles (Logs Viewer)."
+        logger.error(error_msg)
+        return [], cursor, False, error_msg
+    except Exception as e:
+        error_msg = f"Error tailing GCF logs: {e}"
+        logger.error(error_msg, exc_info=True)
+        return [], cursor, False, error_msg
@@ -1,14 +1,68 @@
 # backend/git_ops.py
-import git # GitPython library
 import os
 import logging
 import shutil # For robust directory removal
 import tempfile # For creating temporary directories
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path # For easier path manipulation
 import config # Use centralized config
+import tracing
 
 logger = logging.getLogger(__name__)
 
+def _git():
+    """GitPython, imported on first use (importing it probes the git executable)."""
+    import git
+    return git
+
+def __getattr__(name):
+    # Keeps 'git_ops.git' (e.g. git_ops.git.GitCommandError) working without a top-level import
+    if name == "git":
+        return _git()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Per-repository commit serialization ---
+# Clones, file reads and planning run concurrently; applying, committing and pushing
+# to the same repository and branch is serialized per instance, so a modification
+# starts its push from the head the previous one produced instead of racing it.
+_commit_locks = {} # (owner, repo, branch) -> Lock
+_commit_locks_guard = threading.Lock()
+_commit_stats = {"locked_commits": 0, "lock_wait_ms": 0.0, "rebases": 0, "push_retries": 0, "rebase_conflicts": 0}
+
+@contextmanager
+def commit_lock():
+    """Holds the commit/push lock of the configured repository and branch."""
+    key = (config.GITHUB_REPO_OWNER, config.GITHUB_REPO_NAME, config.GITHUB_MAIN_BRANCH)
+    with _commit_locks_guard:
+        lock = _commit_locks.setdefault(key, threading.Lock())
+    started = time.perf_counter()
+    with tracing.span("git.commit_lock_wait"):
+        lock.acquire()
+    try:
+        waited_ms = (time.perf_counter() - started) * 1000
+        with _commit_locks_guard:
+            _commit_stats["locked_commits"] += 1
+            _commit_stats["lock_wait_ms"] += waited_ms
+        if waited_ms > 1000:
+            logger.info(f"Waited {waited_ms:.0f}ms for the commit lock of {key[0]}/{key[1]}@{key[2]}.")
+        yield
+    finally:
+        lock.release()
+
+def record_commit_event(event):
+    """Counts a rebase, push retry or rebase conflict (see get_commit_stats)."""
+    with _commit_locks_guard:
+        _commit_stats[event] += 1
+
+def get_commit_stats():
+    """Returns commit lock and rebase/retry counters."""
+    with _commit_locks_guard:
+        stats = dict(_commit_stats)
+    stats["lock_wait_ms"] = round(stats["lock_wait_ms"], 1)
+    return stats
+
 class GitRepo:
     """
     Context manager for handling a temporary Git repository clone.
@@ -28,9 +82,11 @@ class GitRepo:
         # Create a unique temporary directory path upon instantiation
         self._repo_path_obj = Path(tempfile.mkdtemp(prefix="ecko_git_"))
         self._repo = None # GitPython Repo object, initialized in __enter__
+        self.push_rejected = False # Last push was rejected as non-fast-forward (remote moved)
         self._host = "github.com" # Assuming GitHub.com
         logger.info(f"Initialized GitRepo context for temp path: {self._repo_path_obj}")
 
+    @tracing.traced("git.clone")
     def __enter__(self):
         """
         Clones the repository (shallowly) when entering the 'with' block.
@@ -49,6 +105,7 @@ class GitRepo:
             repo=config.GITHUB_REPO_NAME,
             host=self._host
         )
+        git = _git()
         # Mask PAT only for logging, not the actual URL used for cloning
         masked_url = repo_url.replace(self._pat, "***PAT***")
 
@@ -81,6 +138,7 @@ class GitRepo:
             self._cleanup() # Attempt cleanup
             raise # Re-raise the original exception
 
+    @tracing.traced("git.cleanup")
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
         Cleans up the temporary repository directory when exiting the 'with' block.
@@ -114,6 +172,7 @@ class GitRepo:
              raise RuntimeError("Git repository object is not available (outside context or clone failed).")
         return self._repo
 
+    @tracing.traced("git.ls_files")
     def list_files(self):
         """
         Lists all files tracked by Git in the repository using 'git ls-files'.
@@ -125,6 +184,7 @@ class GitRepo:
         """
         if not self.git_repo: return None, "Repository object is not available."
         logger.info(f"Listing tracked files in repository at {self.path} using 'git ls-files'")
+        git = _git()
         try:
             # Execute 'git ls-files' command via GitPython
             tracked_files_raw = self.git_repo.git.ls_files().splitlines()
@@ -155,6 +215,7 @@ class GitRepo:
             tuple: (file content string, None) on success,
                    (None, error message string) on failure (e.g., not found, read error, security).
         """
+        git = _git()
         if not self.path: return None, "Repository path is not available."
         try:
             repo_root_resolved = Path(self.path).resolve()
@@ -191,6 +252,7 @@ class GitRepo:
             logger.error(f"Error reading file '{relative_path_str}': {e}", exc_info=True)
             return None, f"Error reading file '{relative_path_str}': {e}"
 
+    @tracing.traced("git.apply")
     def apply_changes(self, changes_map):
         """
         Writes the provided new content to the specified files in the local clone.
@@ -259,6 +321,7 @@ class GitRepo:
             logger.info("No files provided to commit_and_push. Nothing to do.")
             return True, "No files specified to commit."
 
+        git = _git()
         try:
             logger.info(f"Staging {len(files_to_commit)} files: {files_to_commit}")
             # Stage files relative to the repository root using POSIX paths
@@ -277,20 +340,25 @@ class GitRepo:
 
             # Commit the staged changes (author already configured)
             logger.info(f"Committing {len(files_to_commit)} files with message: '{commit_message}'")
-            self.git_repo.index.commit(commit_message)
+            with tracing.span("git.commit", files=len(files_to_commit)):
+                self.git_repo.index.commit(commit_message)
 
             # Push the commit to the remote repository
             logger.info(f"Pushing commit to origin/{config.GITHUB_MAIN_BRANCH}...")
             origin = self.git_repo.remote(name='origin')
-            push_info_list = origin.push(refspec=f'{config.GITHUB_MAIN_BRANCH}:{config.GITHUB_MAIN_BRANCH}')
+            with tracing.span("git.push"):
+                push_info_list = origin.push(refspec=f'{config.GITHUB_MAIN_BRANCH}:{config.GITHUB_MAIN_BRANCH}')
 
             # Validate push results carefully
             push_errors = []
             push_summaries = []
+            self.push_rejected = False
             for info in push_info_list:
                  summary_log = f"Push summary for ref '{info.remote_ref_string or ''}': {info.summary} (Flags: {info.flags})"
                  push_summaries.append(summary_log)
                  # Check for specific error flags
+                 if info.flags & git.PushInfo.REJECTED:
+                     self.push_rejected = True
                  if info.flags & (git.PushInfo.ERROR | git.PushInfo.REJECTED | git.PushInfo.REMOTE_FAILURE):
                      error_summary = f"Push Error/Rejection: {info.summary} (Flags: {info.flags})"
                      logger.error(error_summary)
@@ -302,8 +370,8 @@ class GitRepo:
                  # Construct a user-friendly error message
                  error_detail = "Push failed: " + "; ".join(push_errors)
                  full_error_summary_lower = error_detail.lower()
-                 if "non-fast-forward" in full_error_summary_lower:
-                      error_detail += " (Hint: Remote branch has changes. Manual intervention might be needed.)"
+                 if self.push_rejected or "non-fast-forward" in full_error_summary_lower:
+                      error_detail += " (Hint: Remote branch has changes.)"
                  elif "permission denied" in full_error_summary_lower or "authentication failed" in full_error_summary_lower:
                       error_detail += " (Hint: Check repository permissions or PAT validity/scopes.)"
                  elif "could not resolve host" in full_error_summary_lower:
@@ -321,4 +389,46 @@ class GitRepo:
             return False, f"Git command failed: {e}. Stderr: {stderr_output}"
         except Exception as e:
             logger.error(f"Unexpected error during commit/push: {e}", exc_info=True)
-            return False, f"Unexpected error during commit/push: {e}"
\ No newline at end of file
+            return False, f"Unexpected error during commit/push: {e}"
+
+    def head_sha(self):
+        """Returns the commit SHA of the local HEAD."""
+        return self.git_repo.head.commit.hexsha
+
+    @tracing.traced("git.ls_remote")
+    def remote_head_sha(self):
+        """
+        Returns the current commit SHA of the branch on the remote (one 'git ls-remote').
+
+        Returns:
+            tuple: (sha or None, error message or None)
+        """
+        git = _git()
+        try:
+            output = self.git_repo.git.ls_remote("origin", f"refs/heads/{config.GITHUB_MAIN_BRANCH}").strip()
+            return (output.split()[0] if output else None), None
+        except git.GitCommandError as e:
+            stderr_output = str(getattr(e, 'stderr', 'N/A')).strip()
+            logger.error(f"Git ls-remote failed: {e}. Stderr: {stderr_output}")
+            return None, f"Could not read remote head: {stderr_output}"
+
+    @tracing.traced("git.fetch_reset")
+    def reset_to_remote(self):
+        """
+        Moves the clone to the branch's current remote head (shallow fetch + hard reset),
+        discarding local commits and changes.
+
+        Returns:
+            tuple: (new head sha or None, error message or None)
+        """
+        git = _git()
+        try:
+            self.git_repo.remote(name='origin').fetch(refspec=config.GITHUB_MAIN_BRANCH, depth=1)
+            self.git_repo.git.reset("--hard", "FETCH_HEAD")
+            head = self.head_sha()
+            logger.info(f"Clone reset to remote {config.GITHUB_MAIN_BRANCH} head {head[:12]}.")
+            return head, None
+        except git.GitCommandError as e:
+            stderr_output = str(getattr(e, 'stderr', 'N/A')).strip()
+            logger.error(f"Git fetch/reset to remote head failed: {e}. Stderr: {stderr_output}", exc_info=True)
+            return None, f"Could not update to the remote head: {e}. Stderr: {stderr_output}"
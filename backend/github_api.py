@@ -2,37 +2,298 @@
 import requests
 import logging
 import json
-import io        # Added for in-memory bytes handling
+import tempfile
+import copy
+import hashlib
+import threading
+import time
 import zipfile   # Added for zip file processing
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import config    # Use centralized config
-from urllib.parse import urljoin
+import run_log_cache
+import tracing
 
 logger = logging.getLogger(__name__)
 
-def _make_request(method, endpoint, pat, data=None, params=None, allow_redirects=True, stream=False, timeout=20):
-    """Internal helper to make GitHub API requests."""
+# Called (without arguments) whenever GitHub rejects the PAT with 401, so cached
+# credentials can be dropped. Registered by the app to keep this module free of GCP imports.
+_auth_failure_hooks = []
+
+def register_auth_failure_hook(hook):
+    """Registers a callable invoked when a GitHub API call returns 401 Unauthorized."""
+    if hook not in _auth_failure_hooks:
+        _auth_failure_hooks.append(hook)
+
+def _notify_auth_failure():
+    for hook in _auth_failure_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.error(f"GitHub auth failure hook {hook!r} failed: {e}", exc_info=True)
+
+# --- Pooled HTTP session ---
+# One keep-alive session per instance, so the status -> log URL -> archive sequence
+# reuses connections instead of paying a TCP/TLS handshake per call. The adapter
+# retries connection errors and 5xx with exponential backoff; POST is never retried
+# there because workflow dispatch is not idempotent. Rate limits (403/429 with
+# Retry-After) are left to _make_request, which caps the wait at
+# GITHUB_RETRY_AFTER_MAX_SECONDS instead of sleeping for whatever the server asks.
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    """Returns the shared requests.Session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=config.GITHUB_HTTP_MAX_RETRIES,
+                    backoff_factor=config.GITHUB_HTTP_BACKOFF_FACTOR,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+                    respect_retry_after_header=False, # Backoff only; an uncapped Retry-After sleep would stall the caller
+                    raise_on_status=False, # Hand the final response back for normal error handling
+                )
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.GITHUB_HTTP_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+# --- Conditional-request cache ---
+# GET responses are stored with their ETag / Last-Modified and revalidated with
+# If-None-Match / If-Modified-Since; GitHub answers 304 without counting it against
+# the rate limit. Responses marked immutable (completed workflow runs) are served
+# without any request at all.
+_http_cache = OrderedDict() # (pat hash, url, params) -> dict(etag, last_modified, data, immutable)
+_http_cache_lock = threading.Lock()
+_http_cache_stats = {"lookups": 0, "immutable_hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+def _cache_key(pat, url, params):
+    # The PAT is part of the key (hashed) so responses never cross credentials
+    pat_hash = hashlib.sha256(pat.encode("utf-8")).hexdigest()[:16]
+    return (pat_hash, url, tuple(sorted((params or {}).items())))
+
+def _cache_store(key, response, data, immutable):
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if not (etag or last_modified or immutable):
+        return
+    with _http_cache_lock:
+        _http_cache[key] = {"etag": etag, "last_modified": last_modified, "data": data, "immutable": immutable}
+        _http_cache.move_to_end(key)
+        while len(_http_cache) > config.GITHUB_HTTP_CACHE_SIZE:
+            _http_cache.popitem(last=False)
+            _http_cache_stats["evictions"] += 1
+
+def get_http_cache_stats():
+    """Returns conditional-request cache counters, hit ratio and the last seen rate-limit headroom."""
+    with _http_cache_lock:
+        stats = dict(_http_cache_stats)
+        stats["entries"] = len(_http_cache)
+    stats["rate_limit"] = _scheduler.headroom()
+    hits = stats["immutable_hits"] + stats["revalidated"]
+    stats["hit_ratio"] = round(hits / stats["lookups"], 3) if stats["lookups"] else None
+    return stats
+
+# --- Rate-limit-aware scheduling ---
+# Every API call is admitted by the scheduler, which tracks the primary rate limit
+# budget from the X-RateLimit-* headers and caps concurrency (GitHub's secondary limits
+# punish bursts of parallel requests). Interactive calls (status, file reads, dispatch)
+# go first and may spend the whole budget; background calls (pollers, analytics) keep
+# GITHUB_BACKGROUND_RESERVE requests in reserve and yield to waiting interactive calls.
+# A call that cannot be admitted within its priority's max wait is shed with an error.
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+class _RequestScheduler:
+    """Admission control for GitHub API calls based on the remaining rate limit budget."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.limit = self.remaining = self.used = self.reset_at = self.resource = None # Unknown until the first response
+        self.in_flight = 0
+        self.waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self.counters = {p: {"admitted": 0, "queued": 0, "shed": 0, "wait_seconds": 0.0} for p in self.waiting}
+
+    def _budget_left(self, priority):
+        if self.remaining is None:
+            return True
+        if self.reset_at is not None and time.time() >= self.reset_at: # Window rolled over
+            self.remaining, self.reset_at = self.limit, None
+            return True
+        reserve = config.GITHUB_BACKGROUND_RESERVE if priority == PRIORITY_BACKGROUND else 0
+        return self.remaining - self.in_flight > reserve
+
+    def _can_start(self, priority):
+        if self.in_flight >= config.GITHUB_MAX_CONCURRENT_REQUESTS:
+            return False
+        if priority == PRIORITY_BACKGROUND and self.waiting[PRIORITY_INTERACTIVE]:
+            return False
+        return self._budget_left(priority)
+
+    def acquire(self, priority):
+        """Blocks until the call may start; returns None, or an error string if it was shed."""
+        max_wait = (config.GITHUB_BACKGROUND_MAX_WAIT_SECONDS if priority == PRIORITY_BACKGROUND
+                    else config.GITHUB_INTERACTIVE_MAX_WAIT_SECONDS)
+        counters = self.counters[priority]
+        with self._cond:
+            if not self._can_start(priority):
+                counters["queued"] += 1
+                self.waiting[priority] += 1
+                started = time.monotonic()
+                try:
+                    while not self._can_start(priority):
+                        remaining_wait = max_wait - (time.monotonic() - started)
+                        reset_in = None
+                        if not self._budget_left(priority) and self.reset_at is not None:
+                            reset_in = self.reset_at - time.time()
+                            if reset_in > remaining_wait: # Budget will not come back in time
+                                remaining_wait = 0
+                        if remaining_wait <= 0:
+                            counters["shed"] += 1
+                            logger.warning(f"GitHub {priority} request shed: remaining={self.remaining}, "
+                                           f"in_flight={self.in_flight}, reset_in={reset_in if reset_in is None else round(reset_in)}s.")
+                            return f"GitHub API budget exhausted for {priority} requests (remaining: {self.remaining}); try again later."
+                        self._cond.wait(min(remaining_wait, max(reset_in, 0.05)) if reset_in is not None else remaining_wait)
+                finally:
+                    self.waiting[priority] -= 1
+                    counters["wait_seconds"] += time.monotonic() - started
+                    self._cond.notify_all() # A background waiter may have been held back by this one
+            self.in_flight += 1
+            counters["admitted"] += 1
+            return None
+
+    def release(self, response=None):
+        """Ends a call admitted by acquire(), updating the budget from the response headers."""
+        with self._cond:
+            self.in_flight -= 1
+            headers = response.headers if response is not None else {}
+            if "X-RateLimit-Remaining" in headers:
+                values = {field: headers.get(f"X-RateLimit-{field.title()}") for field in ("limit", "remaining", "used", "reset", "resource")}
+                for field in ("limit", "remaining", "used"):
+                    if values[field] and values[field].isdigit():
+                        setattr(self, field, int(values[field]))
+                if values["reset"] and values["reset"].isdigit():
+                    self.reset_at = int(values["reset"])
+                self.resource = values["resource"] or self.resource
+                logger.debug(f"Rate Limit Remaining: {self.remaining}")
+                if self.limit and self.remaining < self.limit * 0.1:
+                    logger.warning(f"GitHub rate limit low: {self.remaining}/{self.limit} left.")
+            self._cond.notify_all()
+
+    def headroom(self):
+        with self._cond:
+            reset_in = max(0, round(self.reset_at - time.time())) if self.reset_at is not None else None
+            return {"limit": self.limit, "remaining": self.remaining, "used": self.used,
+                    "reset_in_seconds": reset_in, "resource": self.resource}
+
+    def stats(self):
+        stats = self.headroom()
+        with self._cond:
+            stats.update({"in_flight": self.in_flight, "waiting": dict(self.waiting),
+                          "max_concurrent": config.GITHUB_MAX_CONCURRENT_REQUESTS, "background_reserve": config.GITHUB_BACKGROUND_RESERVE,
+                          "priorities": {p: dict(c, wait_seconds=round(c["wait_seconds"], 3)) for p, c in self.counters.items()}})
+        return stats
+
+_scheduler = _RequestScheduler()
+
+def get_rate_limit_stats():
+    """Returns the rate limit budget, in-flight/queued calls and admitted/queued/shed counters per priority."""
+    return _scheduler.stats()
+
+@lru_cache(maxsize=8)
+def _repo_base_url(api_base_url, owner, repo):
+    """'https://api.github.com/repos/<owner>/<repo>/' (keeps any path prefix, e.g. GHE's /api/v3)."""
+    return f"{api_base_url.rstrip('/')}/repos/{owner}/{repo}/"
+
+def _secondary_rate_limit_wait(response):
+    """
+    Seconds to wait before retrying a 403/429 secondary rate limit response, or None if
+    the response is not a rate limit (e.g. a real permission error) or the wait is too long.
+    """
+    if response.status_code not in (403, 429):
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        wait = float(retry_after)
+    elif response.headers.get("X-RateLimit-Remaining") == "0" and response.headers.get("X-RateLimit-Reset", "").isdigit():
+        wait = max(0.0, float(response.headers["X-RateLimit-Reset"]) - time.time())
+    else:
+        return None
+    return wait if wait <= config.GITHUB_RETRY_AFTER_MAX_SECONDS else None
+
+def _make_request(method, endpoint, pat, data=None, params=None, allow_redirects=True, stream=False, timeout=20,
+                  immutable_when=None, priority=PRIORITY_INTERACTIVE, use_cache=True):
+    """
+    Internal helper to make GitHub API requests.
+    Plain JSON GETs go through the conditional-request cache (unless use_cache=False, for
+    callers keeping their own copy); 'immutable_when' is an optional predicate on the
+    response data marking it as never changing again.
+    Calls are admitted by the rate limit scheduler according to 'priority'.
+    """
     if not pat: raise ValueError("GitHub PAT is required.")
     if not config.GITHUB_REPO_OWNER or not config.GITHUB_REPO_NAME: raise ValueError("GitHub repository config missing.")
 
-    # Use urljoin correctly for repo-specific endpoints
-    base_api_url = config.GITHUB_API_BASE_URL
-    repo_specific_base = urljoin(base_api_url, f"/repos/{config.GITHUB_REPO_OWNER}/{config.GITHUB_REPO_NAME}/")
-    # Determine if the endpoint is already repo-specific or needs the base
-    if endpoint.startswith(f"/repos/{config.GITHUB_REPO_OWNER}/{config.GITHUB_REPO_NAME}/"):
-        url = urljoin(base_api_url, endpoint) # Endpoint is already absolute-like
+    # Endpoints are relative to the repository unless already repo-specific
+    repo_prefix = f"/repos/{config.GITHUB_REPO_OWNER}/{config.GITHUB_REPO_NAME}/"
+    if endpoint.startswith(repo_prefix):
+        url = config.GITHUB_API_BASE_URL.rstrip('/') + endpoint
     else:
-        url = urljoin(repo_specific_base, endpoint.lstrip('/')) # Make relative endpoint repo-specific
+        url = _repo_base_url(config.GITHUB_API_BASE_URL, config.GITHUB_REPO_OWNER, config.GITHUB_REPO_NAME) + endpoint.lstrip('/')
 
     headers = {"Accept": "application/vnd.github.v3+json", "Authorization": f"Bearer {pat}", "X-GitHub-Api-Version": "2022-11-28"}
 
+    cache_key = cached = None
+    if use_cache and config.GITHUB_HTTP_CACHE_ENABLED and method.upper() == "GET" and allow_redirects and not stream:
+        cache_key = _cache_key(pat, url, params)
+        with _http_cache_lock:
+            _http_cache_stats["lookups"] += 1
+            cached = _http_cache.get(cache_key)
+            if cached is not None:
+                _http_cache.move_to_end(cache_key)
+                if cached["immutable"]:
+                    _http_cache_stats["immutable_hits"] += 1
+                    logger.info(f"GitHub API cache hit (immutable): GET {url}")
+                    return copy.deepcopy(cached["data"]), None
+        if cached is not None:
+            if cached["etag"]: headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]: headers["If-Modified-Since"] = cached["last_modified"]
+
+    with tracing.span("github.rate_limit_wait"):
+        shed_error = _scheduler.acquire(priority)
+    if shed_error:
+        return None, shed_error
+
     logger.info(f"GitHub API Request: {method.upper()} {url}")
+    response = None
     try:
-        response = requests.request(
-            method.upper(), url, headers=headers, json=data, params=params,
-            timeout=timeout, allow_redirects=allow_redirects, stream=stream
-        )
+        session = _get_session()
+        with tracing.span("github.request", method=method.upper(), endpoint=endpoint) as request_span:
+            for attempt in range(config.GITHUB_HTTP_MAX_RETRIES + 1):
+                response = session.request(
+                    method.upper(), url, headers=headers, json=data, params=params,
+                    timeout=timeout, allow_redirects=allow_redirects, stream=stream
+                )
+                # Secondary rate limits come back as 403 + Retry-After: the request was not
+                # processed, so it is safe to retry (POST included) after the advised wait
+                wait = _secondary_rate_limit_wait(response)
+                if wait is None or attempt == config.GITHUB_HTTP_MAX_RETRIES:
+                    break
+                logger.warning(f"GitHub rate limited {method.upper()} {url}; retrying in {wait:.1f}s (attempt {attempt + 1}).")
+                response.close()
+                time.sleep(wait)
+            request_span.set(status=response.status_code, attempts=attempt + 1)
         logger.info(f"GitHub API Response Status: {response.status_code} for {url}")
-        if 'X-RateLimit-Remaining' in response.headers: logger.debug(f"Rate Limit Remaining: {response.headers['X-RateLimit-Remaining']}")
+
+        if response.status_code == 304 and cached is not None: # Not modified: free under the rate limit
+            with _http_cache_lock:
+                _http_cache_stats["revalidated"] += 1
+            return copy.deepcopy(cached["data"]), None
 
         # Handle non-2xx/302 errors first (unless streaming, check after reading)
         if not stream and not response.ok and not (response.status_code == 302 and not allow_redirects):
@@ -48,6 +309,7 @@ def _make_request(method, endpoint, pat, data=None, params=None, allow_redirects
                  try: error_json = response.json(); message = error_json.get("message", "Unknown API error"); error_detail = f"{message} ({json.dumps(error_json.get('errors', []))})"
                  except json.JSONDecodeError: pass
                  logger.error(f"GitHub API Stream HTTP error: {response.status_code} - {error_detail}")
+                 if response.status_code == 401: _notify_auth_failure()
                  return None, f"GitHub API Stream Error ({response.status_code}): {error_detail}"
 
         if response.status_code == 204: return {}, None # No Content
@@ -56,13 +318,19 @@ def _make_request(method, endpoint, pat, data=None, params=None, allow_redirects
              if not redirect_url: raise ValueError("API returned 302 redirect without Location header.")
              return {"redirect_url": redirect_url}, None
         # Assume JSON for other successful responses (200, 201, etc.)
-        return response.json(), None
+        result = response.json()
+        if cache_key is not None:
+            with _http_cache_lock:
+                _http_cache_stats["misses"] += 1
+            _cache_store(cache_key, response, copy.deepcopy(result), bool(immutable_when and immutable_when(result)))
+        return result, None
 
     except requests.exceptions.HTTPError as e:
         error_body = e.response.text; error_detail = error_body or e.response.reason
         try: error_json = e.response.json(); message = error_json.get("message", "Unknown API error"); error_detail = f"{message} ({json.dumps(error_json.get('errors', []))})"
         except json.JSONDecodeError: pass
         logger.error(f"GitHub API HTTP error: {e.response.status_code} - {error_detail}")
+        if e.response.status_code == 401: _notify_auth_failure()
         return None, f"GitHub API Error ({e.response.status_code}): {error_detail}"
     except requests.exceptions.RequestException as e:
         logger.error(f"GitHub API connection error: {e}", exc_info=True)
@@ -70,6 +338,8 @@ def _make_request(method, endpoint, pat, data=None, params=None, allow_redirects
     except Exception as e:
         logger.error(f"Unexpected GitHub API error during request: {e}", exc_info=True)
         return None, f"Unexpected GitHub API error: {e}"
+    finally:
+        _scheduler.release(response)
 
 def trigger_workflow_dispatch(pat, workflow_filename, ref=config.GITHUB_MAIN_BRANCH):
     """Triggers a workflow_dispatch event."""
@@ -84,23 +354,72 @@ def trigger_workflow_dispatch(pat, workflow_filename, ref=config.GITHUB_MAIN_BRA
         return True, f"Workflow '{workflow_filename}' triggered successfully."
     else: return False, "Unexpected trigger response format."
 
-def get_latest_workflow_run(pat, workflow_filename, branch=config.GITHUB_MAIN_BRANCH):
+def get_latest_workflow_run(pat, workflow_filename, branch=config.GITHUB_MAIN_BRANCH, priority=PRIORITY_INTERACTIVE):
     """Gets details of the latest workflow run."""
     endpoint = f"actions/workflows/{workflow_filename}/runs"
     params = {"branch": branch, "per_page": 1}
-    data, error = _make_request("GET", endpoint, pat, params=params)
+    data, error = _make_request("GET", endpoint, pat, params=params, priority=priority)
     if error: return None, f"Failed get runs: {error}"
     runs = data.get("workflow_runs", [])
     if not runs: return None, "No runs found for this workflow and branch."
     logger.info(f"Found latest run ID {runs[0].get('id')} for workflow {workflow_filename}")
     return runs[0], None # Return latest run object
 
-def get_workflow_log_url(pat, run_id):
+def list_workflow_runs(pat, workflow_filename, branch=config.GITHUB_MAIN_BRANCH, event=None, created_since=None,
+                       per_page=10, page=None, status=None, priority=PRIORITY_INTERACTIVE, use_cache=True):
+    """
+    Lists recent runs of a workflow (newest first), optionally only those triggered by
+    'event', in 'status' (e.g. 'completed') and created at or after 'created_since'
+    (ISO 8601 UTC, e.g. '2024-01-01T12:00:00Z'). 'page' is 1-based.
+    """
+    endpoint = f"actions/workflows/{workflow_filename}/runs"
+    params = {"branch": branch, "per_page": per_page}
+    if event: params["event"] = event
+    if status: params["status"] = status
+    if page: params["page"] = page
+    if created_since: params["created"] = f">={created_since}"
+    data, error = _make_request("GET", endpoint, pat, params=params, priority=priority, use_cache=use_cache)
+    if error: return None, f"Failed list runs: {error}"
+    return data.get("workflow_runs", []), None
+
+def _parse_github_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+def run_duration_seconds(run):
+    """Wall time of a run: start to last update when completed, start to now while it is still going."""
+    started = _parse_github_time(run.get("run_started_at") or run.get("created_at"))
+    if not started: return None
+    ended = _parse_github_time(run.get("updated_at")) if _is_completed_run(run) else datetime.now(timezone.utc)
+    return max(0, round((ended - started).total_seconds())) if ended else None
+
+def _is_completed_run(run):
+    return isinstance(run, dict) and run.get("status") == "completed"
+
+def get_workflow_run(pat, run_id, priority=PRIORITY_INTERACTIVE):
+    """Gets a workflow run by ID. Completed runs never change, so they are cached as immutable."""
+    if not run_id: return None, "Run ID required."
+    data, error = _make_request("GET", f"actions/runs/{run_id}", pat, immutable_when=_is_completed_run, priority=priority)
+    if error: return None, f"Failed get run {run_id}: {error}"
+    return data, None
+
+def _all_jobs_completed(data):
+    jobs = data.get("jobs") if isinstance(data, dict) else None
+    return bool(jobs) and all(job.get("status") == "completed" for job in jobs)
+
+def get_run_jobs(pat, run_id, priority=PRIORITY_INTERACTIVE, use_cache=True):
+    """Gets the jobs (with their steps) of a run's latest attempt; cached as immutable once all jobs completed."""
+    if not run_id: return None, "Run ID required."
+    data, error = _make_request("GET", f"actions/runs/{run_id}/jobs", pat, params={"per_page": 100},
+                                immutable_when=_all_jobs_completed, priority=priority, use_cache=use_cache)
+    if error: return None, f"Failed get jobs for run {run_id}: {error}"
+    return data.get("jobs", []), None
+
+def get_workflow_log_url(pat, run_id, priority=PRIORITY_INTERACTIVE):
     """Gets the log archive download URL (returns the redirect URL)."""
     if not run_id: return None, "Run ID required."
     endpoint = f"actions/runs/{run_id}/logs"
     # Make request, but expect 302 redirect and *don't* follow it
-    data, error = _make_request("GET", endpoint, pat, allow_redirects=False)
+    data, error = _make_request("GET", endpoint, pat, allow_redirects=False, priority=priority)
     if error:
         # Handle specific errors like 404 or 410 Gone for expired logs
         if "404" in error or "410" in error: return None, f"Logs for run {run_id} not found or expired."
@@ -120,15 +439,97 @@ def get_workflow_log_url(pat, run_id):
         return None, "Log download URL not found (maybe still processing or API issue?)."
 
 
-def download_and_extract_log_content(log_archive_url, pat, max_log_size_bytes=500 * 1024):
+def get_run_log_content(pat, run, priority=PRIORITY_INTERACTIVE):
+    """
+    Returns the extracted log text of a workflow run (a run object or a run ID).
+    Completed runs are served from run_log_cache when present, and cached after download.
+
+    Returns:
+        tuple: (log text or None, error message or None, status), status being one of
+               'cached', 'downloaded', 'not_found', 'processing', 'error_fetching_logs',
+               'download_failed' or 'empty_log'.
+    """
+    if not isinstance(run, dict):
+        run, err = get_workflow_run(pat, run, priority=priority)
+        if err: return None, err, "not_found"
+    run_id = run.get("id")
+    completed = _is_completed_run(run)
+    if completed:
+        cached = run_log_cache.get(run_id)
+        if cached is not None:
+            logger.info(f"Serving logs for completed run {run_id} from the run log cache.")
+            return cached, None, "cached"
+
+    log_info, err_log = get_workflow_log_url(pat, run_id, priority=priority)
+    if err_log:
+        return None, f"Could not get log URL: {err_log}", "error_fetching_logs"
+    if not (log_info and log_info.get("log_archive_url")):
+        return None, "Log download URL not available (workflow might still be processing).", "processing"
+    failed_members = []
+    log_content, dl_err = download_and_extract_log_content(log_info["log_archive_url"], pat, failed_members=failed_members)
+    if dl_err:
+        return None, f"Failed to download/extract logs: {dl_err}", "download_failed"
+    if not log_content:
+        return None, "Log download returned empty content.", "empty_log"
+    if completed and not failed_members: # A partial extraction is served but not cached for good
+        run_log_cache.put(run_id, log_content)
+    elif failed_members:
+        logger.warning(f"Not caching logs of run {run_id}: {len(failed_members)} archive members could not be read.")
+    return log_content, None, "downloaded"
+
+@tracing.traced("github.log_download")
+def _spool_download(response, spool):
+    """Copies a streamed response into 'spool', enforcing LOG_ARCHIVE_MAX_DOWNLOAD_BYTES."""
+    limit = config.LOG_ARCHIVE_MAX_DOWNLOAD_BYTES
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise ValueError(f"Log archive is {int(declared)} bytes, over the {limit} byte download limit.")
+    downloaded = 0
+    for chunk in response.iter_content(chunk_size=config.LOG_ARCHIVE_READ_CHUNK_BYTES):
+        downloaded += len(chunk)
+        if downloaded > limit:
+            raise ValueError(f"Log archive exceeds the {limit} byte download limit.")
+        spool.write(chunk)
+    spool.seek(0)
+    return downloaded
+
+@tracing.traced("github.log_extract_member")
+def _read_member_tail(archive, info, window):
+    """
+    Decompresses one zip member as a stream, keeping only its last 'window' bytes.
+    Returns (kept bytes, number of leading bytes dropped).
+    """
+    tail = bytearray()
+    total = 0
+    with archive.open(info) as member:
+        while True:
+            chunk = member.read(config.LOG_ARCHIVE_READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            tail += chunk
+            if len(tail) > 2 * window: # Trim in batches rather than on every chunk
+                del tail[:len(tail) - window]
+    if len(tail) > window:
+        del tail[:len(tail) - window]
+    return bytes(tail), total - len(tail)
+
+def download_and_extract_log_content(log_archive_url, pat, max_log_size_bytes=500 * 1024, failed_members=None):
     """
     Downloads a GitHub Actions log archive (zip) from the URL, extracts log files,
     and returns their combined content.
 
+    The archive is spooled to a bounded temporary file (memory up to
+    LOG_ARCHIVE_SPOOL_MEMORY_BYTES, then disk) and each member is decompressed as a
+    stream, keeping at most a LOG_ARCHIVE_MEMBER_TAIL_BYTES tail of it (failures are
+    usually at the end of a step). Extraction stops once max_log_size_bytes is used up.
+
     Args:
         log_archive_url (str): The pre-signed URL obtained from get_workflow_log_url.
         pat (str): GitHub PAT (may not be strictly needed if URL is pre-signed, but good practice).
         max_log_size_bytes (int): Maximum total size of extracted logs to return.
+        failed_members (list): Optional; names of archive members that could not be
+                               read are appended to it (their sections hold an error note).
 
     Returns:
         tuple: (combined log content string or None, error message string or None)
@@ -139,72 +540,65 @@ def download_and_extract_log_content(log_archive_url, pat, max_log_size_bytes=50
     logger.info(f"Attempting to download log archive from URL...")
     # Use requests directly for the download URL, might not need PAT if pre-signed
     # Add auth header just in case it becomes necessary in some scenarios
-    headers = {"Authorization": f"Bearer {pat}"}
+    headers = {"Accept": "application/vnd.github.v3+json", "Authorization": f"Bearer {pat}", "X-GitHub-Api-Version": "2022-11-28"}
     total_extracted_size = 0
-    combined_logs = ""
+    parts = []
 
     try:
-        # Use stream=True to handle potentially large zip files efficiently
-        response = requests.get(log_archive_url, headers=headers, stream=True, timeout=60) # Increased timeout for download
-        response.raise_for_status() # Check for download errors (4xx, 5xx)
-
-        logger.info("Log archive downloaded successfully. Extracting...")
-
-        # Process the zip file from the response stream in memory
-        with io.BytesIO() as memory_zip:
-             # Read stream chunk by chunk into memory buffer
-             chunk_size = 8192
-             for chunk in response.iter_content(chunk_size=chunk_size):
-                 memory_zip.write(chunk)
-             memory_zip.seek(0) # Rewind buffer to the beginning
-
-             # Open the zip file from the memory buffer
-             with zipfile.ZipFile(memory_zip, 'r') as archive:
-                 log_files = []
-                 # Find text files (likely logs) within the archive
-                 for item in archive.infolist():
-                     # Often logs are directly .txt or in numbered folders
-                     if not item.is_dir() and item.filename.lower().endswith('.txt'):
-                          log_files.append(item.filename)
-                     # Sometimes they might be inside step-specific folders without .txt
-                     # Example: '1_Setup Job.txt' or 'job_folder/1_step_name.txt'
-                     # You might need more sophisticated detection if logs aren't consistently .txt
+        # Use stream=True so the archive is never held in memory as a whole
+        with tracing.span("github.log_request"):
+            response = _get_session().get(log_archive_url, headers=headers, stream=True, timeout=60) # Increased timeout for download
+
+        # Closing the response returns its pooled connection even when the download fails or is refused midway
+        with response, tempfile.SpooledTemporaryFile(max_size=config.LOG_ARCHIVE_SPOOL_MEMORY_BYTES) as spool:
+             response.raise_for_status() # Check for download errors (4xx, 5xx)
+             archive_size = _spool_download(response, spool)
+             logger.info(f"Log archive downloaded ({archive_size} bytes). Extracting...")
+
+             # The zip central directory is at the end, so the members are listed from the spooled file
+             with zipfile.ZipFile(spool, 'r') as archive:
+                 # Often logs are directly .txt or in numbered folders ('1_Setup Job.txt', 'job/1_step.txt')
+                 log_files = [item for item in archive.infolist() if not item.is_dir() and item.filename.lower().endswith('.txt')]
 
                  if not log_files:
                       logger.warning(f"No '.txt' log files found in the archive. Archive contents: {archive.namelist()}")
-                      # Try reading any file that isn't clearly binary? Risky.
-                      # For now, return specific message.
                       return None, "No '.txt' log files found within the downloaded archive."
 
-                 log_files.sort() # Process in a consistent order
+                 log_files.sort(key=lambda item: item.filename) # Process in a consistent order
 
                  # Extract and combine content from identified log files
-                 for filename in log_files:
+                 for item in log_files:
+                     budget_left = max_log_size_bytes - total_extracted_size
+                     if budget_left <= 0:
+                          parts.append(f"\n... [LOG TRUNCATED DUE TO SIZE LIMIT ({max_log_size_bytes} bytes)] ...\n")
+                          logger.warning(f"Log content truncated at {max_log_size_bytes} bytes.")
+                          break # Stop processing more files
                      try:
-                         # Read file content as bytes
-                         content_bytes = archive.read(filename)
+                         window = min(config.LOG_ARCHIVE_MEMBER_TAIL_BYTES, budget_left)
+                         content_bytes, dropped = _read_member_tail(archive, item, window)
                          # Decode assuming UTF-8 (most common for logs)
                          content_str = content_bytes.decode('utf-8', errors='replace') # Replace errors to avoid crashing
-
-                         # Check size limit before appending
-                         if total_extracted_size + len(content_bytes) > max_log_size_bytes:
-                              combined_logs += f"\n... [LOG TRUNCATED DUE TO SIZE LIMIT ({max_log_size_bytes} bytes)] ...\n"
-                              logger.warning(f"Log content truncated at {max_log_size_bytes} bytes.")
-                              break # Stop processing more files
+                         if dropped:
+                             # Start the tail on a line boundary
+                             newline = content_str.find("\n")
+                             if 0 <= newline < len(content_str) - 1:
+                                 content_str = content_str[newline + 1:]
+                             content_str = f"... [{dropped} earlier bytes omitted] ...\n" + content_str
 
                          # Add a separator/header for clarity if multiple files exist
                          if len(log_files) > 1:
-                             combined_logs += f"\n--- Log File: {filename} ---\n"
-                         combined_logs += content_str
+                             parts.append(f"\n--- Log File: {item.filename} ---\n")
+                         parts.append(content_str)
                          total_extracted_size += len(content_bytes)
 
                      except Exception as e_read:
-                          logger.error(f"Error reading/decoding file '{filename}' from zip: {e_read}")
-                          combined_logs += f"\n--- Error reading file: {filename} ({e_read}) ---\n"
+                          logger.error(f"Error reading/decoding file '{item.filename}' from zip: {e_read}")
+                          parts.append(f"\n--- Error reading file: {item.filename} ({e_read}) ---\n")
+                          if failed_members is not None: failed_members.append(item.filename)
                           # Continue to next file
 
         logger.info(f"Successfully extracted and combined {len(log_files)} log files ({total_extracted_size} bytes).")
-        return combined_logs.strip(), None # Return combined content
+        return "".join(parts).strip(), None # Return combined content
 
     except requests.exceptions.RequestException as e_dl:
         logger.error(f"Failed to download log archive: {e_dl}", exc_info=True)
@@ -212,6 +606,9 @@ def download_and_extract_log_content(log_archive_url, pat, max_log_size_bytes=50
     except zipfile.BadZipFile:
         logger.error("Downloaded file is not a valid zip archive.")
         return None, "Downloaded file is not a valid zip archive."
+    except ValueError as e_size:
+        logger.error(f"Log archive rejected: {e_size}")
+        return None, str(e_size)
     except Exception as e_zip:
         logger.error(f"Error processing log archive: {e_zip}", exc_info=True)
-        return None, f"Error processing log archive: {e_zip}"
\ No newline at end of file
+        return None, f"Error processing log archive: {e_zip}"
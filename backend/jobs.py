@@ -0,0 +1,318 @@
+# backend/jobs.py
+"""
+Asynchronous jobs for long-running requests (code modifications).
+
+submit() records a job as 'queued' and hands it to a worker pool of JOB_WORKERS
+threads, so the HTTP request returns a job ID at once and the number of
+clone/LLM/push pipelines running on an instance is bounded by the pool, not by
+how many requests arrive; beyond JOB_MAX_QUEUED waiting jobs, submissions are
+refused. The job body reports progress with Job.advance(stage). Every transition
+records per-stage timing, wakes long-polling clients and is written through the
+registered store (Firestore), so a job's last state can be read from any
+instance. Jobs also keep an in-memory event log (stage changes and progress
+messages with elapsed times) that clients on the same instance can stream.
+Each job runs as its own trace (see tracing.py), sampled if the request that
+submitted it was.
+
+States: queued -> cloning -> planning -> applying -> pushing -> done. Stages may
+be skipped (e.g. nothing to push), never revisited; 'done' carries the result.
+
+Unfinished jobs are re-persisted every JOB_HEARTBEAT_SECONDS with a fresh
+'heartbeat_at'. If the instance running a job is recycled, nothing finishes it,
+so a stored job whose heartbeat is older than JOB_LEASE_SECONDS is marked failed
+when its status is read.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import config
+import tracing
+
+logger = logging.getLogger(__name__)
+
+STATES = ("queued", "cloning", "planning", "applying", "pushing", "done")
+_STATE_ORDER = {state: order for order, state in enumerate(STATES)}
+
+_jobs = {} # job_id -> Job
+_jobs_lock = threading.Lock()
+_pool = None
+_stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "expired": 0, "persist_errors": 0}
+_heartbeat_thread = None
+_store_save = None # job dict -> error or None
+_store_load = None # job_id -> (job dict or None, error or None)
+
+
+def register_store(save, load):
+    """Registers the persistence functions (firestore_ops.save_job / get_job)."""
+    global _store_save, _store_load
+    _store_save, _store_load = save, load
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """One submitted request: its state, per-stage timings and final result."""
+    def __init__(self, kind, description, conversation_id=None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.conversation_id = conversation_id
+        self.state = "queued"
+        self.stages = [{"stage": "queued", "started_at": _now_iso(), "duration_ms": None}]
+        self.result = None
+        self.status_code = None
+        self.created_at = self.stages[0]["started_at"]
+        self.finished_at = None
+        self.version = 1
+        self.message = None # Latest progress message
+        self.events = [] # Stage/progress/done events, streamed by /job_events
+        self._stage_started = time.monotonic()
+        self._created = self._finished = self._stage_started
+        self._changed = threading.Condition()
+        self._persist_lock = threading.Lock() # Orders this job's store writes (see _persist)
+        self._append_event("stage", "Queued.")
+
+    def _append_event(self, kind, message, **fields):
+        """Adds an event to the log. Caller holds the condition (or is the constructor)."""
+        now = time.monotonic()
+        self.events.append({
+            "seq": len(self.events) + 1,
+            "type": kind,
+            "state": self.state,
+            "message": message,
+            "elapsed_ms": round((now - self._created) * 1000, 1),
+            "stage_elapsed_ms": round((now - self._stage_started) * 1000, 1),
+            "at": _now_iso(),
+            **fields,
+        })
+
+    def _transition(self, state, result=None, status_code=None):
+        with self._changed:
+            if _STATE_ORDER[state] <= _STATE_ORDER[self.state]:
+                raise ValueError(f"Job {self.job_id}: invalid transition {self.state} -> {state}")
+            now = time.monotonic()
+            self.stages[-1]["duration_ms"] = round((now - self._stage_started) * 1000, 1)
+            self._stage_started = now
+            self.state = state
+            self.stages.append({"stage": state, "started_at": _now_iso(), "duration_ms": 0.0 if state == "done" else None})
+            if state == "done":
+                self.result, self.status_code = result, status_code
+                self.finished_at, self._finished = time.time(), now
+            self.version += 1
+            if state == "done":
+                self._append_event("done", (result or {}).get("response") or (result or {}).get("error"),
+                                   result=result, status_code=status_code)
+            else:
+                self._append_event("stage", f"{state.capitalize()}...", previous_stage_ms=self.stages[-2]["duration_ms"])
+            self._changed.notify_all()
+        logger.info(f"Job {self.job_id} ({self.kind}): {state}")
+        _persist(self)
+
+    def advance(self, state):
+        """Moves the job to a later working state (cloning/planning/applying/pushing)."""
+        if state == "done":
+            raise ValueError("Use finish() to complete a job.")
+        self._transition(state)
+
+    def finish(self, result, status_code):
+        self._transition("done", result=result, status_code=status_code)
+
+    def emit(self, message):
+        """Records a progress message within the current stage (not persisted)."""
+        with self._changed:
+            self.message = message
+            self._append_event("progress", message)
+            self._changed.notify_all()
+
+    @property
+    def done(self):
+        return self.state == "done"
+
+    def wait(self, after_version, wait_seconds):
+        """Blocks until the job's version exceeds after_version (or it is done), up to wait_seconds."""
+        deadline = time.monotonic() + wait_seconds
+        with self._changed:
+            while self.version <= after_version and not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return self.to_dict()
+
+    def wait_events(self, after_seq, wait_seconds):
+        """Returns (events with seq > after_seq, done), waiting up to wait_seconds for one to arrive."""
+        deadline = time.monotonic() + wait_seconds
+        with self._changed:
+            while len(self.events) <= after_seq and not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return list(self.events[after_seq:]), self.done
+
+    def to_dict(self):
+        with self._changed:
+            return {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "description": self.description,
+                "conversation_id": self.conversation_id,
+                "state": self.state,
+                "done": self.done,
+                "version": self.version,
+                "message": self.message,
+                "stages": [dict(stage) for stage in self.stages],
+                "elapsed_ms": round(((self._finished if self.done else time.monotonic()) - self._created) * 1000, 1),
+                "created_at": self.created_at,
+                "heartbeat_at": time.time(), # Lease renewal when persisted (see _heartbeat_loop)
+                "result": self.result,
+                "status_code": self.status_code,
+            }
+
+
+def _persist(job, heartbeat=False):
+    """
+    Writes the job's current state through the store. Writes of one job are serialized and
+    each takes its snapshot under the lock, so an earlier state (e.g. a heartbeat racing
+    finish()) can never land after a later one. Heartbeats skip finished jobs.
+    """
+    if _store_save is None:
+        return
+    with job._persist_lock:
+        if heartbeat and job.done:
+            return
+        err = _store_save(job.to_dict())
+    if err:
+        with _jobs_lock:
+            _stats["persist_errors"] += 1
+        logger.warning(f"Job {job.job_id}: state '{job.state}' not persisted: {err}")
+
+
+def _get_pool():
+    global _pool, _heartbeat_thread
+    with _jobs_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=config.JOB_WORKERS, thread_name_prefix="ecko-job")
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+        return _pool
+
+
+def _heartbeat_loop():
+    """Renews the lease of every unfinished job on this instance by re-persisting it."""
+    while True:
+        time.sleep(config.JOB_HEARTBEAT_SECONDS)
+        with _jobs_lock:
+            running = [j for j in _jobs.values() if not j.done]
+        for job in running:
+            _persist(job, heartbeat=True)
+
+
+def _expire_if_stale(job_dict):
+    """
+    Marks a stored, unfinished job whose lease ran out as failed (and persists that),
+    since the instance that ran it is gone. Returns the (possibly updated) job dict.
+    """
+    if not job_dict or job_dict.get("done"):
+        return job_dict
+    silent_for = time.time() - (job_dict.get("heartbeat_at") or 0)
+    if silent_for <= config.JOB_LEASE_SECONDS:
+        return job_dict
+    error = f"Job stopped reporting progress in state '{job_dict.get('state')}' (instance recycled?); it did not finish."
+    expired = dict(job_dict, state="done", done=True, status_code=500, heartbeat_at=time.time(),
+                   result={"error": error, "modification_status": "Failed"},
+                   stages=list(job_dict.get("stages") or []) + [{"stage": "done", "started_at": _now_iso(), "duration_ms": 0.0}])
+    expired["version"] = (job_dict.get("version") or 0) + 1
+    logger.warning(f"Job {job_dict.get('job_id')}: lease expired ({silent_for:.0f}s without heartbeat); marking failed.")
+    with _jobs_lock:
+        _stats["expired"] += 1
+    if _store_save is not None:
+        err = _store_save(expired)
+        if err: logger.warning(f"Job {job_dict.get('job_id')}: expiry not persisted: {err}")
+    return expired
+
+
+def _run(job, body, parent_trace):
+    """Worker body: runs body(job) -> (result dict, status code) and finishes the job with it."""
+    with tracing.new_trace(f"job {job.kind}", sampled=parent_trace.sampled if parent_trace else None, job_id=job.job_id,
+                           parent_trace_id=parent_trace.trace_id if parent_trace else None) as trace:
+        try:
+            result, status_code = body(job)
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} failed")
+            result, status_code = {"error": f"Job failed: {e}"}, 500
+        trace.attrs["status"] = status_code
+        job.finish(result, status_code)
+    with _jobs_lock:
+        _stats["succeeded" if status_code < 400 else "failed"] += 1
+
+
+def _prune_finished():
+    """Drops finished jobs older than JOB_RETENTION_SECONDS. Caller holds the lock."""
+    cutoff = time.time() - config.JOB_RETENTION_SECONDS
+    for job_id in [j.job_id for j in _jobs.values() if j.done and j.finished_at < cutoff]:
+        _jobs.pop(job_id)
+
+
+def submit(kind, description, body, conversation_id=None):
+    """
+    Queues body(job) -> (result dict, status code) on the worker pool.
+
+    Returns:
+        tuple: (Job, None) or (None, error message) when the queue is full.
+    """
+    with _jobs_lock:
+        _prune_finished()
+        active = sum(1 for j in _jobs.values() if not j.done)
+        if active >= config.JOB_WORKERS + config.JOB_MAX_QUEUED:
+            _stats["rejected"] += 1
+            return None, f"Too many jobs in progress ({active}); try again shortly."
+        job = Job(kind, description, conversation_id)
+        _jobs[job.job_id] = job
+        _stats["submitted"] += 1
+    _persist(job)
+    _get_pool().submit(_run, job, body, tracing.current_trace())
+    return job, None
+
+
+def get_job(job_id):
+    """Returns the Job if it runs (or recently ran) on this instance, else None."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def get_status(job_id, after_version=0, wait_seconds=0):
+    """
+    Current state of a job. Jobs of this instance can be long-polled for a version
+    newer than after_version; others are read from the store (no waiting), and
+    reported as failed once their lease expired.
+
+    Returns:
+        tuple: (job dict or None if unknown, error message or None)
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job.wait(after_version, wait_seconds), None
+    if _store_load is None:
+        return None, None
+    job_dict, err = _store_load(job_id)
+    if err:
+        return None, err
+    return _expire_if_stale(job_dict), None
+
+
+def get_stats():
+    with _jobs_lock:
+        stats = dict(_stats)
+        states = [j.state for j in _jobs.values()]
+    stats["queued"] = states.count("queued")
+    stats["running"] = sum(1 for state in states if state not in ("queued", "done"))
+    stats["workers"] = config.JOB_WORKERS
+    return stats
@@ -1,25 +1,33 @@
 # backend/llm_interface.py
-import vertexai
-from vertexai.generative_models import (
-    GenerativeModel, Part, Content, GenerationConfig,
-    SafetySetting, HarmCategory, HarmBlockThreshold
-)
 import logging
 import json
 import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import config # Import configuration
+import log_miner # Template mining for log analysis context
+import tracing
 
 logger = logging.getLogger(__name__)
 _model = None
 
-# Safety settings (adjust as needed, blocking dangerous content is wise)
-SAFETY_SETTINGS = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-}
+def _genai():
+    """vertexai.generative_models, imported on first use (the Vertex AI SDK is the slowest import in the backend)."""
+    from vertexai import generative_models
+    return generative_models
+
+def _safety_settings():
+    """Safety settings (adjust as needed, blocking dangerous content is wise)"""
+    genai = _genai()
+    return {
+        genai.HarmCategory.HARM_CATEGORY_HARASSMENT: genai.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        genai.HarmCategory.HARM_CATEGORY_HATE_SPEECH: genai.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        genai.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: genai.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        genai.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: genai.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+    }
 
 # --- Operation Constants (Imported from centralized config) ---
 # Ensure these match definitions in config.py
@@ -36,8 +44,10 @@ def _get_model():
             if not config.GCP_PROJECT_ID or not config.REGION or not config.MODEL_NAME:
                  raise ValueError("Missing GCP/Vertex AI configuration.")
             logger.info(f"Initializing Vertex AI model '{config.MODEL_NAME}'...")
-            vertexai.init(project=config.GCP_PROJECT_ID, location=config.REGION)
-            _model = GenerativeModel(config.MODEL_NAME, safety_settings=SAFETY_SETTINGS)
+            with tracing.span("vertex.init"):
+                import vertexai
+                vertexai.init(project=config.GCP_PROJECT_ID, location=config.REGION)
+                _model = _genai().GenerativeModel(config.MODEL_NAME, safety_settings=_safety_settings())
             logger.info("Vertex AI model initialized.")
         except Exception as e:
             logger.error(f"Failed to initialize Vertex AI model: {e}", exc_info=True)
@@ -47,14 +57,16 @@ def _get_model():
 
 def _prepare_history(history_messages):
     """Converts Firestore history to Vertex AI Content list, limiting size."""
+    genai = _genai()
     vertex_history = []; token_count = 0; MAX_TOKENS = 8000 # Increased token limit for Gemini
     for msg in reversed(history_messages): # Process newest first
         role = 'user' if msg.get('sender') == 'User' else 'model' # Map sender to LLM roles
-        content = str(msg.get('message', '')); tokens = len(content)//4 # Rough token estimation
+        body = msg.get('message', ''); tokens = len(body)//4 # Rough token estimation (no decompression needed)
         if token_count + tokens < MAX_TOKENS:
+            content = str(body) # Compressed history bodies are only decompressed here
             # ===> Change Applied Here: Check for "Error:" prefix explicitly <===
             if content and not content.startswith("Error:"): # Skip empty/error messages
-                vertex_history.append(Content(role=role, parts=[Part.from_text(content)])); token_count += tokens
+                vertex_history.append(genai.Content(role=role, parts=[genai.Part.from_text(content)])); token_count += tokens
         else: logger.warning(f"Truncating history at ~{token_count} tokens."); break
     vertex_history.reverse() # Return chronological order
     logger.info(f"Prepared {len(vertex_history)} history messages (~{token_count} tokens).")
@@ -69,7 +81,8 @@ def generate_chat_response(history, user_message):
     try:
         chat = model_instance.start_chat(history=vertex_history)
         # Use generation config from config.py
-        response = chat.send_message(Part.from_text(user_message), generation_config=GenerationConfig(**config.GENERATION_CONFIG_CHAT))
+        with tracing.span("vertex.generate", kind="chat", history_messages=len(vertex_history)):
+            response = chat.send_message(_genai().Part.from_text(user_message), generation_config=_genai().GenerationConfig(**config.GENERATION_CONFIG_CHAT))
         # Check for valid content in response
         if not response.candidates or not response.candidates[0].content.parts:
             reason = response.candidates[0].finish_reason.name if response.candidates else "UNKNOWN"
@@ -82,14 +95,8 @@ def generate_chat_response(history, user_message):
         return {"response": ecko_response}, 200
     except Exception as e: logger.error(f"LLM chat error: {e}"); return {"error": f"Error communicating with AI: {e}"}, 500
 
-def generate_modification_plan(user_request, files_content):
-    """
-    Generates a JSON plan for precise code modifications using detailed operations.
-    """
-    model_instance = _get_model();
-    if not model_instance: return None, "Error: AI model unavailable."
-
-    # --- Prepare Context ---
+def _build_plan_context(files_content):
+    """Builds the line-numbered file context for the plan prompt, limiting size."""
     context_str = "Current project file contents (line numbers are 1-based):\n\n"
     total_chars = 0; MAX_CHARS = 100000 # Limit context size
     included_count = 0
@@ -106,6 +113,66 @@ def generate_modification_plan(user_request, files_content):
             context_str += file_entry; total_chars += len(file_entry); included_count += 1
         else: context_str += "[CONTEXT TRUNCATED]\n"; logger.warning("Truncated context for LLM plan."); break
     logger.info(f"LLM context: {included_count} files, {total_chars} chars.")
+    return context_str
+
+def _parse_plan_text(plan_text):
+    """
+    Extracts the JSON plan from the raw LLM response text and validates each operation.
+    Raises json.JSONDecodeError/ValueError if the response is not a JSON list.
+    """
+    match = re.search(r'```(?:json)?\s*(\[[\s\S]*?\])\s*```', plan_text, re.DOTALL | re.MULTILINE)
+    plan_str = match.group(1).strip() if match else plan_text
+    if not (plan_str.startswith('[') and plan_str.endswith(']')): raise ValueError("Response not a JSON list.")
+    plan = json.loads(plan_str)
+    if not isinstance(plan, list): raise ValueError("Parsed plan is not a list.")
+
+    # --- Detailed Validation of Operations ---
+    # ===> Change Applied Here: Confirm validation logic matches instructions <===
+    validated_plan = []
+    for i, op in enumerate(plan):
+        op_log_prefix = f"Plan Op {i+1}:"
+        if not isinstance(op, dict):
+            logger.warning(f"{op_log_prefix} Invalid format (not a dict). Skipping: {op}"); continue
+        op_type = op.get("operation")
+        file_path = op.get("file_path")
+
+        # Basic checks
+        if op_type not in ALLOWED_OPS: logger.warning(f"{op_log_prefix} Invalid operation type '{op_type}'. Skipping."); continue
+        if not file_path or not isinstance(file_path, str) or ".." in file_path or file_path.startswith("/"):
+            logger.warning(f"{op_log_prefix} Invalid file_path '{file_path}'. Skipping."); continue
+
+        # Operation-specific validation
+        valid_op = True
+        if op_type in [OP_REPLACE_ENTIRE_FILE, OP_CREATE_FILE]:
+            if not isinstance(op.get("new_content"), str): valid_op = False; logger.warning(f"{op_log_prefix} Missing/invalid 'new_content' (string).")
+        elif op_type == OP_INSERT_LINES:
+            if not isinstance(op.get("after_line_number"), int) or op.get("after_line_number") < 0: valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'after_line_number' (int >= 0).")
+            if not isinstance(op.get("lines_to_insert"), list): valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'lines_to_insert' (list).")
+        elif op_type in [OP_DELETE_LINES, OP_REPLACE_LINES]:
+            start_line = op.get("start_line_number")
+            end_line = op.get("end_line_number")
+            if not isinstance(start_line, int) or start_line < 1: valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'start_line_number' (int >= 1).")
+            if not isinstance(end_line, int) or end_line < start_line: valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'end_line_number' (int >= start_line).")
+            if op_type == OP_REPLACE_LINES and not isinstance(op.get("replacement_lines"), list): valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'replacement_lines' (list).")
+        # Could add checks against file_line_counts here if needed, but plan_executor is a better place
+
+        if valid_op:
+            validated_plan.append(op)
+        else:
+             logger.warning(f"{op_log_prefix} Invalid operation structure skipped: {op}")
+
+    if len(validated_plan) != len(plan): logger.warning(f"Plan validation removed {len(plan)-len(validated_plan)} items.")
+    logger.info(f"Validated surgical plan includes {len(validated_plan)} operations.")
+    return validated_plan
+
+def generate_modification_plan(user_request, files_content):
+    """
+    Generates a JSON plan for precise code modifications using detailed operations.
+    """
+    model_instance = _get_model();
+    if not model_instance: return None, "Error: AI model unavailable."
+
+    context_str = _build_plan_context(files_content)
 
     # --- Define the NEW Prompt for Surgical Edits ---
     # ===> Change Applied Here: Ensure prompt details match instructions <===
@@ -141,7 +208,8 @@ Generate a JSON list representing a precise plan to fulfill the request.
     try:
         logger.info(f"Generating surgical modification plan...")
         # Use generation config from config.py
-        response = model_instance.generate_content(prompt, generation_config=GenerationConfig(**config.GENERATION_CONFIG_PLAN))
+        with tracing.span("vertex.generate", kind="plan", prompt_chars=len(prompt)):
+            response = model_instance.generate_content(prompt, generation_config=_genai().GenerationConfig(**config.GENERATION_CONFIG_PLAN))
 
         # --- Response Handling & Validation ---
         if not response.candidates or not response.candidates.content.parts:
@@ -151,57 +219,92 @@ Generate a JSON list representing a precise plan to fulfill the request.
 
         # Extract and parse JSON robustly
         plan_text = "".join(p.text for p in response.candidates.content.parts).strip(); logger.debug(f"Raw surgical plan: {plan_text}")
-        match = re.search(r'```(?:json)?\s*(\[[\s\S]*?\])\s*```', plan_text, re.DOTALL | re.MULTILINE)
-        plan_str = match.group(1).strip() if match else plan_text
-        if not (plan_str.startswith('[') and plan_str.endswith(']')): raise ValueError("Response not a JSON list.")
-        plan = json.loads(plan_str)
-        if not isinstance(plan, list): raise ValueError("Parsed plan is not a list.")
-
-        # --- Detailed Validation of Operations ---
-        # ===> Change Applied Here: Confirm validation logic matches instructions <===
-        validated_plan = []
-        for i, op in enumerate(plan):
-            op_log_prefix = f"Plan Op {i+1}:"
-            if not isinstance(op, dict):
-                logger.warning(f"{op_log_prefix} Invalid format (not a dict). Skipping: {op}"); continue
-            op_type = op.get("operation")
-            file_path = op.get("file_path")
-
-            # Basic checks
-            if op_type not in ALLOWED_OPS: logger.warning(f"{op_log_prefix} Invalid operation type '{op_type}'. Skipping."); continue
-            if not file_path or not isinstance(file_path, str) or ".." in file_path or file_path.startswith("/"):
-                logger.warning(f"{op_log_prefix} Invalid file_path '{file_path}'. Skipping."); continue
-
-            # Operation-specific validation
-            valid_op = True
-            if op_type in [OP_REPLACE_ENTIRE_FILE, OP_CREATE_FILE]:
-                if not isinstance(op.get("new_content"), str): valid_op = False; logger.warning(f"{op_log_prefix} Missing/invalid 'new_content' (string).")
-            elif op_type == OP_INSERT_LINES:
-                if not isinstance(op.get("after_line_number"), int) or op.get("after_line_number") < 0: valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'after_line_number' (int >= 0).")
-                if not isinstance(op.get("lines_to_insert"), list): valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'lines_to_insert' (list).")
-            elif op_type in [OP_DELETE_LINES, OP_REPLACE_LINES]:
-                start_line = op.get("start_line_number")
-                end_line = op.get("end_line_number")
-                if not isinstance(start_line, int) or start_line < 1: valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'start_line_number' (int >= 1).")
-                if not isinstance(end_line, int) or end_line < start_line: valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'end_line_number' (int >= start_line).")
-                if op_type == OP_REPLACE_LINES and not isinstance(op.get("replacement_lines"), list): valid_op = False; logger.warning(f"{op_log_prefix} Invalid 'replacement_lines' (list).")
-            # Could add checks against file_line_counts here if needed, but plan_executor is a better place
-
-            if valid_op:
-                validated_plan.append(op)
-            else:
-                 logger.warning(f"{op_log_prefix} Invalid operation structure skipped: {op}")
-
-        if len(validated_plan) != len(plan): logger.warning(f"Plan validation removed {len(plan)-len(validated_plan)} items.")
-        logger.info(f"Validated surgical plan includes {len(validated_plan)} operations.")
-        return validated_plan, None # Return validated plan
+        return _parse_plan_text(plan_text), None # Return validated plan
 
     except (json.JSONDecodeError, ValueError) as e: logger.error(f"JSON plan error: {e}\nResponse:\n{plan_text}"); return None, f"Error: AI response invalid JSON ({e})."
     except Exception as e: logger.error(f"LLM plan generation error: {e}", exc_info=True); return None, f"Error generating plan: {e}"
 
 
+# Query-independent chunk summaries keyed by sha256 of the chunk, so byte-identical
+# chunks (e.g. unchanged setup steps across runs) are summarized only once
+_chunk_summary_cache = OrderedDict()
+_chunk_summary_lock = threading.Lock()
+_LOG_SECTION_RE = re.compile(r"^(?=--- Log File: .* ---$|(?:\S+\s+)?##\[group\])", re.MULTILINE)
+
+def _response_text(response):
+    """Returns (text, None) from a generate_content response, or (None, finish reason) if blocked/empty."""
+    if not response.candidates or not response.candidates[0].content.parts:
+        return None, response.candidates[0].finish_reason.name if response.candidates else "UNKNOWN"
+    return "".join(p.text for p in response.candidates[0].content.parts).strip(), None
+
+def _split_log_chunks(log_context, max_chars):
+    """
+    Splits logs on file ('--- Log File: ...') and step ('##[group]') boundaries, then
+    packs consecutive sections into chunks of at most max_chars (oversized sections
+    are split on line boundaries).
+    """
+    sections = [section for section in _LOG_SECTION_RE.split(log_context) if section.strip()]
+    pieces = []
+    for section in sections:
+        while len(section) > max_chars:
+            cut = section.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(section[:cut]); section = section[cut:]
+        pieces.append(section)
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current); current = ""
+        current += piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def _summarize_log_chunk(model_instance, chunk):
+    """Map step: summarizes one chunk (independent of the user query, so it can be cached)."""
+    key = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    with _chunk_summary_lock:
+        if key in _chunk_summary_cache:
+            _chunk_summary_cache.move_to_end(key)
+            return _chunk_summary_cache[key], True
+    chunk_context = chunk
+    if len(chunk_context) > config.LOG_ANALYSIS_MINE_THRESHOLD_CHARS:
+        with tracing.span("llm.log_mining"):
+            chunk_context, _ = log_miner.summarize_logs(chunk_context, max_chars=config.LOG_ANALYSIS_CHUNK_CHARS)
+    prompt = ("Summarize this section of CI/application logs for later analysis. List the steps or files covered, "
+              "every error, warning and failure (with timestamps and exact messages), and the final outcome. "
+              f"Be concise; omit routine lines.\nLogs:\n```\n{chunk_context}\n```\nSummary:")
+    with tracing.span("vertex.generate", kind="log_chunk_summary", prompt_chars=len(prompt)):
+        response = model_instance.generate_content(prompt, generation_config=_genai().GenerationConfig(**config.GENERATION_CONFIG_ANALYZE))
+    summary, reason = _response_text(response)
+    if summary is None:
+        return f"[Summary unavailable: {reason}]", False # Not cached, may succeed next time
+    with _chunk_summary_lock:
+        _chunk_summary_cache[key] = summary
+        while len(_chunk_summary_cache) > config.LOG_ANALYSIS_CACHE_SIZE:
+            _chunk_summary_cache.popitem(last=False)
+    return summary, False
+
+def _analyze_logs_map_reduce(model_instance, user_query, log_context):
+    """Summarizes chunks concurrently (map), then answers the query from the summaries (reduce)."""
+    chunks = _split_log_chunks(log_context, config.LOG_ANALYSIS_CHUNK_CHARS)
+    logger.info(f"Map-reduce log analysis over {len(chunks)} chunks ({len(log_context)} chars).")
+    with ThreadPoolExecutor(max_workers=config.LOG_ANALYSIS_MAP_WORKERS) as pool:
+        results = list(pool.map(tracing.propagate(lambda chunk: _summarize_log_chunk(model_instance, chunk)), chunks))
+    cached = sum(1 for _, hit in results if hit)
+    summaries = "\n\n".join(f"### Part {i + 1}/{len(chunks)}\n{summary}" for i, (summary, _) in enumerate(results))
+    prompt = (f'Analyze logs based on query. Be concise. Query: "{user_query}"\n'
+              f"The logs were too long to include, so here are summaries of consecutive parts, in order:\n\n{summaries}\n\nAnalysis:")
+    with tracing.span("vertex.generate", kind="log_analysis_reduce", prompt_chars=len(prompt)):
+        response = model_instance.generate_content(prompt, generation_config=_genai().GenerationConfig(**config.GENERATION_CONFIG_ANALYZE))
+    analysis, reason = _response_text(response)
+    if analysis is None:
+        logger.error(f"LLM log analysis (reduce) stopped/empty. Reason: {reason}"); return {"error": f"Log analysis blocked/empty ({reason})."}, 500
+    logger.info(f"Received map-reduce log analysis ({cached}/{len(chunks)} chunk summaries from cache).")
+    return {"response": analysis, "chunks": len(chunks), "cached_chunks": cached}, 200
+
 def analyze_log_data(user_query, log_lines):
-    """Analyzes log lines."""
+    """Analyzes log lines (map-reduce over chunks when they do not fit one prompt)."""
     model_instance = _get_model();
     if not model_instance: return {"error": "AI model unavailable."}, 503
     # Ensure log_lines is a single string for the prompt
@@ -210,16 +313,27 @@ def analyze_log_data(user_query, log_lines):
     else: log_context = str(log_lines) # Fallback conversion
 
     MAX_CHARS=25000
+    logs_note = ""
+    if len(log_context) > config.LOG_ANALYSIS_MINE_THRESHOLD_CHARS:
+        # Collapse repetitive lines into counted templates so rare lines are not crowded out
+        with tracing.span("llm.log_mining"):
+            mined_context, mine_stats = log_miner.summarize_logs(log_context, max_chars=MAX_CHARS)
+        if mine_stats["omitted_templates"] and len(log_context) > config.LOG_ANALYSIS_MAP_REDUCE_MIN_CHARS:
+            # Even the templates do not fit: analyze every part instead of dropping some
+            try: return _analyze_logs_map_reduce(model_instance, user_query, log_context)
+            except Exception as e: logger.error(f"LLM map-reduce log analysis error: {e}"); return {"error": f"Error analyzing logs: {e}"}, 500
+        log_context = mined_context
+        logs_note = " (repeated lines are collapsed as '[xN] template (first/last timestamps) e.g. parameters'; <*> marks a variable part)"
     if len(log_context) > MAX_CHARS: log_context = "...[TRUNCATED]\n" + log_context[-MAX_CHARS:]; logger.warning(f"Truncated logs to {MAX_CHARS} chars.")
-    prompt = f"""Analyze logs based on query. Be concise. Query: "{user_query}"\nLogs:\n```\n{log_context}\n```\nAnalysis:"""
+    prompt = f"""Analyze logs based on query. Be concise. Query: "{user_query}"\nLogs{logs_note}:\n```\n{log_context}\n```\nAnalysis:"""
     try:
         logger.info(f"Generating log analysis...")
         # Use generation config from config.py
-        response = model_instance.generate_content(prompt, generation_config=GenerationConfig(**config.GENERATION_CONFIG_ANALYZE))
-        if not response.candidates or not response.candidates.content.parts:
-             reason = response.candidates.finish_reason.name if response.candidates else "UNKNOWN"
+        with tracing.span("vertex.generate", kind="log_analysis", prompt_chars=len(prompt)):
+            response = model_instance.generate_content(prompt, generation_config=_genai().GenerationConfig(**config.GENERATION_CONFIG_ANALYZE))
+        analysis, reason = _response_text(response)
+        if analysis is None:
              logger.error(f"LLM log analysis stopped/empty. Reason: {reason}"); return {"error": f"Log analysis blocked/empty ({reason})."}, 500
-        analysis = "".join(p.text for p in response.candidates.content.parts).strip()
         logger.info("Received log analysis.")
         return {"response": analysis}, 200
     except Exception as e: logger.error(f"LLM log analysis error: {e}"); return {"error": f"Error analyzing logs: {e}"}, 500
\ No newline at end of file
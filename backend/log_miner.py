@@ -0,0 +1,207 @@
+# backend/log_miner.py
+"""
+Streaming log template miner (Drain-style) used to compress logs before LLM analysis.
+
+Lines are tokenized, variable-looking tokens (numbers, hex ids, UUIDs, URLs, paths)
+are masked, and each line is assigned to a template cluster through a fixed-depth
+parse tree keyed on token count and leading tokens. Lines that match a template
+closely enough are merged into it (differing tokens become '<*>'), so thousands of
+repetitive lines collapse into a handful of counted templates while rare lines
+survive verbatim.
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "<*>"
+
+# Timestamp prefixes produced by gcp_ops (GCF logs) and GitHub Actions run logs
+_TIMESTAMP_PATTERNS = [
+    re.compile(r"^\[(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?: UTC)?)\]\s*"),
+    re.compile(r"^(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z?)\s+"),
+]
+# Token masks, applied in order; a token matching any of them is a parameter
+_PARAM_PATTERNS = [
+    re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"), # UUID
+    re.compile(r"^https?://\S+$"),                         # URL
+    re.compile(r"^(?:0x)?[0-9a-fA-F]{7,}$"),               # Hex ids / SHAs
+    re.compile(r"^[-+]?\d+(?:[.,:]\d+)*(?:ms|s|kb|mb|b|%)?$", re.IGNORECASE), # Numbers, durations, sizes
+    re.compile(r"^(?:/[\w.\-]+){2,}/?$"),                  # Absolute paths
+]
+_SEVERITY_RE = re.compile(r"\b(ERROR|CRITICAL|FATAL|EXCEPTION|TRACEBACK|FAILED|WARN(?:ING)?)\b", re.IGNORECASE)
+
+
+def _split_timestamp(line):
+    """Returns (timestamp or None, rest of the line)."""
+    for pattern in _TIMESTAMP_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            return match.group("ts"), line[match.end():]
+    return None, line
+
+
+def _is_param(token):
+    if any(ch.isdigit() for ch in token) and not token.isalpha():
+        stripped = token.strip("'\"(),;[]")
+        if any(p.match(stripped) for p in _PARAM_PATTERNS):
+            return True
+    return token.startswith(("http://", "https://"))
+
+
+class LogCluster:
+    """One template with occurrence count, first/last occurrence and example parameters."""
+    __slots__ = ("template", "count", "first_ts", "first_line", "last_ts", "last_line", "samples")
+
+    def __init__(self, tokens, raw_tokens, ts, line):
+        self.template = list(tokens)
+        self.count = 1
+        self.first_ts, self.first_line = ts, line
+        self.last_ts, self.last_line = ts, line
+        self.samples = [raw_tokens] # Raw tokens of a few member lines, for example parameters
+
+    def similarity(self, tokens):
+        """Fraction of positions where the template token equals the line token (wildcards excluded)."""
+        same = 0; constant = 0
+        for template_token, token in zip(self.template, tokens):
+            if template_token == WILDCARD:
+                continue
+            constant += 1
+            if template_token == token:
+                same += 1
+        return same / constant if constant else 1.0
+
+    def merge(self, tokens, raw_tokens, ts, line, max_examples):
+        self.template = [t if t == token else WILDCARD for t, token in zip(self.template, tokens)]
+        self.count += 1
+        self.last_ts, self.last_line = ts, line
+        if len(self.samples) < max_examples:
+            self.samples.append(raw_tokens)
+
+    @property
+    def examples(self):
+        """Distinct values of the template's wildcard positions, one tuple per sampled line."""
+        examples = []
+        for raw_tokens in self.samples:
+            params = tuple(token for t, token in zip(self.template, raw_tokens) if t == WILDCARD)
+            if params and params not in examples:
+                examples.append(params)
+        return examples
+
+    @property
+    def text(self):
+        return " ".join(self.template)
+
+    @property
+    def is_important(self):
+        return bool(_SEVERITY_RE.search(self.first_line))
+
+
+class LogTemplateMiner:
+    """
+    Drain parse tree: token count -> first 'depth' tokens (parameters collapse to '<*>')
+    -> clusters. Only clusters in the reached leaf are compared, so adding a line costs
+    O(clusters per leaf) instead of O(all clusters).
+
+    Args:
+        similarity_threshold (float): Minimum similarity to merge a line into a cluster.
+        depth (int): Number of leading tokens used to route a line.
+        max_children (int): Branching cap per tree node; extra keys share a '<*>' branch.
+        max_examples (int): Distinct parameter examples kept per cluster.
+    """
+    def __init__(self, similarity_threshold=0.5, depth=3, max_children=100, max_examples=3):
+        self.similarity_threshold = similarity_threshold
+        self.depth = depth
+        self.max_children = max_children
+        self.max_examples = max_examples
+        self.root = {}
+        self.clusters = [] # In order of first appearance
+        self.line_count = 0
+        self.omitted = 0 # Templates left out of the last summary for lack of budget
+
+    def add_line(self, line):
+        """Adds one raw log line; returns its cluster (None for blank lines)."""
+        line = line.rstrip()
+        if not line.strip():
+            return None
+        self.line_count += 1
+        ts, message = _split_timestamp(line)
+        raw_tokens = message.split() or [message]
+        tokens = [WILDCARD if _is_param(token) else token for token in raw_tokens]
+
+        leaf = self._leaf_for(tokens)
+        best, best_score = None, -1.0
+        for cluster in leaf:
+            score = cluster.similarity(tokens)
+            if score > best_score:
+                best, best_score = cluster, score
+        if best is not None and best_score >= self.similarity_threshold:
+            best.merge(tokens, raw_tokens, ts, line, self.max_examples)
+            return best
+        cluster = LogCluster(tokens, raw_tokens, ts, line)
+        leaf.append(cluster)
+        self.clusters.append(cluster)
+        return cluster
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.add_line(line)
+        return self
+
+    def _leaf_for(self, tokens):
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth]:
+            key = token if token in node or len(node) < self.max_children else WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, []) # The None key holds the leaf's cluster list
+
+    def summarize(self, max_chars=25000):
+        """
+        Renders the clusters, in order of first appearance, as prompt-ready text:
+        single lines verbatim, repeated lines as '[xN] template' with first/last
+        timestamps and example parameters. If that exceeds max_chars, clusters with
+        error/warning keywords and rare clusters are kept first.
+        """
+        rendered = [(cluster, self._render(cluster)) for cluster in self.clusters]
+        total = sum(len(text) + 1 for _, text in rendered)
+        self.omitted = 0
+        if total > max_chars:
+            ranked = sorted(rendered, key=lambda item: (not item[0].is_important, item[0].count))
+            kept, used = set(), 0
+            for cluster, text in ranked:
+                if used + len(text) + 1 > max_chars:
+                    continue
+                kept.add(id(cluster)); used += len(text) + 1
+            dropped = self.omitted = len(rendered) - len(kept)
+            rendered = [(c, t) for c, t in rendered if id(c) in kept]
+            logger.warning(f"Log summary over budget; dropped {dropped} frequent templates.")
+            rendered.append((None, f"...[{dropped} more frequent templates omitted]"))
+        return "\n".join(text for _, text in rendered)
+
+    def _render(self, cluster):
+        if cluster.count == 1:
+            return cluster.first_line
+        text = f"[x{cluster.count}] {cluster.text}"
+        if cluster.first_ts or cluster.last_ts:
+            text += f" (first: {cluster.first_ts or '?'}, last: {cluster.last_ts or '?'})"
+        if cluster.examples:
+            text += " e.g. " + "; ".join(", ".join(params) for params in cluster.examples)
+        return text
+
+    def stats(self):
+        return {"lines": self.line_count, "templates": len(self.clusters),
+                "repeated_templates": sum(1 for c in self.clusters if c.count > 1), "omitted_templates": self.omitted}
+
+
+def summarize_logs(log_text, max_chars=25000, **miner_options):
+    """
+    Mines 'log_text' (string or list of lines) and returns (summary text, stats dict).
+    """
+    lines = log_text if isinstance(log_text, list) else str(log_text).splitlines()
+    miner = LogTemplateMiner(**miner_options).add_lines(lines)
+    summary = miner.summarize(max_chars=max_chars)
+    stats = miner.stats()
+    stats.update({"input_chars": sum(len(line) + 1 for line in lines), "summary_chars": len(summary)})
+    logger.info(f"Log miner: {stats['lines']} lines -> {stats['templates']} templates, "
+                f"{stats['input_chars']} -> {stats['summary_chars']} chars.")
+    return summary, stats
@@ -0,0 +1,301 @@
+# backend/log_search.py
+"""
+Inverted-index search over log lines (GCF function logs and extracted workflow
+step logs).
+
+Each indexed line keeps its source, step, timestamp and severity; the index maps
+every lower-cased word token to the sorted ids of the lines containing it. Term
+queries intersect posting lists (smallest first), so only candidate lines are
+touched by the regex, severity and time-range filters. Indexes of immutable
+sources (completed runs) are kept in a small LRU; others expire after a TTL.
+
+User regexes run on the request thread, so compile_regex() only accepts a subset
+without catastrophic backtracking (no nested or alternated repetition, no
+backreferences or lookarounds, few unbounded repeats), and a search stops
+scanning after LOG_SEARCH_MAX_SCAN_SECONDS.
+"""
+import logging
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+import config
+
+logger = logging.getLogger(__name__)
+
+# Cloud Logging's severity scale, lowest first; the one list every severity filter validates against
+SEVERITIES = ["DEFAULT", "DEBUG", "INFO", "NOTICE", "WARNING", "ERROR", "CRITICAL", "ALERT", "EMERGENCY"]
+_SEVERITY_RANK = {name: rank for rank, name in enumerate(SEVERITIES)}
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+_STEP_HEADER_RE = re.compile(r"^--- Log File: (?P<name>.+?) ---$")
+# '[2024-01-01 12:00:00 UTC] [ERROR] msg' (gcp_ops) and '2024-01-01T12:00:00.1234567Z msg' (Actions)
+_GCF_LINE_RE = re.compile(r"^\[(?P<date>\d{4}-\d{2}-\d{2}) (?P<time>\d{2}:\d{2}:\d{2})(?: UTC)?\]\s*\[(?P<severity>[A-Z]+)\]")
+_ACTIONS_LINE_RE = re.compile(r"^(?P<date>\d{4}-\d{2}-\d{2})T(?P<time>\d{2}:\d{2}:\d{2})(?:\.\d+)?Z?\s")
+_ACTIONS_SEVERITY_RE = re.compile(r"##\[(?P<level>error|warning|notice|debug)\]", re.IGNORECASE)
+_ACTIONS_LEVELS = {"error": "ERROR", "warning": "WARNING", "notice": "NOTICE", "debug": "DEBUG"}
+_REGEX_BOUNDS_RE = re.compile(r"\{(\d*)(,?)(\d*)\}")
+
+# Function log windows are rounded up to one of these, so cached indexes (and their build locks) stay few
+GCF_WINDOW_MINUTES = (15, 60, 6 * 60, 24 * 60, config.LOG_QUERY_MAX_WINDOW_MINUTES)
+
+
+def _tokens(text):
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def normalize_time(value):
+    """Normalizes '2024-01-01 12:00:00', '2024-01-01T12:00:00Z' etc. to 'YYYY-MM-DDTHH:MM:SS' (None if empty)."""
+    if not value:
+        return None
+    value = str(value).strip().replace(" ", "T").rstrip("Z")
+    if not re.match(r"^\d{4}-\d{2}-\d{2}(T\d{2}(:\d{2}(:\d{2})?)?)?", value):
+        raise ValueError(f"Unrecognized time '{value}'. Use ISO 8601, e.g. 2024-01-01T12:00:00Z.")
+    return value[:19]
+
+
+def gcf_window_minutes(since_minutes):
+    """Rounds a function log window (minutes) up to the nearest of GCF_WINDOW_MINUTES."""
+    for window in GCF_WINDOW_MINUTES:
+        if since_minutes <= window:
+            return window
+    return GCF_WINDOW_MINUTES[-1]
+
+
+def _regex_quantifier(pattern, i):
+    """Returns (length, unbounded) of the quantifier at pattern[i] (with any lazy/possessive suffix), or (0, False)."""
+    if i >= len(pattern):
+        return 0, False
+    char = pattern[i]
+    if char in "*+?":
+        length, unbounded = 1, char != "?"
+    elif char == "{":
+        bounds = _REGEX_BOUNDS_RE.match(pattern, i)
+        if not bounds or not (bounds.group(1) or bounds.group(3)):
+            return 0, False # A literal '{'
+        length, unbounded = len(bounds.group(0)), bool(bounds.group(2)) and not bounds.group(3)
+    else:
+        return 0, False
+    if i + length < len(pattern) and pattern[i + length] in "?+":
+        length += 1
+    return length, unbounded
+
+
+def compile_regex(pattern):
+    """
+    Compiles a user-supplied regex (case-insensitive) after checking it stays within the
+    subset that cannot backtrack catastrophically. Raises ValueError explaining a rejection.
+    """
+    if len(pattern) > config.LOG_SEARCH_MAX_REGEX_CHARS:
+        raise ValueError(f"Regex too long (max {config.LOG_SEARCH_MAX_REGEX_CHARS} characters).")
+    groups = [{"repeats": False, "alternation": False}] # Innermost last; [0] is the whole pattern
+    unbounded = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        atom_end = i + 1
+        if char == "\\":
+            if i + 1 < len(pattern) and pattern[i + 1] in "123456789":
+                raise ValueError("Backreferences are not supported in regex searches.")
+            atom_end = i + 2
+        elif char == "[":
+            j = i + 1
+            if j < len(pattern) and pattern[j] == "^": j += 1
+            if j < len(pattern) and pattern[j] == "]": j += 1
+            while j < len(pattern) and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            atom_end = j + 1
+        elif char == "(":
+            if pattern.startswith(("(?=", "(?!", "(?<=", "(?<!", "(?P=", "(?("), i):
+                raise ValueError("Lookarounds, backreferences and conditionals are not supported in regex searches.")
+            groups.append({"repeats": False, "alternation": False})
+            i += 1
+            continue
+        elif char == ")":
+            if len(groups) == 1:
+                break # Unbalanced; re.compile reports it
+            group = groups.pop()
+            length, is_unbounded = _regex_quantifier(pattern, i + 1)
+            if length and (group["repeats"] or group["alternation"]):
+                raise ValueError("Repeated groups may not contain repetition or alternation (e.g. '(a+)+' or '(a|b)*').")
+            groups[-1]["repeats"] |= group["repeats"] or bool(length)
+            unbounded += is_unbounded
+            i += 1 + length
+            continue
+        elif char == "|":
+            groups[-1]["alternation"] = True
+            i += 1
+            continue
+        length, is_unbounded = _regex_quantifier(pattern, atom_end)
+        if length:
+            groups[-1]["repeats"] = True
+            unbounded += is_unbounded
+        i = atom_end + length
+    if unbounded > config.LOG_SEARCH_MAX_REGEX_REPEATS:
+        raise ValueError(f"Too many unbounded repeats ('*', '+', '{{n,}}') in regex (max {config.LOG_SEARCH_MAX_REGEX_REPEATS}).")
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid regex: {e}")
+
+
+class LogIndex:
+    """
+    Line store plus token -> line id posting lists.
+
+    Lines are added per source with add_lines(); '--- Log File: <name> ---' header
+    lines switch the current step and are not indexed themselves. Lines without a
+    timestamp inherit the previous line's.
+    """
+    def __init__(self):
+        self.lines = []     # (source, step, line_no, timestamp, severity rank, text)
+        self.postings = {}  # token -> array('I') of line ids, ascending
+        self.built_at = time.time()
+
+    def add_lines(self, source, lines, step=None):
+        last_ts = None
+        for line_no, text in enumerate(lines, start=1):
+            text = text.rstrip("\n")
+            header = _STEP_HEADER_RE.match(text)
+            if header:
+                step, last_ts = header.group("name"), None
+                continue
+            if not text.strip():
+                continue
+            ts, severity = last_ts, "DEFAULT"
+            match = _GCF_LINE_RE.match(text)
+            if match:
+                ts, severity = f"{match.group('date')}T{match.group('time')}", match.group("severity")
+            else:
+                match = _ACTIONS_LINE_RE.match(text)
+                if match:
+                    ts = f"{match.group('date')}T{match.group('time')}"
+                level = _ACTIONS_SEVERITY_RE.search(text)
+                if level:
+                    severity = _ACTIONS_LEVELS[level.group("level").lower()]
+            last_ts = ts
+            line_id = len(self.lines)
+            self.lines.append((source, step, line_no, ts, _SEVERITY_RANK.get(severity, 0), text))
+            for token in _tokens(text):
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = array("I")
+                posting.append(line_id)
+        return self
+
+    def _candidates(self, terms):
+        """Line ids containing every term, or None when there are no terms (= all lines)."""
+        tokens = set()
+        for term in terms:
+            tokens |= _tokens(term)
+        if not tokens:
+            return None
+        postings = sorted((self.postings.get(token) for token in tokens), key=lambda p: len(p) if p else 0)
+        if not postings[0]:
+            return []
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return sorted(result)
+
+    def search(self, terms=(), regex=None, min_severity=None, since=None, until=None, offset=0, limit=50):
+        """
+        Returns {"total", "offset", "next_offset", "results", "truncated"} for lines matching
+        all filters, in log order. 'terms' match whole tokens (case-insensitive, all required);
+        'regex' (str or compiled) is searched in the line; since/until are inclusive. A scan
+        running past LOG_SEARCH_MAX_SCAN_SECONDS stops early with truncated=True.
+        """
+        pattern = re.compile(regex) if isinstance(regex, str) else regex
+        floor = _SEVERITY_RANK.get((min_severity or "DEFAULT").upper())
+        if floor is None:
+            raise ValueError(f"Unknown severity '{min_severity}'. Use one of: {', '.join(SEVERITIES)}")
+        since, until = normalize_time(since), normalize_time(until)
+        candidates = self._candidates(terms)
+        line_ids = range(len(self.lines)) if candidates is None else candidates
+
+        matches = []
+        truncated = False
+        deadline = time.monotonic() + config.LOG_SEARCH_MAX_SCAN_SECONDS
+        for scanned, line_id in enumerate(line_ids, start=1):
+            if pattern and scanned % 256 == 0 and time.monotonic() > deadline:
+                truncated = True
+                break
+            source, step, line_no, ts, severity, text = self.lines[line_id]
+            if severity < floor:
+                continue
+            if (since or until) and ts is None:
+                continue
+            if since and ts[:len(since)] < since:
+                continue
+            if until and ts[:len(until)] > until:
+                continue
+            if pattern and not pattern.search(text):
+                continue
+            matches.append(line_id)
+
+        page = matches[offset:offset + limit]
+        next_offset = offset + limit if offset + limit < len(matches) else None
+        return {
+            "total": len(matches),
+            "offset": offset,
+            "next_offset": next_offset,
+            "results": [self._result(line_id) for line_id in page],
+            "truncated": truncated,
+        }
+
+    def matching_text(self, max_lines, **filters):
+        """All matches (up to max_lines) as plain text, e.g. as pre-filtered input for LLM analysis."""
+        found = self.search(offset=0, limit=max_lines, **filters)
+        return "\n".join(r["text"] for r in found["results"]), found["total"]
+
+    def _result(self, line_id):
+        source, step, line_no, ts, severity, text = self.lines[line_id]
+        return {"source": source, "step": step, "line": line_no, "timestamp": ts,
+                "severity": SEVERITIES[severity], "text": text}
+
+    def stats(self):
+        return {"lines": len(self.lines), "tokens": len(self.postings)}
+
+
+# --- Index cache ---
+_indexes = OrderedDict() # key -> (LogIndex, immutable)
+_indexes_lock = threading.Lock()
+_build_locks = {} # key -> Lock, so concurrent searches build an index once
+
+
+def get_index(key, load_lines, immutable=False):
+    """
+    Returns the cached index for 'key', building it with load_lines() -> (source, lines, error)
+    when missing or expired. Immutable indexes never expire; others live LOG_SEARCH_INDEX_TTL_SECONDS.
+
+    Returns:
+        tuple: (LogIndex or None, error message or None)
+    """
+    with _indexes_lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        with _indexes_lock:
+            cached = _indexes.get(key)
+            if cached is not None:
+                index, is_immutable = cached
+                if is_immutable or time.time() - index.built_at < config.LOG_SEARCH_INDEX_TTL_SECONDS:
+                    _indexes.move_to_end(key)
+                    return index, None
+        source, lines, err = load_lines()
+        if err:
+            with _indexes_lock:
+                if key not in _indexes: _build_locks.pop(key, None) # Failed keys must not accumulate locks
+            return None, err
+        started = time.perf_counter()
+        index = LogIndex().add_lines(source, lines)
+        logger.info(f"Built log index {key}: {index.stats()} in {(time.perf_counter() - started) * 1000:.1f}ms.")
+        with _indexes_lock:
+            _indexes[key] = (index, immutable)
+            _indexes.move_to_end(key)
+            while len(_indexes) > config.LOG_SEARCH_INDEX_CACHE_SIZE:
+                evicted, _ = _indexes.popitem(last=False)
+                _build_locks.pop(evicted, None)
+        return index, None
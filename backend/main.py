@@ -4,19 +4,32 @@ import os
 import json
 import logging
 import re # Import regular expressions module
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from functools import wraps
-from flask import Flask, request, jsonify, make_response # Removed Response import (for SSE)
+from flask import Flask, Response, request, jsonify, make_response
 
 # --- Import Project Modules ---
 # Ensure config is imported first if it configures logging
+# Sibling modules are imported top-level, the way they import each other: a relative
+# import would load second copies (separate caches, hooks and schedulers) under the
+# package name the entry point is loaded as
 import config
-# Use relative imports for modules within the same package (backend)
-from . import gcp_ops
-from . import github_api
-from . import git_ops
-from . import llm_interface
-from . import plan_executor
-from . import firestore_ops
+import run_log_cache
+import tracing
+import gcp_ops
+import github_api
+import git_ops
+import llm_interface
+import plan_executor
+import firestore_ops
+import log_search
+import deploy_watcher
+import ci_analytics
+import jobs
 
 # --- Basic Logging Setup ---
 # Assumes config.py already configured logging
@@ -25,6 +38,14 @@ logger = logging.getLogger(__name__)
 # --- Flask App for Routing ---
 app = Flask(__name__)
 
+# --- Credential Cache Wiring ---
+# A GitHub 401 means the cached PAT was rotated or revoked: re-read it on next use
+github_api.register_auth_failure_hook(gcp_ops.invalidate_github_pat)
+if config.SECRET_PREFETCH_ON_START:
+    gcp_ops.prefetch_secrets()
+# Job states are persisted so /job_status can answer from any instance
+jobs.register_store(firestore_ops.save_job, firestore_ops.get_job)
+
 # ==============================================================================
 # Security Middleware / Decorator
 # ==============================================================================
@@ -69,6 +90,21 @@ def require_auth(f):
         return f(*args, **kwargs) # Proceed to the original function
     return decorated_function
 
+_SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def _request_conversation_id():
+    """
+    Maps the session header of an authenticated request to its conversation document.
+
+    Returns:
+        tuple: (conversation ID, error message or None). Without a session header the
+               shared conversation is used.
+    """
+    session_id = request.headers.get(config.SESSION_HEADER_NAME)
+    if session_id and not _SESSION_ID_PATTERN.fullmatch(session_id):
+        return None, f"Invalid {config.SESSION_HEADER_NAME} header."
+    return firestore_ops.session_conversation_id(session_id), None
+
 # ==============================================================================
 # CORS Handling
 # ==============================================================================
@@ -80,7 +116,7 @@ def _build_cors_preflight():
     resp.headers.update({
         'Access-Control-Allow-Origin': allowed_origin,
         'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
-        'Access-Control-Allow-Headers': f'Content-Type, {config.AUTH_HEADER_NAME}', # Allow custom header
+        'Access-Control-Allow-Headers': f'Content-Type, {config.AUTH_HEADER_NAME}, {config.SESSION_HEADER_NAME}, {config.TRACE_FORCE_HEADER_NAME}', # Allow custom headers
         'Access-Control-Max-Age': '3600',
         'Access-Control-Allow-Credentials': 'true' # Needed if frontend sends credentials
     })
@@ -105,6 +141,66 @@ def _corsify(response):
     allowed_origin = config.ALLOWED_ORIGIN or '*' # Fallback shouldn't be needed
     response.headers['Access-Control-Allow-Origin'] = allowed_origin
     response.headers['Access-Control-Allow-Credentials'] = 'true'
+    response.headers['Access-Control-Expose-Headers'] = 'Server-Timing'
+    response.headers['Timing-Allow-Origin'] = allowed_origin # Lets the page read Server-Timing via the Performance API
+    return response
+
+# ==============================================================================
+# Request Lifecycle Hooks
+# ==============================================================================
+@app.before_request
+def _start_request_trace():
+    """Starts the request's trace (sampled per TRACE_SAMPLE_RATE, or forced by the trace header)."""
+    tracing.start_trace(
+        f"{request.method} {request.path}",
+        trace_id=tracing.parse_cloud_trace_header(request.headers.get("X-Cloud-Trace-Context")),
+        force=config.TRACE_FORCE_HEADER_NAME in request.headers,
+        method=request.method, path=request.path,
+    )
+
+@app.after_request
+def _add_server_timing(response):
+    """Reports the spans recorded so far in a Server-Timing header (only the total if not sampled)."""
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.attrs["status"] = response.status_code
+        response.headers["Server-Timing"] = trace.server_timing() if trace.sampled else f"total;dur={trace.elapsed_ms():.1f}"
+    return response
+
+@app.teardown_request
+def _flush_history_buffer(exc):
+    """Persists the history messages queued during this request in one batched write, then ends its trace."""
+    try:
+        with tracing.span("firestore.history_flush"):
+            firestore_ops.flush_conversation_history()
+    except Exception:
+        logger.exception("Failed to flush buffered conversation history at request end.")
+    tracing.end_trace(error=str(exc)[:200] if exc else None)
+
+# Deferred heavy dependencies (see gcp_ops, firestore_ops, llm_interface, git_ops, ci_analytics)
+_PREWARM_MODULES = (
+    "google.cloud.secretmanager", "google.cloud.firestore", "google.cloud.logging",
+    "vertexai", "vertexai.generative_models", "git", "numpy",
+)
+_prewarm_started = threading.Event()
+
+def _prewarm_imports():
+    """Imports the deferred dependencies so later requests on this instance find them loaded."""
+    started = time.perf_counter()
+    for name in _PREWARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Pre-warm import of {name} failed (it will be retried on first use): {e}")
+    logger.info(f"Pre-warmed deferred imports in {(time.perf_counter() - started) * 1000:.0f}ms.")
+
+@app.after_request
+def _schedule_import_prewarm(response):
+    """After the first response has been sent, pre-warms the deferred imports in the background."""
+    if config.PREWARM_IMPORTS_AFTER_FIRST_REQUEST and not _prewarm_started.is_set():
+        _prewarm_started.set()
+        response.call_on_close(
+            lambda: threading.Thread(target=_prewarm_imports, name="import-prewarm", daemon=True).start())
     return response
 
 # ==============================================================================
@@ -121,21 +217,33 @@ def error_response(message, status_code):
 # Core Logic Handlers (Called by Routes)
 # ==============================================================================
 
-def _handle_modification_request(modification_request):
-    """Orchestrates the code modification process."""
+def _handle_modification_request(modification_request, conversation_id=None, job=None):
+    """
+    Orchestrates the code modification process. With a job, reports each stage through
+    job.advance() and each step through job.emit() (streamed by /job_events).
+    """
+    advance = job.advance if job else (lambda state: None)
+
+    def progress(message):
+        """Reports an intermediate step; written to history only if MODIFICATION_PROGRESS_HISTORY."""
+        if job: job.emit(message)
+        if config.MODIFICATION_PROGRESS_HISTORY:
+            firestore_ops.add_to_conversation_history(config.AGENT_NAME, message, conversation_id=conversation_id)
+
     logger.info(f"--- Handling Modification Request: {modification_request} ---")
     # ===> Confirmation: firestore_ops used for logging <===
-    firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Processing modification: '{modification_request[:100]}...'")
+    progress(f"Processing modification: '{modification_request[:100]}...'")
 
     # ===> Confirmation: gcp_ops.get_cleaned_github_pat used <===
     pat, err_pat = gcp_ops.get_cleaned_github_pat()
     if err_pat:
-        msg = f"PAT Error: {err_pat}"; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg)
+        msg = f"PAT Error: {err_pat}"; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg, conversation_id=conversation_id)
         return {"error": msg}, 500
 
     response_data = {}
     status_code = 500
     try:
+        advance("cloning")
         # ===> Confirmation: git_ops.GitRepo context manager used <===
         with git_ops.GitRepo(pat) as repo_ctx:
             # ===> Confirmation: repo_ctx.list_files used <===
@@ -145,18 +253,19 @@ def _handle_modification_request(modification_request):
             # Read content for all tracked files
             content = {}
             read_errors = []
-            for f in files:
-                 # ===> Confirmation: repo_ctx.read_file used <===
-                 file_content, err_read = repo_ctx.read_file(f)
-                 if err_read:
-                      read_errors.append(f"Error reading {f}: {err_read}")
-                      content[f] = None # Mark as unreadable
-                 else:
-                      content[f] = file_content # Store {path: content_string}
+            with tracing.span("repo.read_files", files=len(files)):
+                for f in files:
+                     # ===> Confirmation: repo_ctx.read_file used <===
+                     file_content, err_read = repo_ctx.read_file(f)
+                     if err_read:
+                          read_errors.append(f"Error reading {f}: {err_read}")
+                          content[f] = None # Mark as unreadable
+                     else:
+                          content[f] = file_content # Store {path: content_string}
 
             if read_errors:
                  logger.warning(f"Encountered errors reading some files: {read_errors}")
-                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Warning: Could not read some files: {'; '.join(read_errors)}")
+                 progress(f"Warning: Could not read some files: {'; '.join(read_errors)}")
 
             logger.info(f"Read content/status for {len(content)} tracked files.")
             # Filter out None values before passing to LLM if necessary, or let LLM know
@@ -164,35 +273,67 @@ def _handle_modification_request(modification_request):
 
 
             # ===> Confirmation: llm_interface.generate_modification_plan called with readable_content <===
-            firestore_ops.add_to_conversation_history(config.AGENT_NAME, "Generating modification plan...")
+            advance("planning")
+            progress("Generating modification plan...")
             plan, err_plan = llm_interface.generate_modification_plan(modification_request, readable_content)
             if err_plan: raise RuntimeError(f"Plan generation failed: {err_plan}")
             if not plan:
-                msg = "AI determined no changes needed or plan was empty/invalid."; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg)
+                msg = "AI determined no changes needed or plan was empty/invalid."; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg, conversation_id=conversation_id)
                 return {"response": msg, "modification_status": "No Action"}, 200
 
             # ===> Confirmation: plan_executor.execute_plan called with original 'content' <===
-            firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Validating and preparing plan ({len(plan)} ops)...")
-            changes_map, exec_warnings_errors = plan_executor.execute_plan(plan, content) # Pass original content (with potential None values)
+            progress(f"Validating and preparing plan ({len(plan)} ops)...")
+            with tracing.span("plan.execute", ops=len(plan)):
+                changes_map, exec_warnings_errors = plan_executor.execute_plan(plan, content) # Pass original content (with potential None values)
             if exec_warnings_errors:
                  logger.warning(f"Plan Execution Warnings/Errors: {exec_warnings_errors}")
-                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Plan Exec Warnings: {'; '.join(exec_warnings_errors)}")
+                 progress(f"Plan Exec Warnings: {'; '.join(exec_warnings_errors)}")
             if not changes_map:
                  msg = f"Plan execution yielded no valid changes to apply. Issues: {'; '.join(exec_warnings_errors)}"
-                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg)
+                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg, conversation_id=conversation_id)
                  return {"error": msg, "modification_status": "Execution Failed"}, 400
 
-            # ===> Confirmation: repo_ctx.apply_changes called <===
-            firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Applying changes to {len(changes_map)} files...")
-            applied, err_apply = repo_ctx.apply_changes(changes_map)
-            if err_apply: raise RuntimeError(f"Failed applying changes: {'; '.join(err_apply)}")
-            if not applied: raise RuntimeError("Apply changes step wrote no files unexpectedly.")
-            firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Applied locally: {applied}")
-
-            # ===> Confirmation: repo_ctx.commit_and_push called <===
-            commit_msg = f"{config.AGENT_NAME}: {modification_request[:100]}" # Use Agent name from config
-            firestore_ops.add_to_conversation_history(config.AGENT_NAME,"Committing & pushing...")
-            success, push_msg = repo_ctx.commit_and_push(applied, commit_msg)
+            # Apply, commit and push one modification at a time per repository; reads and planning above run in parallel
+            with git_ops.commit_lock():
+                remote_head, err_head = repo_ctx.remote_head_sha()
+                if err_head: logger.warning(f"Skipping remote head check: {err_head}")
+                if remote_head and remote_head != repo_ctx.head_sha():
+                    # Another modification was pushed after this clone: move onto it before applying
+                    progress("Remote branch moved; re-validating plan on the new head...")
+                    changes_map, err_rebase = _rebase_modification(repo_ctx, plan, content)
+                    if err_rebase: raise RuntimeError(err_rebase)
+
+                # ===> Confirmation: repo_ctx.apply_changes called <===
+                advance("applying")
+                progress(f"Applying changes to {len(changes_map)} files...")
+                applied, err_apply = repo_ctx.apply_changes(changes_map)
+                if err_apply: raise RuntimeError(f"Failed applying changes: {'; '.join(err_apply)}")
+                if not applied: raise RuntimeError("Apply changes step wrote no files unexpectedly.")
+                progress(f"Applied locally: {applied}")
+
+                # ===> Confirmation: repo_ctx.commit_and_push called <===
+                advance("pushing")
+                commit_msg = f"{config.AGENT_NAME}: {modification_request[:100]}" # Use Agent name from config
+                progress("Committing & pushing...")
+                for attempt in range(1, config.MODIFICATION_PUSH_ATTEMPTS + 1):
+                    success, push_msg = repo_ctx.commit_and_push(applied, commit_msg)
+                    if success or not repo_ctx.push_rejected or attempt == config.MODIFICATION_PUSH_ATTEMPTS:
+                        break
+                    # Pushed to from elsewhere (e.g. another instance) meanwhile: rebase the plan and retry
+                    git_ops.record_commit_event("push_retries")
+                    logger.info(f"Push rejected as non-fast-forward (attempt {attempt}); rebasing the plan onto the remote head.")
+                    progress(f"Push rejected (remote branch moved); rebasing and retrying ({attempt + 1}/{config.MODIFICATION_PUSH_ATTEMPTS})...")
+                    changes_map, err_rebase = _rebase_modification(repo_ctx, plan, content)
+                    if err_rebase:
+                        success, push_msg = False, err_rebase
+                        break
+                    applied, err_apply = repo_ctx.apply_changes(changes_map)
+                    if err_apply:
+                        success, push_msg = False, f"Failed re-applying changes after rebase: {'; '.join(err_apply)}"
+                        break
+                    if not applied:
+                        success, push_msg = False, "Re-applying changes after rebase wrote no files unexpectedly."
+                        break
             final_status = "Success" if success else "Push Failed"
             msg = f"Result: {push_msg}"
             all_warnings = exec_warnings_errors + (read_errors if read_errors else [])
@@ -216,12 +357,65 @@ def _handle_modification_request(modification_request):
         # Context manager handles cleanup
         logger.info(f"--- Finished Modification Request ---")
         final_message = response_data.get("response", response_data.get("error", "Modification process ended."))
-        firestore_ops.add_to_conversation_history(config.AGENT_NAME, final_message)
+        firestore_ops.add_to_conversation_history(config.AGENT_NAME, final_message, conversation_id=conversation_id)
 
     return response_data, status_code
 
-
-def _handle_logs(log_request_params):
+def _rebase_modification(repo_ctx, plan, base_content):
+    """
+    Moves the clone onto the remote branch head and re-validates the plan there
+    (plan_executor.rebase_plan), so a concurrent push does not waste the plan.
+    'base_content' must be the contents the plan was generated against, also on
+    later retries: the plan's line numbers refer to it, not to an earlier rebase.
+
+    Returns:
+        tuple: (changes map, error message or None)
+    """
+    _, err_reset = repo_ctx.reset_to_remote()
+    if err_reset: return None, err_reset
+    git_ops.record_commit_event("rebases")
+    new_content = {}
+    with tracing.span("repo.read_files"):
+        for path in {op.get("file_path") for op in plan if isinstance(op, dict) and op.get("file_path")}:
+            file_content, err_read = repo_ctx.read_file(path)
+            new_content[path] = None if err_read else file_content
+    with tracing.span("plan.rebase", ops=len(plan)):
+        changes_map, exec_warnings, conflicts = plan_executor.rebase_plan(plan, base_content, new_content)
+    if conflicts:
+        git_ops.record_commit_event("rebase_conflicts")
+        return None, f"Remote branch changed and the plan no longer applies cleanly: {'; '.join(conflicts)}"
+    if exec_warnings: logger.warning(f"Plan re-execution warnings after rebase: {exec_warnings}")
+    if not changes_map: return None, "Remote branch changed and the plan no longer changes anything."
+    return changes_map, None
+
+def _run_modification(modification_request, conversation_id=None):
+    """Runs a modification as a background job (MODIFICATION_JOBS_ENABLED) or within the request."""
+    if config.MODIFICATION_JOBS_ENABLED:
+        return _submit_modification_job(modification_request, conversation_id)
+    return _handle_modification_request(modification_request, conversation_id)
+
+def _submit_modification_job(modification_request, conversation_id=None):
+    """Queues a modification on the job pool and returns the job ID immediately (202)."""
+    def run(job):
+        try:
+            return _handle_modification_request(modification_request, conversation_id, job=job)
+        finally:
+            firestore_ops.flush_conversation_history() # No request teardown on worker threads
+
+    job, err = jobs.submit("modification", modification_request[:200], run, conversation_id=conversation_id)
+    if err:
+        firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Modification not started: {err}", conversation_id=conversation_id)
+        return {"error": err, "modification_status": "Rejected"}, 503
+    return {
+        "response": f"Modification queued (job {job.job_id}). Progress is reported as it runs.",
+        "events_url": f"/job_events?job_id={job.job_id}",
+        "modification_status": "Queued",
+        "job_id": job.job_id,
+        "job": job.to_dict(),
+    }, 202
+
+
+def _handle_logs(log_request_params, conversation_id=None):
     """Handles 'show logs' requests based on parsed parameters."""
     logger.info(f"Handling Log Request with params: {log_request_params}")
     src = log_request_params.get('source', 'backend_gcf')
@@ -230,12 +424,24 @@ def _handle_logs(log_request_params):
     user_query = log_request_params.get('query', '')
 
     logs_data = None
+    log_steps = None # [{"name", "bytes"}] of a cached deploy run
     err = None
     code = 200
 
-    if src == 'backend_gcf':
+    severity = str(log_request_params.get('severity') or 'INFO').upper()
+    if src == 'backend_gcf' and severity not in log_search.SEVERITIES:
+        # Also reachable from chat, where the severity comes from the LLM's parse
+        err = f"Unknown severity '{log_request_params.get('severity')}'. Use one of: {', '.join(log_search.SEVERITIES)}"
+        code = 400
+    elif src == 'backend_gcf':
         # ===> Confirmation: gcp_ops.get_gcf_logs called <===
-        logs_data, err = gcp_ops.get_gcf_logs(limit)
+        logs_data, err = gcp_ops.get_gcf_logs(
+            limit,
+            since_minutes=log_request_params.get('since_minutes'),
+            min_severity=severity,
+            text=log_request_params.get('text'),
+            exclude=log_request_params.get('exclude'),
+        )
     elif src in ['frontend_deploy', 'backend_deploy']:
         pat, err_pat = gcp_ops.get_cleaned_github_pat()
         if err_pat:
@@ -243,33 +449,33 @@ def _handle_logs(log_request_params):
         else:
             wf = config.FRONTEND_WORKFLOW_FILENAME if src == 'frontend_deploy' else config.BACKEND_WORKFLOW_FILENAME
             # ===> Confirmation: github_api calls for runs/url/content <===
-            run, err_run = github_api.get_latest_workflow_run(pat, wf)
+            if log_request_params.get('run_id'):
+                run, err_run = github_api.get_workflow_run(pat, log_request_params['run_id'])
+            else:
+                run, err_run = github_api.get_latest_workflow_run(pat, wf)
             if err_run or not run or 'id' not in run:
                 err = err_run or "No latest run found for workflow."
                 logs_data = {"status": "not_found", "message": err}
             else:
                 run_id = run['id']
-                log_info, err_log = github_api.get_workflow_log_url(pat, run_id)
-
+                log_content, err_log, log_status = github_api.get_run_log_content(pat, run)
                 if err_log:
-                    err = f"Could not get log URL: {err_log}"
-                    logs_data = {"run_info": run, "status": "error_fetching_logs", "message": err}
-                elif log_info and log_info.get('log_archive_url'):
-                    archive_url = log_info.get('log_archive_url')
-                    logger.info(f"Attempting to download logs from archive: {archive_url}")
-                    log_content, dl_err = github_api.download_and_extract_log_content(archive_url, pat)
-                    if dl_err:
-                         err = f"Failed to download/extract logs: {dl_err}"
-                         logs_data = {"run_info": run, "log_archive_url": archive_url, "status": "download_failed", "message": err}
-                    elif log_content:
-                         logger.info(f"Successfully downloaded and extracted logs for run {run_id}.")
-                         logs_data = log_content # Actual log string
-                    else:
-                         err = "Log download returned empty content."
-                         logs_data = { "run_info": run, "log_archive_url": archive_url, "status": "empty_log", "message": err}
+                    err = err_log
+                    logs_data = {"run_info": run, "status": log_status, "message": err}
                 else:
-                    err = "Log download URL not available (workflow might still be processing)."
-                    logs_data = {"run_info": run, "status": "processing", "message": err}
+                    logger.info(f"Logs for run {run_id} ready ({log_status}).")
+                    logs_data = log_content # Actual log string
+                    # Completed runs are in the run log cache, indexed by step: list them, or serve just one
+                    log_steps = run_log_cache.list_steps(run_id)
+                    step = log_request_params.get('step')
+                    if step:
+                        step_content = run_log_cache.get_step(run_id, step)
+                        if step_content is None:
+                            err = f"Step '{step}' not found in the cached logs of run {run_id} (only completed runs are indexed)."
+                            logs_data = {"status": "step_not_found", "steps": log_steps or []}
+                            code = 404
+                        else:
+                            logs_data = step_content
     else:
         err = "Invalid log source specified."
         code = 400
@@ -281,44 +487,50 @@ def _handle_logs(log_request_params):
         # ===> Confirmation: llm_interface.analyze_log_data called <===
         analysis_body, code = llm_interface.analyze_log_data(user_query, log_context_for_llm)
         response_body = analysis_body
-        firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Log Analysis: {analysis_body.get('response', analysis_body.get('error', '...'))}")
+        firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Log Analysis: {analysis_body.get('response', analysis_body.get('error', '...'))}", conversation_id=conversation_id)
     elif err:
         response_body["error"] = f"Error fetching logs: {err}"
         if isinstance(logs_data, dict): response_body.update(logs_data)
         code = 500 if code == 200 else code
-        firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Error fetching logs: {err}")
+        firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Error fetching logs: {err}", conversation_id=conversation_id)
     else:
         response_body["logs"] = logs_data
+        if log_steps is not None: response_body["steps"] = log_steps
         code = 200
         log_summary = f"Retrieved logs for {src}."
         if isinstance(logs_data, list): log_summary += f" ({len(logs_data)} lines)"
         elif isinstance(logs_data, str): log_summary += f" ({len(logs_data)} chars)"
         elif isinstance(logs_data, dict): log_summary += f" (Status: {logs_data.get('status', '?')})"
-        firestore_ops.add_to_conversation_history(config.AGENT_NAME, log_summary)
+        firestore_ops.add_to_conversation_history(config.AGENT_NAME, log_summary, conversation_id=conversation_id)
 
     return response_body, code
 
 
-def _handle_deploy(target):
+def _handle_deploy(target, conversation_id=None):
     """Handles 'deploy' requests for a specific target."""
     logger.info(f"Handling Deploy Request for target: {target}")
     wf = None
     if target == 'backend': wf = config.BACKEND_WORKFLOW_FILENAME
     elif target == 'frontend': wf = config.FRONTEND_WORKFLOW_FILENAME
     else:
-        msg = "Invalid deployment target specified."; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg) # Corrected add_to...
+        msg = "Invalid deployment target specified."; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg, conversation_id=conversation_id) # Corrected add_to...
         return {"error": msg}, 400
 
     pat, err_pat = gcp_ops.get_cleaned_github_pat()
     if err_pat:
-        msg = f"PAT Error: {err_pat}"; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg) # Corrected add_to...
+        msg = f"PAT Error: {err_pat}"; firestore_ops.add_to_conversation_history(config.AGENT_NAME, msg, conversation_id=conversation_id) # Corrected add_to...
         return {"error": msg}, 500
 
     # ===> Confirmation: github_api.trigger_workflow_dispatch called <===
+    dispatched_at = datetime.now(timezone.utc) # Used to correlate the run this dispatch creates
     success, msg = github_api.trigger_workflow_dispatch(pat, wf)
-    firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Deploy trigger ({target}): {msg}") # Corrected add_to...
+    firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"Deploy trigger ({target}): {msg}", conversation_id=conversation_id) # Corrected add_to...
     status_code = 202 if success else 500 # 202 Accepted
-    return {"message": msg, "deployment_trigger_status": "Success" if success else "Failed"}, status_code
+    response = {"message": msg, "deployment_trigger_status": "Success" if success else "Failed"}
+    if success:
+        watch = deploy_watcher.start_watch(target, wf, dispatched_at, gcp_ops.get_cleaned_github_pat)
+        response["watch_id"] = watch.watch_id
+    return response, status_code
 
 
 def _handle_status(target):
@@ -350,6 +562,37 @@ def _handle_status(target):
 
     return response, code
 
+
+def _summarize_run(run):
+    """The run fields the dashboard shows, plus its duration."""
+    keys = ("id", "run_number", "status", "conclusion", "event", "display_title", "head_sha", "html_url",
+            "created_at", "run_started_at", "updated_at")
+    summary = {key: run.get(key) for key in keys}
+    summary["duration_seconds"] = github_api.run_duration_seconds(run)
+    return summary
+
+
+def _handle_status_all(history=5):
+    """Status and recent runs of every deploy workflow, fetched concurrently with one PAT lookup."""
+    targets = {'backend': config.BACKEND_WORKFLOW_FILENAME, 'frontend': config.FRONTEND_WORKFLOW_FILENAME}
+    pat, err_pat = gcp_ops.get_cleaned_github_pat()
+    if err_pat: return {"error": f"PAT Error: {err_pat}"}, 500
+
+    def fetch(target):
+        runs, err = github_api.list_workflow_runs(pat, targets[target], per_page=history)
+        if err:
+            return target, {"status_details": {"status": "error", "error_message": err}, "error": err}
+        if not runs:
+            return target, {"status_details": {"status": "not_found"}, "runs": []}
+        recent = [_summarize_run(run) for run in runs]
+        return target, {"status_details": recent[0], "runs": recent}
+
+    # Requests share the pooled GitHub session, so the slowest target sets the latency
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        statuses = dict(pool.map(tracing.propagate(fetch), targets))
+    code = 200 if any("error" not in status for status in statuses.values()) else 500
+    return {"targets": statuses}, code
+
 # ==============================================================================
 # Flask Routes (Now ALL require auth)
 # ==============================================================================
@@ -362,14 +605,18 @@ def ecko_chat_route():
     if request.method == 'OPTIONS': return _build_cors_preflight()
 
     body, code = {"error": "Request failed"}, 500
+    conversation_id = None # Shared conversation until the session header is read
     try:
         req_json = request.get_json(silent=True)
         if not req_json or 'message' not in req_json:
             return error_response("Missing 'message' in request body", 400)
 
+        conversation_id, err_session = _request_conversation_id()
+        if err_session: return error_response(err_session, 400)
+
         msg = req_json['message'].strip()
         logger.info(f"/ecko authenticated request: '{msg[:100]}...'")
-        firestore_ops.add_to_conversation_history("User", msg)
+        firestore_ops.add_to_conversation_history("User", msg, conversation_id=conversation_id)
 
         # ===> Confirmation: Regex uses prefixes from config <===
         modify_match = re.match(rf"{config.MODIFY_CODE_PREFIX.replace(':','').strip()}\s*:(.*)", msg, re.IGNORECASE | re.DOTALL)
@@ -381,10 +628,10 @@ def ecko_chat_route():
         # ===> Confirmation: Handlers called correctly in if/elif <===
         if modify_match:
             command_details = modify_match.group(1).strip()
-            body, code = _handle_modification_request(command_details)
+            body, code = _run_modification(command_details, conversation_id)
         elif legacy_modify_match:
              command_details = legacy_modify_match.group(1).strip()
-             body, code = _handle_modification_request(command_details)
+             body, code = _run_modification(command_details, conversation_id)
         elif log_match:
             log_query = log_match.group(1).strip()
             params = {'query': log_query, 'source': 'backend_gcf', 'limit': 50, 'analyze': False}
@@ -394,11 +641,11 @@ def ecko_chat_route():
             limit_re = re.search(r'limit=(\d+)', log_query, re.IGNORECASE)
             if limit_re: params['limit'] = min(max(1, int(limit_re.group(1))), 200)
             if "analyze" in log_query.lower(): params['analyze'] = True
-            body, code = _handle_logs(params)
+            body, code = _handle_logs(params, conversation_id)
         elif deploy_match:
             deploy_target_str = deploy_match.group(1).strip().lower()
             target = 'backend' if 'backend' in deploy_target_str else 'frontend' if 'frontend' in deploy_target_str else None
-            if target: body, code = _handle_deploy(target)
+            if target: body, code = _handle_deploy(target, conversation_id)
             else: body, code = {"error": "Deploy target unclear ('backend' or 'frontend')."}, 400
         elif status_match:
             status_target_str = status_match.group(1).strip().lower()
@@ -407,17 +654,17 @@ def ecko_chat_route():
             else: body, code = {"error": "Status target unclear ('backend' or 'frontend')."}, 400
         else:
             # Normal Chat - generate response
-            history = firestore_ops.get_conversation_history()
+            history = firestore_ops.get_conversation_history(conversation_id=conversation_id)
             body, code = llm_interface.generate_chat_response(history, msg)
             if code == 200 and "response" in body:
-                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, body.get("response", "(empty AI response)"))
+                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, body.get("response", "(empty AI response)"), conversation_id=conversation_id)
             elif "error" in body:
-                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"AI Error: {body['error']}")
+                 firestore_ops.add_to_conversation_history(config.AGENT_NAME, f"AI Error: {body['error']}", conversation_id=conversation_id)
 
     except Exception as e:
         logger.exception("Unhandled /ecko error")
         body, code = {"error": "Internal server error."}, 500
-        firestore_ops.add_to_conversation_history("System", f"ERROR processing request: {e}")
+        firestore_ops.add_to_conversation_history("System", f"ERROR processing request: {e}", conversation_id=conversation_id)
 
     if not isinstance(body, dict):
         logger.warning(f"Handler for /ecko returned non-dict type: {type(body)}. Wrapping.")
@@ -485,16 +732,99 @@ def get_file_route():
 @require_auth
 def get_logs_route():
     if request.method == 'OPTIONS': return _build_cors_preflight()
+    if request.args.get('tail', '').lower() == 'true' and request.args.get('source', 'backend_gcf') == 'backend_gcf':
+        # Incremental tail: only lines newer than the client's cursor, optionally long-polling
+        limit = min(max(1, request.args.get('limit', default=50, type=int)), 200)
+        wait = min(max(0.0, request.args.get('wait', default=0.0, type=float)), config.LOG_TAIL_MAX_WAIT_SECONDS)
+        lines, cursor, reset, err = gcp_ops.tail_gcf_logs(request.args.get('cursor') or None, limit, wait_seconds=wait)
+        if err: return error_response(f"Error fetching logs: {err}", 500)
+        return _corsify(make_response(jsonify({"logs": lines, "cursor": cursor, "reset": reset}), 200))
     params = {
         'source': request.args.get('source', 'backend_gcf'),
         'limit': min(max(1, request.args.get('limit', default=50, type=int)), 200),
         'analyze': request.args.get('analyze', default=False, type=bool),
-        'query': request.args.get('query', '')
+        'query': request.args.get('query', ''),
+        # Server-side Cloud Logging filters (backend_gcf source only)
+        'severity': (request.args.get('severity') or 'INFO').upper(),
+        'text': request.args.get('text') or None,
+        # Deploy sources: a specific run instead of the latest, and one step of its log
+        'run_id': request.args.get('run_id', type=int),
+        'step': request.args.get('step') or None,
     }
+    if params['severity'] not in log_search.SEVERITIES:
+        return error_response(f"Unknown severity '{request.args.get('severity')}'. Use one of: {', '.join(log_search.SEVERITIES)}", 400)
+    since_minutes = request.args.get('since_minutes', type=float)
+    if since_minutes: params['since_minutes'] = min(max(1.0, since_minutes), config.LOG_QUERY_MAX_WINDOW_MINUTES)
+    exclude = [p for p in request.args.getlist('exclude') if p]
+    if exclude: params['exclude'] = config.LOG_QUERY_EXCLUDE_PATTERNS + exclude
     response_body, status_code = _handle_logs(params)
     return _corsify(make_response(jsonify(response_body), status_code))
 
 
+@app.route('/search_logs', methods=['GET', 'OPTIONS'])
+@require_auth
+def search_logs_route():
+    """
+    Indexed log search. 'source' is backend_gcf (function logs of the last 'since_minutes')
+    or frontend_deploy/backend_deploy (latest run, or 'run_id'). Filters: 'q' (terms, all
+    required), 'regex', 'severity' (minimum), 'since'/'until' (ISO times); paged with
+    'offset'/'limit'. With analyze=true only the matching lines are sent to the LLM.
+    """
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    src = request.args.get('source', 'backend_gcf')
+    regex = request.args.get('regex') or None
+    if regex:
+        try: regex = log_search.compile_regex(regex)
+        except ValueError as e: return error_response(str(e), 400)
+    filters = {
+        'terms': request.args.get('q', '').split(),
+        'regex': regex,
+        'min_severity': request.args.get('severity') or None,
+        'since': request.args.get('since') or None,
+        'until': request.args.get('until') or None,
+    }
+    offset = max(0, request.args.get('offset', default=0, type=int))
+    limit = min(max(1, request.args.get('limit', default=50, type=int)), 200)
+
+    if src == 'backend_gcf':
+        since_minutes = min(max(1.0, request.args.get('since_minutes', default=60.0, type=float)), config.LOG_QUERY_MAX_WINDOW_MINUTES)
+        # The index covers a rounded-up window (one cache key per bucket); 'since' trims it to the one asked for
+        window_minutes = log_search.gcf_window_minutes(since_minutes)
+        if not filters['since']:
+            filters['since'] = datetime.fromtimestamp(time.time() - since_minutes * 60, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+        def load_lines():
+            lines, err = gcp_ops.get_gcf_logs(config.LOG_SEARCH_GCF_MAX_LINES, since_minutes=window_minutes, min_severity="DEFAULT")
+            return src, lines, err
+        index, err = log_search.get_index(("gcf", window_minutes), load_lines)
+    elif src in ['frontend_deploy', 'backend_deploy']:
+        pat, err_pat = gcp_ops.get_cleaned_github_pat()
+        if err_pat: return error_response(f"PAT Error: {err_pat}", 500)
+        wf = config.FRONTEND_WORKFLOW_FILENAME if src == 'frontend_deploy' else config.BACKEND_WORKFLOW_FILENAME
+        run_id = request.args.get('run_id', type=int)
+        run, err_run = github_api.get_workflow_run(pat, run_id) if run_id else github_api.get_latest_workflow_run(pat, wf)
+        if err_run or not run: return error_response(err_run or "No latest run found for workflow.", 404)
+        def load_lines():
+            content, err, _ = github_api.get_run_log_content(pat, run)
+            return src, (content or "").splitlines(), err
+        # Logs of a completed run never change, so its index is kept until evicted
+        index, err = log_search.get_index(("run", run.get('id')), load_lines, immutable=run.get('status') == 'completed')
+    else:
+        return error_response("Invalid log source specified.", 400)
+    if err: return error_response(f"Error fetching logs: {err}", 500)
+
+    try:
+        response_body = index.search(offset=offset, limit=limit, **filters)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    response_body.update({"source": src, "indexed_lines": index.stats()["lines"]})
+    if request.args.get('analyze', '').lower() == 'true' and response_body["total"]:
+        matched_text, _ = index.matching_text(config.LOG_SEARCH_ANALYZE_MAX_LINES, **filters)
+        user_query = request.args.get('query') or "Summarize these log lines and point out any errors."
+        analysis_body, _ = llm_interface.analyze_log_data(user_query, matched_text)
+        response_body["analysis"] = analysis_body
+    return _corsify(make_response(jsonify(response_body), 200))
+
+
 @app.route('/trigger_deploy', methods=['POST', 'OPTIONS'])
 @require_auth
 def trigger_deploy_route():
@@ -517,6 +847,150 @@ def status_route():
     response_body, status_code = _handle_status(target)
     return _corsify(make_response(jsonify(response_body), status_code))
 
+
+@app.route('/deployment_statuses', methods=['GET', 'OPTIONS'])
+@require_auth
+def status_all_route():
+    """Status plus recent runs (?history=N, default 5) for every deploy target in one call."""
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    history = min(max(1, request.args.get('history', default=5, type=int)), 20)
+    response_body, status_code = _handle_status_all(history)
+    return _corsify(make_response(jsonify(response_body), status_code))
+
+
+@app.route('/ci_analytics', methods=['GET', 'OPTIONS'])
+@require_auth
+def ci_analytics_route():
+    """Deploy pipeline analytics for ?target=backend|frontend over the last ?runs=N completed runs."""
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    target = request.args.get('target')
+    if not target or target not in ['backend', 'frontend']:
+         return error_response("Invalid or missing 'target' query parameter ('backend' or 'frontend')", 400)
+    wf = config.FRONTEND_WORKFLOW_FILENAME if target == 'frontend' else config.BACKEND_WORKFLOW_FILENAME
+    max_runs = min(max(1, request.args.get('runs', default=config.CI_ANALYTICS_MAX_RUNS, type=int)), config.CI_ANALYTICS_MAX_RUNS)
+    pat, err_pat = gcp_ops.get_cleaned_github_pat()
+    if err_pat: return error_response(f"PAT Error: {err_pat}", 500)
+    analytics, err = ci_analytics.get_workflow_analytics(pat, wf, max_runs)
+    if err and not analytics.get("runs"): return error_response(f"Error fetching run history: {err}", 500)
+    response_body = {"target": target, "workflow": wf, **analytics}
+    if err: response_body["warning"] = f"Run history may be incomplete: {err}"
+    return _corsify(make_response(jsonify(response_body), 200))
+
+
+@app.route('/deploy_events', methods=['GET', 'OPTIONS'])
+@require_auth
+def deploy_events_route():
+    """
+    Long-poll for a dispatched deployment's state transitions: ?watch_id=...&after=<seq>&wait=<seconds>.
+    'unknown' means the watch lives on another instance (or expired); clients fall back to /deployment_status.
+    """
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    watch_id = request.args.get('watch_id', '')
+    if not watch_id: return error_response("Missing 'watch_id' query parameter.", 400)
+    after = request.args.get('after', default=0, type=int)
+    wait = min(max(0.0, request.args.get('wait', default=0.0, type=float)), config.DEPLOY_EVENTS_MAX_WAIT_SECONDS)
+    result = deploy_watcher.wait_for_events(watch_id, after_seq=after, wait_seconds=wait)
+    if result is None:
+        return _corsify(make_response(jsonify({"watch_id": watch_id, "events": [], "done": False, "unknown": True}), 200))
+    return _corsify(make_response(jsonify(result), 200))
+
+
+@app.route('/job_status', methods=['GET', 'OPTIONS'])
+@require_auth
+def job_status_route():
+    """
+    State and per-stage timings of a job: ?job_id=...[&after=<version>&wait=<seconds>].
+    Jobs running on this instance can be long-polled for a version newer than 'after'.
+    """
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    job_id = request.args.get('job_id', '')
+    if not job_id: return error_response("Missing 'job_id' query parameter.", 400)
+    after = request.args.get('after', default=0, type=int)
+    wait = min(max(0.0, request.args.get('wait', default=0.0, type=float)), config.JOB_STATUS_MAX_WAIT_SECONDS)
+    job, err = jobs.get_status(job_id, after_version=after, wait_seconds=wait)
+    if err: return error_response(err, 500)
+    if job is None: return error_response(f"Unknown job '{job_id}'.", 404)
+    return _corsify(make_response(jsonify(job), 200))
+
+
+@app.route('/job_events', methods=['GET', 'OPTIONS'])
+@require_auth
+def job_events_route():
+    """
+    Server-sent event stream of a job's stage changes and progress messages (with elapsed
+    times): ?job_id=...[&after=<seq>] or a Last-Event-ID header to resume. Ends after the
+    'done' event or JOB_EVENTS_STREAM_MAX_SECONDS. Only jobs running on this instance can
+    be streamed; for others (404) clients fall back to polling /job_status.
+    """
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    job_id = request.args.get('job_id', '')
+    if not job_id: return error_response("Missing 'job_id' query parameter.", 400)
+    job = jobs.get_job(job_id)
+    if job is None: return error_response(f"Job '{job_id}' is not running on this instance; poll /job_status instead.", 404)
+    after = request.args.get('after', type=int)
+    if after is None: # EventSource-style resume
+        last_id = request.headers.get('Last-Event-ID', '')
+        after = int(last_id) if last_id.isdigit() else 0
+
+    def stream():
+        seq, deadline = after, time.monotonic() + config.JOB_EVENTS_STREAM_MAX_SECONDS
+        yield "retry: 2000\n\n"
+        while time.monotonic() < deadline:
+            events, done = job.wait_events(seq, config.JOB_EVENTS_HEARTBEAT_SECONDS)
+            for event in events:
+                seq = event["seq"]
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if done and seq >= len(job.events):
+                return
+            if not events:
+                yield ": keep-alive\n\n" # Keeps proxies from closing an idle stream
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    return _corsify(response)
+
+
+@app.route('/conversation_history', methods=['GET', 'OPTIONS'])
+@require_auth
+def conversation_history_route():
+    """Returns one page of chat history (oldest-first) plus a cursor for the next older page."""
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    limit = min(max(1, request.args.get('limit', default=config.HISTORY_LIMIT, type=int)), config.HISTORY_PAGE_MAX)
+    before = request.args.get('before') or None
+    if request.args.get('scope') == 'audit':
+        # Global rollup across all sessions (newest page only)
+        messages, next_cursor = firestore_ops.get_audit_page(limit), None
+    else:
+        conversation_id, err_session = _request_conversation_id()
+        if err_session: return error_response(err_session, 400)
+        messages, next_cursor = firestore_ops.get_conversation_page(limit, before=before, conversation_id=conversation_id)
+    page = [{
+        "conversation_id": m.get("conversation_id"),
+        "sender": m.get("sender"),
+        "message": str(m.get("message", "")), # Decompresses large bodies
+        "timestamp": m["timestamp"].isoformat() if hasattr(m.get("timestamp"), "isoformat") else m.get("timestamp"),
+    } for m in messages]
+    return _corsify(make_response(jsonify({"messages": page, "next_cursor": next_cursor}), 200))
+
+@app.route('/metrics', methods=['GET', 'OPTIONS'])
+@require_auth
+def metrics_route():
+    """Returns in-process counters for this instance."""
+    if request.method == 'OPTIONS': return _build_cors_preflight()
+    body = {
+        "history_writes": firestore_ops.get_history_write_stats(),
+        "history_cache": firestore_ops.get_history_cache_stats(),
+        "secret_cache": gcp_ops.get_secret_cache_stats(),
+        "github_http_cache": github_api.get_http_cache_stats(),
+        "github_rate_limit": github_api.get_rate_limit_stats(),
+        "run_log_cache": run_log_cache.get_stats(),
+        "deploy_watches": deploy_watcher.get_stats(),
+        "jobs": jobs.get_stats(),
+        "commits": git_ops.get_commit_stats(),
+        "tracing": tracing.get_stats(),
+    }
+    return _corsify(make_response(jsonify(body), 200))
+
 # ==============================================================================
 # SSE Route (Removed)
 # ==============================================================================
@@ -0,0 +1,37 @@
+# backend/migrate_conversation_history.py
+"""
+One-shot migration of the legacy conversation document (a single 'messages' array)
+into one Firestore document per message under the messages subcollection.
+
+Run from the backend directory with the usual environment variables set:
+    python migrate_conversation_history.py --dry-run
+    python migrate_conversation_history.py
+    python migrate_conversation_history.py --delete-legacy   # also drop the old array
+
+The migration is idempotent; running it twice rewrites the same documents.
+"""
+import argparse
+import logging
+import sys
+
+import config # Validates required env vars and configures logging
+import firestore_ops
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy conversation history to the messages subcollection.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many messages would be migrated.")
+    parser.add_argument("--delete-legacy", action="store_true", help="Remove the legacy 'messages' array after copying.")
+    args = parser.parse_args()
+
+    logger.info(f"Migrating '{config.FIRESTORE_COLLECTION}/{config.CONVERSATION_DOC_ID}' -> '{config.FIRESTORE_MESSAGES_SUBCOLLECTION}' subcollection.")
+    count, error = firestore_ops.migrate_legacy_conversation(delete_legacy_field=args.delete_legacy, dry_run=args.dry_run)
+    if error:
+        logger.error(f"Migration failed: {error}")
+        return 1
+    logger.info(f"{'Would migrate' if args.dry_run else 'Migrated'} {count} messages.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,6 @@
 # backend/plan_executor.py
 import logging
+from difflib import SequenceMatcher
 import os # Keep for basic path checks if needed, but main traversal check moved
 
 # --- Operation Constants (Imported from centralized config) ---
@@ -196,4 +197,104 @@ def execute_plan(plan, current_files_content):
 
     logger.info(f"Plan execution finished. Final changes prepared for {len(final_changes_map)} files. Encountered {len(errors)} errors/warnings during execution.")
     # Return the map containing only the files whose content was actually changed or created
-    return final_changes_map, errors
\ No newline at end of file
+    return final_changes_map, errors
+
+
+def _line_map(old_lines, new_lines):
+    """Maps 1-based line numbers of unchanged lines in 'old_lines' to their number in 'new_lines'."""
+    mapping = {}
+    for tag, i1, i2, j1, _ in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                mapping[i1 + k + 1] = j1 + k + 1
+    return mapping
+
+
+def _translate_line_op(operation, old_text, new_text):
+    """
+    Returns a copy of a line-based op with its line numbers moved from 'old_text' to
+    'new_text', or None when a line it edits (or anchors an insertion to) changed.
+    """
+    old_lines, new_lines = old_text.splitlines(), new_text.splitlines()
+    mapping = _line_map(old_lines, new_lines)
+    moved = dict(operation)
+    if operation.get("operation") == OP_INSERT_LINES:
+        after = operation.get("after_line_number")
+        if not isinstance(after, int):
+            return moved # Invalid either way; execute_plan reports it
+        if after == 0:
+            if old_lines and mapping.get(1) != 1:
+                return None
+            return moved
+        if after not in mapping or (after < len(old_lines) and mapping.get(after + 1) != mapping[after] + 1):
+            return None # Insertion point no longer between the same two lines
+        moved["after_line_number"] = mapping[after]
+        return moved
+    start, end = operation.get("start_line_number"), operation.get("end_line_number")
+    if not isinstance(start, int) or not isinstance(end, int):
+        return moved
+    end = min(end, len(old_lines))
+    if start not in mapping or any(mapping.get(line) != mapping[start] + line - start for line in range(start, end + 1)):
+        return None
+    moved["start_line_number"] = mapping[start]
+    moved["end_line_number"] = mapping[start] + end - start
+    return moved
+
+
+def rebase_plan(plan, base_content, new_content):
+    """
+    Re-validates a plan made against 'base_content' for files that changed since
+    (the remote branch moved) and re-executes it against 'new_content'.
+
+    Ops on unchanged files are re-executed as they are. Line-based ops on a changed
+    file are replayed one by one with their line numbers moved to the new version
+    (like a patch applying with offsets); an op conflicts when a line it edits or
+    anchors to changed upstream. Whole-file ops on a changed file would overwrite
+    the upstream change, so they conflict.
+
+    Args:
+        plan (list): The operations originally executed.
+        base_content (dict): File contents the plan was generated against.
+        new_content (dict): Current contents of the plan's files (None = missing).
+
+    Returns:
+        tuple: (changes map or None, list of execution warnings, list of conflict messages)
+    """
+    ops_by_file = {}
+    for operation in plan:
+        if isinstance(operation, dict) and operation.get("file_path"):
+            ops_by_file.setdefault(operation["file_path"], []).append(operation)
+
+    rebased_plan, conflicts = [], []
+    for file_path, file_ops in ops_by_file.items():
+        old, new = base_content.get(file_path), new_content.get(file_path)
+        if old == new:
+            rebased_plan.extend(file_ops)
+            continue
+        if old is None or new is None or any(op.get("operation") not in (OP_INSERT_LINES, OP_DELETE_LINES, OP_REPLACE_LINES) for op in file_ops):
+            conflicts.append(f"'{file_path}' changed upstream and the plan rewrites, creates or edits a missing file.")
+            continue
+        # Replay the file's ops on both versions, translating each against the state before it
+        for operation in file_ops:
+            moved = _translate_line_op(operation, old, new)
+            if moved is None:
+                conflicts.append(f"'{file_path}': lines edited by {operation.get('operation')} changed upstream.")
+                break
+            old_changes, old_errors = execute_plan([operation], {file_path: old})
+            if old_errors: # Skipped in the original execution too
+                continue
+            new_changes, new_errors = execute_plan([moved], {file_path: new})
+            if new_errors:
+                conflicts.append(f"'{file_path}': {'; '.join(new_errors)}")
+                break
+            old, new = old_changes.get(file_path, old), new_changes.get(file_path, new)
+        else:
+            rebased_plan.append({"operation": OP_REPLACE_ENTIRE_FILE, "file_path": file_path, "new_content": new})
+    if conflicts:
+        logger.warning(f"Plan no longer applies cleanly: {conflicts}")
+        return None, [], conflicts
+
+    merged = dict(base_content)
+    merged.update({path: new_content.get(path) for path in ops_by_file})
+    changes_map, errors = execute_plan(rebased_plan, merged)
+    return changes_map, errors, []
@@ -0,0 +1,215 @@
+# backend/run_log_cache.py
+"""
+On-disk LRU cache of extracted GitHub Actions run logs, keyed by run ID.
+
+Only completed runs whose archive extracted cleanly are stored: their logs can no
+longer change, so entries never need revalidation. Each run is one UTF-8 file of extracted log text; an in-memory
+index holds, per run, the byte offsets of every step ('--- Log File: <name> ---'
+sections from github_api.download_and_extract_log_content), so a single step is
+read with one seek (/get_logs?source=backend_deploy&run_id=...&step=<name> serves one
+step; the step list comes back with every deploy log). A small JSON sidecar per run lets a new instance rebuild the
+index from files already on disk. Total size is bounded by RUN_LOG_CACHE_MAX_BYTES;
+least recently used runs are evicted first.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import config
+
+logger = logging.getLogger(__name__)
+
+_STEP_HEADER_RE = re.compile(rb"^--- Log File: (?P<name>.+?) ---\n", re.MULTILINE)
+
+_index = OrderedDict() # run_id (str) -> {"bytes": int, "steps": [(name, start, end)], "stored_at": float}
+_index_lock = threading.Lock()
+_index_loaded = False
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def _paths(run_id):
+    base = os.path.join(config.RUN_LOG_CACHE_DIR, f"run_{run_id}")
+    return base + ".log", base + ".json"
+
+
+def _index_steps(data):
+    """Returns [(step name, start byte, end byte)] for the sections of the extracted log."""
+    headers = list(_STEP_HEADER_RE.finditer(data))
+    if not headers:
+        return [("log", 0, len(data))]
+    steps = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(data)
+        name = header.group("name").decode("utf-8", errors="replace")
+        steps.append((name, header.end(), end))
+    return steps
+
+
+def _ensure_loaded():
+    """Rebuilds the index from the sidecar files on disk (once per instance). Caller holds the lock."""
+    global _index_loaded
+    if _index_loaded:
+        return
+    _index_loaded = True
+    try:
+        os.makedirs(config.RUN_LOG_CACHE_DIR, exist_ok=True)
+        entries = []
+        for name in os.listdir(config.RUN_LOG_CACHE_DIR):
+            if not (name.startswith("run_") and name.endswith(".json")):
+                continue
+            run_id = name[len("run_"):-len(".json")]
+            log_path, meta_path = _paths(run_id)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if os.path.getsize(log_path) != meta["bytes"]:
+                    raise ValueError("size mismatch")
+                meta["steps"] = [tuple(step) for step in meta["steps"]]
+                entries.append((os.path.getmtime(meta_path), run_id, meta))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Dropping unreadable run log cache entry {run_id}: {e}")
+                _remove_files(run_id)
+        for _, run_id, meta in sorted(entries, key=lambda entry: entry[0]): # Oldest first = LRU order
+            _index[run_id] = meta
+        if entries:
+            logger.info(f"Run log cache: loaded {len(entries)} runs from {config.RUN_LOG_CACHE_DIR}.")
+    except OSError as e:
+        logger.error(f"Run log cache directory unavailable: {e}")
+
+
+def _remove_files(run_id):
+    for path in _paths(run_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove cached run log file {path}: {e}")
+
+
+def _lookup(run_id):
+    """Returns the index entry for run_id (marking it recently used), or None. Caller holds the lock."""
+    _ensure_loaded()
+    meta = _index.get(str(run_id))
+    if meta is None:
+        _stats["misses"] += 1
+        return None
+    _index.move_to_end(str(run_id))
+    _stats["hits"] += 1
+    return meta
+
+
+def _read(run_id, start=0, end=None):
+    log_path, _ = _paths(run_id)
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    return data.decode("utf-8", errors="replace")
+
+
+def get(run_id):
+    """Returns the cached log text of a run, or None."""
+    if not config.RUN_LOG_CACHE_ENABLED:
+        return None
+    with _index_lock:
+        meta = _lookup(run_id)
+    if meta is None:
+        return None
+    try:
+        return _read(run_id)
+    except OSError as e:
+        logger.warning(f"Cached run log {run_id} unreadable, dropping it: {e}")
+        invalidate(run_id)
+        return None
+
+
+def get_step(run_id, step_name):
+    """Returns the cached log text of one step (by its archive file name), or None."""
+    if not config.RUN_LOG_CACHE_ENABLED:
+        return None
+    with _index_lock:
+        meta = _lookup(run_id)
+    if meta is None:
+        return None
+    for name, start, end in meta["steps"]:
+        if name == step_name:
+            try:
+                return _read(run_id, start, end).rstrip("\n")
+            except OSError as e:
+                logger.warning(f"Cached run log {run_id} unreadable, dropping it: {e}")
+                invalidate(run_id)
+                return None
+    return None
+
+
+def list_steps(run_id):
+    """Returns [{"name", "bytes"}] for the steps of a cached run, or None if it is not cached."""
+    if not config.RUN_LOG_CACHE_ENABLED:
+        return None
+    with _index_lock:
+        meta = _lookup(run_id)
+    if meta is None:
+        return None
+    return [{"name": name, "bytes": end - start} for name, start, end in meta["steps"]]
+
+
+def put(run_id, log_text):
+    """
+    Stores the extracted log text of a completed run. Returns True if it was cached.
+    Logs larger than the whole cache are not stored.
+    """
+    if not config.RUN_LOG_CACHE_ENABLED or not log_text:
+        return False
+    run_id = str(run_id)
+    data = log_text.encode("utf-8")
+    if len(data) > config.RUN_LOG_CACHE_MAX_BYTES:
+        logger.info(f"Run log {run_id} ({len(data)} bytes) is larger than the cache; not caching.")
+        return False
+    meta = {"bytes": len(data), "steps": _index_steps(data), "stored_at": time.time()}
+    log_path, meta_path = _paths(run_id)
+    with _index_lock:
+        _ensure_loaded()
+        try:
+            os.makedirs(config.RUN_LOG_CACHE_DIR, exist_ok=True)
+            # Write to temp names and rename, so a crash never leaves a half-written entry
+            for path, payload in ((log_path, data), (meta_path, json.dumps(meta).encode("utf-8"))):
+                with open(path + ".tmp", "wb") as f:
+                    f.write(payload)
+                os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"Could not cache run log {run_id}: {e}")
+            _remove_files(run_id)
+            _index.pop(run_id, None)
+            return False
+        _index[run_id] = meta
+        _index.move_to_end(run_id)
+        _stats["stores"] += 1
+        total = sum(entry["bytes"] for entry in _index.values())
+        while total > config.RUN_LOG_CACHE_MAX_BYTES and len(_index) > 1:
+            evicted_id, evicted = _index.popitem(last=False)
+            _remove_files(evicted_id)
+            total -= evicted["bytes"]
+            _stats["evictions"] += 1
+    logger.info(f"Cached run log {run_id}: {len(data)} bytes, {len(meta['steps'])} steps.")
+    return True
+
+
+def invalidate(run_id):
+    """Removes one run from the cache."""
+    with _index_lock:
+        _index.pop(str(run_id), None)
+        _remove_files(str(run_id))
+
+
+def get_stats():
+    """Returns cache counters, entry count and bytes on disk."""
+    with _index_lock:
+        stats = dict(_stats)
+        stats["runs"] = len(_index)
+        stats["bytes"] = sum(entry["bytes"] for entry in _index.values())
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+    return stats
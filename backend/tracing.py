@@ -0,0 +1,270 @@
+# backend/tracing.py
+"""
+Lightweight request tracing.
+
+A trace covers one HTTP request (or one background job); span(name) times a
+block within it: external calls (GitHub, git, Vertex AI, Firestore, Cloud
+Logging, Secret Manager) and the hot loops around them. When a trace ends it is
+written as one structured JSON log line (picked up as a jsonPayload by Cloud
+Logging, correlated with Cloud Trace when the request carried
+X-Cloud-Trace-Context), and main returns the per-name totals in a Server-Timing
+header, which browser devtools display next to the request.
+
+The current trace and span live in context variables, so spans need no explicit
+plumbing; work handed to other threads is traced only when submitted through
+propagate(). Whether a trace records spans is decided once, when it starts:
+TRACE_SAMPLE_RATE of requests are sampled (all of them when the client sends the
+TRACE_FORCE_HEADER_NAME header). Outside a sampled trace span() neither times
+nor records anything, so the instrumentation can stay in place at a low rate.
+"""
+import contextvars
+import functools
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import config
+
+logger = logging.getLogger(__name__)
+
+# Trace records are written as bare JSON lines, without the root logger's text prefix
+_trace_logger = logging.getLogger("ecko.trace")
+if not _trace_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _trace_logger.addHandler(_handler)
+    _trace_logger.setLevel(logging.INFO)
+    _trace_logger.propagate = False
+
+_current_trace = contextvars.ContextVar("ecko_trace", default=None)
+_current_span = contextvars.ContextVar("ecko_span", default=None) # Span ID of the innermost open span
+
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]") # Server-Timing metric names are HTTP tokens
+
+_stats = {"traces": 0, "sampled": 0, "spans": 0, "spans_dropped": 0}
+_stats_lock = threading.Lock()
+
+
+class Trace:
+    """Spans recorded for one request or job. Spans may be added from several threads."""
+    def __init__(self, name, trace_id=None, sampled=True, **attrs):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.linked = trace_id is not None # ID taken from the incoming request (Cloud Trace)
+        self.name = name
+        self.sampled = sampled
+        self.attrs = attrs
+        self.spans = [] # Up to TRACE_MAX_SPANS, in start order
+        self.totals = {} # span name -> [count, total ms]; covers every span, kept or not
+        self.dropped = 0
+        self._started = time.perf_counter()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+    def _new_span_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def _record(self, span_id, parent_id, name, started, duration_ms, attrs, error):
+        with self._lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += duration_ms
+            if len(self.spans) >= config.TRACE_MAX_SPANS:
+                self.dropped += 1
+                return
+            span = {"id": span_id, "parent": parent_id, "name": name,
+                    "start_ms": round((started - self._started) * 1000, 2), "duration_ms": round(duration_ms, 2)}
+            if attrs: span["attrs"] = attrs
+            if error: span["error"] = error
+            self.spans.append(span)
+
+    def server_timing(self):
+        """Server-Timing header value: one metric per span name (total time, count if repeated) plus 'total'."""
+        with self._lock:
+            totals = list(self.totals.items())
+        metrics = []
+        for name, (count, total_ms) in totals[:config.TRACE_SERVER_TIMING_MAX_METRICS]:
+            metric = f"{_TOKEN_UNSAFE.sub('_', name)};dur={total_ms:.1f}"
+            if count > 1: metric += f';desc="x{count}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(metrics)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "duration_ms": round(self.elapsed_ms(), 2),
+                "attrs": dict(self.attrs),
+                "totals": {name: {"count": count, "total_ms": round(total_ms, 2)} for name, (count, total_ms) in self.totals.items()},
+                "spans": list(self.spans),
+                "spans_dropped": self.dropped,
+            }
+
+
+class _Span:
+    """
+    A span being timed (the context manager returned by span()). set() attaches attributes
+    known only after the block ran (e.g. a status); a raised exception is recorded and re-raised.
+    """
+    __slots__ = ("trace", "name", "attrs", "span_id", "parent_id", "started", "_token")
+
+    def __init__(self, trace, name, attrs):
+        self.trace, self.name, self.attrs = trace, name, attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.span_id = self.trace._new_span_id()
+        self.parent_id = _current_span.get()
+        self._token = _current_span.set(self.span_id)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        _current_span.reset(self._token)
+        error = f"{exc_type.__name__}: {exc}"[:200] if exc_type else None
+        self.trace._record(self.span_id, self.parent_id, self.name, self.started, duration_ms, self.attrs, error)
+        return False
+
+
+class _NoopSpan:
+    """Returned by span() outside a sampled trace."""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _should_sample(force=False):
+    if not config.TRACING_ENABLED:
+        return False
+    return force or random.random() < config.TRACE_SAMPLE_RATE
+
+
+def start_trace(name, trace_id=None, force=False, sampled=None, **attrs):
+    """
+    Starts a trace in the current context (replacing any previous one) and returns it.
+    The trace records spans only if it is sampled: per TRACE_SAMPLE_RATE, always with
+    force, or as given by 'sampled' (e.g. inherited from a parent trace). See end_trace().
+    """
+    if sampled is None or not config.TRACING_ENABLED:
+        sampled = _should_sample(force)
+    trace = Trace(name, trace_id=trace_id, sampled=sampled, **attrs)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    with _stats_lock:
+        _stats["traces"] += 1
+        if trace.sampled: _stats["sampled"] += 1
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def end_trace(**attrs):
+    """Ends the current trace, logging it as structured JSON if it was sampled. Returns the trace (or None)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    _current_span.set(None)
+    trace.attrs.update(attrs)
+    if trace.sampled:
+        _log_trace(trace)
+    return trace
+
+
+@contextmanager
+def new_trace(name, **attrs):
+    """Runs a block as its own trace (e.g. a background job), restoring the caller's trace afterwards."""
+    trace_token = _current_trace.set(None)
+    span_token = _current_span.set(None)
+    try:
+        start_trace(name, **attrs)
+        yield _current_trace.get()
+    finally:
+        end_trace()
+        _current_trace.reset(trace_token)
+        _current_span.reset(span_token)
+
+
+def _log_trace(trace):
+    record = trace.to_dict()
+    with _stats_lock:
+        _stats["spans"] += sum(count for count, _ in trace.totals.values())
+        _stats["spans_dropped"] += trace.dropped
+    record["severity"] = "INFO"
+    record["message"] = f"trace {trace.name} {record['duration_ms']:.0f}ms ({len(record['spans'])} spans)"
+    if config.GCP_PROJECT_ID and trace.linked:
+        record["logging.googleapis.com/trace"] = f"projects/{config.GCP_PROJECT_ID}/traces/{trace.trace_id}"
+    try:
+        _trace_logger.info(json.dumps(record, default=str))
+    except Exception:
+        logger.exception(f"Failed to log trace {trace.trace_id}.")
+
+
+def span(name, **attrs):
+    """
+    Context manager timing the enclosed block as a span of the current trace:
+    'with tracing.span("github.request", method="GET") as s: ...; s.set(status=200)'.
+    """
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        return _NOOP_SPAN
+    return _Span(trace, name, attrs)
+
+
+def traced(name):
+    """Decorator form of span(name)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """Wraps func to run in a copy of the caller's context, so spans it records join the caller's trace."""
+    context = contextvars.copy_context()
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def parse_cloud_trace_header(value):
+    """Trace ID from an 'X-Cloud-Trace-Context: TRACE_ID/SPAN_ID;o=1' header, or None."""
+    trace_id = (value or "").split("/", 1)[0].strip()
+    return trace_id.lower() if re.fullmatch(r"[0-9a-fA-F]{32}", trace_id) else None
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({"enabled": config.TRACING_ENABLED, "sample_rate": config.TRACE_SAMPLE_RATE})
+    return stats
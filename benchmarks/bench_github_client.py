@@ -0,0 +1,187 @@
+# benchmarks/bench_github_client.py
+"""
+Benchmarks github_api._make_request against a local fake GitHub API server,
+comparing the pooled keep-alive session with a fresh connection per call, and
+checks the retry behaviour (5xx backoff, secondary rate limit Retry-After).
+
+Each iteration runs the deploy-log sequence the backend performs:
+    GET  actions/workflows/<wf>/runs    (latest run)
+    GET  actions/runs/<id>/logs         (302 to the archive, not followed)
+    GET  <archive url>                  (download_and_extract_log_content)
+
+The server reports how many TCP connections it accepted, so connection reuse is
+visible directly, independent of timing noise.
+
+Usage (from the repository root):
+    python benchmarks/bench_github_client.py --iterations 50 --latency-ms 5
+"""
+import argparse
+import io
+import json
+import logging
+import sys
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from harness import bootstrap_backend_env, summarize_latencies
+
+bootstrap_backend_env()
+
+import config       # noqa: E402  (needs the bootstrapped env)
+import github_api   # noqa: E402
+
+FAKE_PAT = "ghp_benchmark_fake_token"
+
+
+def _build_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("build/1_Setup.txt", "2024-01-01T00:00:00Z Setting up job\n" * 200)
+        archive.writestr("build/2_Deploy.txt", "2024-01-01T00:00:01Z Deploying\n" * 200)
+    return buffer.getvalue()
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    """Minimal GitHub API stand-in with per-request latency and scripted failures."""
+    daemon_threads = True
+
+    def __init__(self, latency_ms):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency_ms / 1000.0
+        self.archive = _build_archive()
+        self.connections = 0
+        self.requests = 0
+        self.failures = {} # path -> list of (status, headers) served before succeeding
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive
+    disable_nagle_algorithm = True # Headers and body are written separately
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            scripted = server.failures.get(self.path.split("?")[0])
+            failure = scripted.pop(0) if scripted else None
+        time.sleep(server.latency)
+        if failure:
+            status, headers = failure
+            return self._send(status, b'{"message": "scripted failure"}', headers=headers)
+        path = self.path.split("?")[0]
+        if path.endswith("/runs") and "/workflows/" in path:
+            body = json.dumps({"workflow_runs": [{"id": 42, "status": "completed", "conclusion": "success"}]}).encode()
+            return self._send(200, body)
+        if path.endswith("/runs/42/logs"):
+            return self._send(302, headers={"Location": f"{server.base_url}/archive/42.zip"})
+        if path == "/archive/42.zip":
+            return self._send(200, server.archive, content_type="application/zip")
+        return self._send(404, b'{"message": "Not Found"}')
+
+
+def run_sequence():
+    run, err = github_api.get_latest_workflow_run(FAKE_PAT, config.BACKEND_WORKFLOW_FILENAME)
+    if err: raise RuntimeError(err)
+    log_info, err = github_api.get_workflow_log_url(FAKE_PAT, run["id"])
+    if err: raise RuntimeError(err)
+    content, err = github_api.download_and_extract_log_content(log_info["log_archive_url"], FAKE_PAT)
+    if err: raise RuntimeError(err)
+    return content
+
+
+def measure(server, iterations, pooled):
+    """Runs the sequence 'iterations' times; unpooled mode gives every call a fresh session."""
+    original = github_api._get_session
+    if not pooled:
+        def new_session_per_call():
+            github_api._session = None # Forces a fresh session (and connection pool) every call
+            return original()
+        github_api._get_session = new_session_per_call
+    github_api._session = None
+    server.connections = 0
+    latencies = []
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run_sequence()
+            latencies.append((time.perf_counter() - started) * 1000.0)
+    finally:
+        github_api._get_session = original
+    return {"connections": server.connections, "latency": summarize_latencies(latencies)}
+
+
+def check_retries(server):
+    """5xx is retried with backoff; a 403 secondary rate limit waits for Retry-After."""
+    runs_path = f"/repos/{config.GITHUB_REPO_OWNER}/{config.GITHUB_REPO_NAME}/actions/workflows/{config.BACKEND_WORKFLOW_FILENAME}/runs"
+    results = {}
+    for name, failures in {
+        "503_then_ok": [(503, {}), (503, {})],
+        "secondary_rate_limit_then_ok": [(403, {"Retry-After": "1"})],
+        "permission_denied_not_retried": [(403, {})],
+    }.items():
+        server.failures[runs_path] = list(failures)
+        before = server.requests
+        started = time.perf_counter()
+        run, err = github_api.get_latest_workflow_run(FAKE_PAT, config.BACKEND_WORKFLOW_FILENAME)
+        results[name] = {"ok": err is None, "requests": server.requests - before,
+                         "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1)}
+        server.failures.pop(runs_path, None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Server-side latency per request.")
+    parser.add_argument("--output", help="Write the JSON results to this file.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    server = FakeGitHub(args.latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config.GITHUB_API_BASE_URL = server.base_url
+    try:
+        results = {
+            "benchmark": "github_client",
+            "iterations": args.iterations,
+            "server_latency_ms": args.latency_ms,
+            "unpooled": measure(server, args.iterations, pooled=False),
+            "pooled": measure(server, args.iterations, pooled=True),
+            "retries": check_retries(server),
+        }
+    finally:
+        server.shutdown()
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered)
+    print(rendered)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# benchmarks/bench_log_archive.py
+"""
+Measures peak memory of github_api.download_and_extract_log_content on a large
+synthetic GitHub Actions log archive, against the previous in-memory approach
+(whole zip in io.BytesIO, every member read fully with archive.read).
+
+The archive is generated once on disk (default: 200MB of uncompressed log text
+over several jobs/steps) and served by a local HTTP server. Each mode runs in a
+fresh child process so its peak RSS is not polluted by the other mode.
+
+Usage (from the repository root):
+    python benchmarks/bench_log_archive.py --size-mb 200 --members 12
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from harness import bootstrap_backend_env, peak_rss_kb
+
+bootstrap_backend_env()
+
+import github_api   # noqa: E402  (needs the bootstrapped env)
+
+FAKE_PAT = "ghp_benchmark_fake_token"
+
+
+def build_archive(path, size_mb, members):
+    """Writes a zip of 'members' step logs totalling ~size_mb of text, with an error at the end of each."""
+    per_member = size_mb * 1024 * 1024 // members
+    line = "2024-01-01T00:00:00.0000000Z [build] compiling module {n:08d} ... ok ({ms} ms)\n"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for m in range(members):
+            with archive.open(f"build/{m + 1}_Step {m + 1}.txt", "w") as member:
+                written, n = 0, 0
+                block = []
+                while written < per_member:
+                    text = line.format(n=n, ms=n % 997)
+                    block.append(text); written += len(text); n += 1
+                    if len(block) == 4096:
+                        member.write("".join(block).encode()); block = []
+                block.append(f"2024-01-01T00:10:00.0000000Z ##[error]Step {m + 1} failed: exit code 1\n")
+                member.write("".join(block).encode())
+
+
+def legacy_extract(url, max_log_size_bytes=500 * 1024):
+    """The pre-spooling implementation: whole archive in memory, whole members read before the size check."""
+    response = github_api._get_session().get(url, stream=True, timeout=60)
+    response.raise_for_status()
+    combined, total = "", 0
+    with io.BytesIO() as memory_zip:
+        for chunk in response.iter_content(chunk_size=8192):
+            memory_zip.write(chunk)
+        memory_zip.seek(0)
+        with zipfile.ZipFile(memory_zip, "r") as archive:
+            for filename in sorted(n for n in archive.namelist() if n.lower().endswith(".txt")):
+                content_bytes = archive.read(filename)
+                if total + len(content_bytes) > max_log_size_bytes:
+                    combined += "\n... [LOG TRUNCATED] ...\n"
+                    break
+                combined += f"\n--- Log File: {filename} ---\n" + content_bytes.decode("utf-8", errors="replace")
+                total += len(content_bytes)
+    return combined.strip(), None
+
+
+def run_child(mode, archive_path):
+    """Serves the archive locally, extracts it once in 'mode' and prints the measurements as JSON."""
+    logging.getLogger().setLevel(logging.WARNING)
+    directory, name = os.path.split(archive_path)
+    handler = partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/{name}"
+
+    rss_before = peak_rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    if mode == "legacy":
+        content, err = legacy_extract(url)
+    else:
+        content, err = github_api.download_and_extract_log_content(url, FAKE_PAT)
+    elapsed = time.perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    server.shutdown()
+    print(json.dumps({
+        "mode": mode,
+        "error": err,
+        "elapsed_s": round(elapsed, 3),
+        "returned_chars": len(content or ""),
+        "errors_in_output": (content or "").count("##[error]"),
+        "traced_alloc_peak_mb": round(traced_peak / 2**20, 1),
+        "peak_rss_mb": round(peak_rss_kb() / 1024, 1),
+        "baseline_rss_mb": round(rss_before / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=200, help="Uncompressed log text in the archive.")
+    parser.add_argument("--members", type=int, default=12, help="Step log files in the archive.")
+    parser.add_argument("--output", help="Write the JSON results to this file.")
+    parser.add_argument("--child", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--archive", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.archive)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="ecko_log_archive_") as tmp:
+        archive_path = os.path.join(tmp, "logs.zip")
+        print(f"Building {args.size_mb}MB synthetic log archive ...", file=sys.stderr)
+        build_archive(archive_path, args.size_mb, args.members)
+        results = {
+            "benchmark": "log_archive_extraction",
+            "uncompressed_mb": args.size_mb,
+            "archive_mb": round(os.path.getsize(archive_path) / 2**20, 1),
+            "members": args.members,
+            "modes": {},
+        }
+        for mode in ("legacy", "streaming"):
+            child = subprocess.run([sys.executable, __file__, "--child", mode, "--archive", archive_path],
+                                   capture_output=True, text=True, check=True)
+            results["modes"][mode] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered)
+    print(rendered)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
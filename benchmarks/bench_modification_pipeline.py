@@ -0,0 +1,166 @@
+# benchmarks/bench_modification_pipeline.py
+"""
+Benchmarks the stages of main._handle_modification_request against a synthetic
+repository, with a local bare repository standing in for GitHub and a fake LLM
+standing in for Vertex AI.
+
+Stages measured per iteration:
+    clone           GitRepo.__enter__ (shallow clone of the fake remote)
+    file_read       list_files + read_file for every tracked file
+    context_build   llm_interface._build_plan_context
+    plan_parse      llm_interface._parse_plan_text on the fake LLM response
+    execute_plan    plan_executor.execute_plan
+    apply_changes   GitRepo.apply_changes
+    commit_push     GitRepo.commit_and_push to the fake remote
+
+Usage (from the repository root):
+    python benchmarks/bench_modification_pipeline.py --files 200 --lines 120 --ops 1,10,50
+    python benchmarks/bench_modification_pipeline.py --save-baseline bench_baseline.json
+    python benchmarks/bench_modification_pipeline.py --compare bench_baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from harness import (
+    StageRecorder, bootstrap_backend_env, compare_to_baseline, peak_rss_kb,
+    print_comparison, save_baseline,
+)
+
+bootstrap_backend_env()
+
+import config          # noqa: E402  (needs the bootstrapped env)
+import git_ops         # noqa: E402
+import llm_interface   # noqa: E402
+import plan_executor   # noqa: E402
+from synthetic import FakeLLM, create_fake_remote, generate_files, parse_language_mix  # noqa: E402
+
+FAKE_PAT = "ghp_benchmark_fake_token"
+
+
+def run_iteration(recorder, fake_llm, push):
+    """Runs every pipeline stage once, in the same order as _handle_modification_request."""
+    with recorder.stage("clone"):
+        repo_ctx = git_ops.GitRepo(FAKE_PAT)
+        repo_ctx.__enter__()
+    try:
+        with recorder.stage("file_read"):
+            files, err_list = repo_ctx.list_files()
+            if err_list: raise RuntimeError(f"List files failed: {err_list}")
+            content = {}
+            for f in files:
+                file_content, err_read = repo_ctx.read_file(f)
+                content[f] = None if err_read else file_content
+            readable_content = {k: v for k, v in content.items() if v is not None}
+
+        with recorder.stage("context_build"):
+            llm_interface._build_plan_context(readable_content)
+
+        plan_text = fake_llm.plan_response_text(readable_content)
+        with recorder.stage("plan_parse"):
+            plan = llm_interface._parse_plan_text(plan_text)
+
+        with recorder.stage("execute_plan"):
+            changes_map, _ = plan_executor.execute_plan(plan, content)
+
+        with recorder.stage("apply_changes"):
+            applied, err_apply = repo_ctx.apply_changes(changes_map)
+            if err_apply: raise RuntimeError(f"Apply failed: {err_apply}")
+
+        if push:
+            with recorder.stage("commit_push"):
+                ok, push_msg = repo_ctx.commit_and_push(applied, f"bench: {len(plan)} ops")
+                if not ok: raise RuntimeError(push_msg)
+    finally:
+        repo_ctx.__exit__(None, None, None)
+
+
+def run_scenario(args, op_count):
+    """Runs warmup + timed iterations, then one allocation-traced iteration."""
+    language_mix = parse_language_mix(args.languages)
+    files = generate_files(args.files, args.lines, language_mix, args.seed)
+    with tempfile.TemporaryDirectory(prefix="ecko_bench_remote_") as remote_root:
+        config.GITHUB_REPO_URL_TEMPLATE = create_fake_remote(
+            remote_root, config.GITHUB_REPO_OWNER, config.GITHUB_REPO_NAME, files, branch=config.GITHUB_MAIN_BRANCH
+        )
+        fake_llm = FakeLLM(op_count, seed=args.seed)
+
+        for _ in range(args.warmup):
+            run_iteration(StageRecorder(), fake_llm, push=not args.no_push)
+
+        recorder = StageRecorder()
+        for _ in range(args.iterations):
+            run_iteration(recorder, fake_llm, push=not args.no_push)
+
+        # Allocation tracing slows everything down, so it gets a separate pass
+        tracemalloc.start()
+        alloc_recorder = StageRecorder(trace_allocations=True)
+        run_iteration(alloc_recorder, fake_llm, push=not args.no_push)
+        tracemalloc.stop()
+        recorder.allocations = alloc_recorder.allocations
+
+    return {
+        "params": {"files": args.files, "lines_per_file": args.lines, "ops": op_count,
+                   "languages": language_mix, "iterations": args.iterations, "seed": args.seed},
+        "stages": recorder.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100, help="Number of files in the synthetic repo.")
+    parser.add_argument("--lines", type=int, default=80, help="Mean lines per file.")
+    parser.add_argument("--languages", default=None, help="Language mix, e.g. 'py=0.5,js=0.3,md=0.2'.")
+    parser.add_argument("--ops", default="1,10,50", help="Comma-separated plan sizes (one scenario each).")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--no-push", action="store_true", help="Skip the commit_push stage.")
+    parser.add_argument("--output", help="Write the JSON results to this file.")
+    parser.add_argument("--save-baseline", help="Save the results as a JSON baseline.")
+    parser.add_argument("--compare", help="Compare against a saved JSON baseline.")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed p50 regression (fraction).")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {
+        "benchmark": "modification_pipeline",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": {},
+    }
+    for op_count in [int(o) for o in args.ops.split(",") if o.strip()]:
+        name = f"files{args.files}_lines{args.lines}_ops{op_count}"
+        print(f"Running scenario {name} ...", file=sys.stderr)
+        results["scenarios"][name] = run_scenario(args, op_count)
+    results["peak_rss_kb"] = peak_rss_kb()
+    results["peak_rss_children_kb"] = peak_rss_kb(children=True)
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(rendered, encoding="utf-8")
+    else:
+        print(rendered)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+        print(f"Baseline saved to {args.save_baseline}", file=sys.stderr)
+    if args.compare:
+        rows, regressions = compare_to_baseline(args.compare, results, threshold=args.threshold)
+        print("Comparison against baseline (p50):", file=sys.stderr)
+        print_comparison(rows)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
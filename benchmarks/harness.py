@@ -0,0 +1,160 @@
+# benchmarks/harness.py
+"""
+Shared helpers for the backend benchmarks: environment bootstrap, stage timing,
+percentiles, peak RSS / allocation sampling and JSON baselines.
+"""
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Dummy values so backend/config.py passes its required-variable check.
+# Nothing here talks to GCP or GitHub; real services are replaced by fakes.
+_BENCH_ENV_DEFAULTS = {
+    "GCP_PROJECT_ID": "ecko-bench",
+    "GCP_GITHUB_PAT_SECRET_NAME": "ecko-bench-pat",
+    "GITHUB_REPO_OWNER": "ecko-bench",
+    "GITHUB_REPO_NAME": "synthetic",
+    "ECKO_SHARED_SECRET": "ecko-bench-secret",
+    "ALLOWED_ORIGIN": "http://localhost",
+    "COMMIT_AUTHOR_EMAIL": "bench@localhost",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def bootstrap_backend_env():
+    """Sets dummy config env vars (if unset) and puts backend/ on sys.path."""
+    for key, value in _BENCH_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+
+def percentile(sorted_values, pct):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * (pct / 100.0)
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize_latencies(samples_ms):
+    """Returns count/mean/min/max and p50/p90/p99 for a list of millisecond samples."""
+    values = sorted(samples_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "min_ms": round(values[0], 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p90_ms": round(percentile(values, 90), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def peak_rss_kb(children=False):
+    """Peak resident set size of this process (or its waited-for children) in KiB."""
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB on Linux
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class StageRecorder:
+    """
+    Collects per-stage timings across iterations. When allocation tracing is on,
+    also records the tracemalloc peak and net allocated bytes for each stage.
+    """
+    def __init__(self, trace_allocations=False):
+        self.trace_allocations = trace_allocations
+        self.latencies = {}   # stage -> [ms, ...]
+        self.allocations = {} # stage -> [{"peak_bytes", "net_bytes"}, ...]
+        self._order = []
+
+    @contextmanager
+    def stage(self, name):
+        if name not in self.latencies:
+            self.latencies[name] = []
+            self._order.append(name)
+        if self.trace_allocations:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            if self.trace_allocations:
+                after, peak = tracemalloc.get_traced_memory()
+                self.allocations.setdefault(name, []).append(
+                    {"peak_bytes": max(0, peak - before), "net_bytes": after - before}
+                )
+            else:
+                self.latencies[name].append(elapsed_ms)
+
+    def summary(self):
+        stages = {}
+        for name in self._order:
+            entry = {"latency": summarize_latencies(self.latencies.get(name, []))}
+            allocs = self.allocations.get(name)
+            if allocs:
+                entry["alloc_peak_bytes"] = max(a["peak_bytes"] for a in allocs)
+                entry["alloc_net_bytes"] = max(a["net_bytes"] for a in allocs)
+            stages[name] = entry
+        return stages
+
+
+def save_baseline(path, results):
+    """Writes benchmark results as a JSON baseline."""
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def compare_to_baseline(baseline_path, results, threshold=0.20, metric="p50_ms", min_delta_ms=1.0):
+    """
+    Compares the stage latencies in 'results' with a saved baseline.
+
+    A stage regresses when its 'metric' grows by more than 'threshold' (fraction)
+    AND by more than 'min_delta_ms' (absolute, to ignore noise on tiny stages).
+
+    Returns:
+        tuple: (list of comparison rows, list of regression descriptions)
+    """
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    rows, regressions = [], []
+    for scenario, current in results.get("scenarios", {}).items():
+        base_scenario = baseline.get("scenarios", {}).get(scenario)
+        if not base_scenario:
+            rows.append({"scenario": scenario, "stage": "*", "note": "not in baseline"})
+            continue
+        for stage, data in current.get("stages", {}).items():
+            base_stage = base_scenario.get("stages", {}).get(stage)
+            if not base_stage:
+                continue
+            new_val = data["latency"].get(metric, 0.0)
+            old_val = base_stage["latency"].get(metric, 0.0)
+            change = (new_val - old_val) / old_val if old_val else 0.0
+            row = {"scenario": scenario, "stage": stage, "baseline": old_val, "current": new_val, "change": round(change, 4)}
+            rows.append(row)
+            if change > threshold and (new_val - old_val) > min_delta_ms:
+                regressions.append(f"{scenario}/{stage}: {metric} {old_val:.2f}ms -> {new_val:.2f}ms (+{change:.0%})")
+    return rows, regressions
+
+
+def print_comparison(rows):
+    for row in rows:
+        if "note" in row:
+            print(f"  {row['scenario']:<28} {row['note']}")
+            continue
+        print(f"  {row['scenario']:<28} {row['stage']:<16} {row['baseline']:>10.2f} -> {row['current']:>10.2f} ms ({row['change']:+.1%})")
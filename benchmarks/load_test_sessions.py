@@ -0,0 +1,110 @@
+# benchmarks/load_test_sessions.py
+"""
+Load test for per-session conversation sharding: concurrent writers append history
+messages through firestore_ops, spread over 1..N session conversations, and the
+achieved write throughput is reported per session count.
+
+With one session every writer commits to the same conversation document and is
+bound by Firestore's per-document write rate; with more sessions the writes fan
+out over independent documents and throughput should grow with the session count.
+
+Needs a Firestore endpoint. Point it at the emulator (recommended):
+    gcloud emulators firestore start --host-port=localhost:8681
+    FIRESTORE_EMULATOR_HOST=localhost:8681 python benchmarks/load_test_sessions.py --sessions 1,2,4,8
+
+or at a scratch project via GCP_PROJECT_ID and application default credentials.
+Every run writes to a fresh FIRESTORE_COLLECTION ('ecko_loadtest_<timestamp>')
+unless --collection is given.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from harness import bootstrap_backend_env, summarize_latencies
+
+bootstrap_backend_env()
+
+import config          # noqa: E402  (needs the bootstrapped env)
+import firestore_ops   # noqa: E402
+
+
+def run_scenario(session_count, writers, messages_per_writer, run_tag):
+    """Runs 'writers' threads, each committing its messages to one of 'session_count' conversations."""
+    conversation_ids = [firestore_ops.session_conversation_id(f"{run_tag}-s{session_count}-{i}") for i in range(session_count)]
+    latencies = []
+    latencies_lock = threading.Lock()
+    start_barrier = threading.Barrier(writers + 1)
+
+    def writer(index):
+        conversation_id = conversation_ids[index % session_count]
+        own_latencies = []
+        start_barrier.wait()
+        for n in range(messages_per_writer):
+            started = time.perf_counter()
+            firestore_ops.add_to_conversation_history("LoadTest", f"writer {index} message {n}", conversation_id=conversation_id)
+            own_latencies.append((time.perf_counter() - started) * 1000.0)
+        with latencies_lock:
+            latencies.extend(own_latencies)
+
+    stats_before = firestore_ops.get_history_write_stats()
+    threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(writers)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    firestore_ops.flush_conversation_history() # Retries anything re-queued after a contended commit
+    elapsed = time.perf_counter() - started
+    stats_after = firestore_ops.get_history_write_stats()
+
+    written = stats_after["messages_written"] - stats_before["messages_written"]
+    return {
+        "sessions": session_count,
+        "writers": writers,
+        "messages_written": written,
+        "failed_commits": stats_after["failed_flushes"] - stats_before["failed_flushes"],
+        "elapsed_s": round(elapsed, 3),
+        "writes_per_s": round(written / elapsed, 1) if elapsed else None,
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma-separated session counts (one scenario each).")
+    parser.add_argument("--writers", type=int, default=16, help="Concurrent writer threads.")
+    parser.add_argument("--messages", type=int, default=50, help="Messages per writer.")
+    parser.add_argument("--collection", help="Firestore collection to write to (default: a fresh one per run).")
+    parser.add_argument("--buffered", action="store_true",
+                        help="Keep the write-behind buffer on (default: every message is its own commit).")
+    args = parser.parse_args()
+
+    run_tag = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    config.FIRESTORE_COLLECTION = args.collection or f"ecko_loadtest_{run_tag}"
+    config.HISTORY_WRITE_BUFFER_ENABLED = args.buffered
+    config.HISTORY_CACHE_ENABLED = False # Measure writes only
+
+    results = {
+        "benchmark": "session_sharding",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "collection": config.FIRESTORE_COLLECTION,
+        "buffered": args.buffered,
+        "scenarios": [],
+    }
+    for session_count in [int(s) for s in args.sessions.split(",") if s.strip()]:
+        print(f"Running {args.writers} writers over {session_count} session(s) ...", file=sys.stderr)
+        results["scenarios"].append(run_scenario(session_count, args.writers, args.messages, run_tag))
+
+    baseline = results["scenarios"][0]["writes_per_s"] if results["scenarios"] else None
+    for scenario in results["scenarios"]:
+        scenario["speedup_vs_first"] = round(scenario["writes_per_s"] / baseline, 2) if baseline else None
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# benchmarks/profile_imports.py
+"""
+Profiles cold-start import time of the backend: 'import backend.main' and the
+first request served after it, each in a fresh interpreter (as on a new Cloud
+Functions instance). One run uses 'python -X importtime' to report which
+packages the startup time goes to.
+
+The heavy client libraries (Vertex AI, Firestore, Cloud Logging, Secret Manager,
+GitPython, numpy) are imported on first use; the run fails if importing the app
+loads any of them. With --compare, import/first-request p50 regressions beyond
+--threshold also fail the run.
+
+Usage (from the repository root):
+    python benchmarks/profile_imports.py --runs 7 --save-baseline import_baseline.json
+    python benchmarks/profile_imports.py --runs 7 --compare import_baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from harness import (
+    BACKEND_DIR, bootstrap_backend_env, compare_to_baseline, print_comparison, save_baseline, summarize_latencies,
+)
+
+REPO_ROOT = BACKEND_DIR.parent
+# main imports its siblings top-level, so they show up as packages of their own
+BACKEND_MODULES = {"backend"} | {path.stem for path in BACKEND_DIR.glob("*.py")}
+
+# Must stay out of 'import backend.main' (see the lazy imports in the backend modules)
+DEFERRED_MODULES = (
+    "vertexai", "google.cloud.firestore", "google.cloud.logging", "google.cloud.secretmanager", "git", "numpy",
+)
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import backend.main as main
+import_ms = (time.perf_counter() - started) * 1000
+loaded = [name for name in {deferred!r} if name in sys.modules]
+client = main.app.test_client()
+started = time.perf_counter()
+response = client.get("/metrics", headers={{"X-Ecko-Auth": "ecko-bench-secret"}})
+first_request_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{"import_ms": import_ms, "first_request_ms": first_request_ms,
+                  "status": response.status_code, "deferred_loaded": loaded}}))
+"""
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent>\s*)(?P<name>\S+)")
+
+
+def _child_env():
+    bootstrap_backend_env()
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(REPO_ROOT), str(BACKEND_DIR), env.get("PYTHONPATH", "")]).rstrip(os.pathsep)
+    env["SECRET_PREFETCH_ON_START"] = "false" # Its background thread would import Secret Manager mid-measurement
+    env["PREWARM_IMPORTS_AFTER_FIRST_REQUEST"] = "false"
+    env.pop("PYTHONDONTWRITEBYTECODE", None) # Measure with bytecode caches, as deployed
+    return env
+
+
+def _package_costs(importtime_lines):
+    """
+    Attributes -X importtime output to top-level packages: every import that enters a
+    package from outside it (e.g. github_api -> requests) adds its cumulative
+    time to that package. Returns [(cumulative_us, package)], slowest first.
+    """
+    entries, pending = [], {} # pending: depth -> [(name, index)] waiting for their parent
+    for line in importtime_lines:
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        depth = len(match.group("indent")) // 2
+        index = len(entries)
+        entries.append((match.group("name"), int(match.group("cumulative")), None))
+        for child_name, child_index in pending.pop(depth + 1, []): # Children are printed before their parent
+            entries[child_index] = (child_name, entries[child_index][1], match.group("name"))
+        pending.setdefault(depth, []).append((match.group("name"), index))
+    costs = {}
+    for name, cumulative, parent in entries:
+        package = name.split(".")[0]
+        if package in BACKEND_MODULES or (parent and parent.split(".")[0] == package):
+            continue
+        costs[package] = costs.get(package, 0) + cumulative
+    return sorted(((us, package) for package, us in costs.items()), reverse=True)
+
+
+def run_child(env, importtime=False):
+    """Runs one cold start. Returns (result dict, [(cumulative_us, package)] when importtime is set)."""
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _CHILD.format(deferred=DEFERRED_MODULES)]
+    proc = subprocess.run(cmd, env=env, cwd=str(REPO_ROOT), capture_output=True, text=True, timeout=300)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Cold-start child failed:\n{proc.stderr[-4000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, _package_costs(proc.stderr.splitlines()) if importtime else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to time (plus one -X importtime run).")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list.")
+    parser.add_argument("--output", help="Write the JSON results to this file.")
+    parser.add_argument("--save-baseline", help="Save the results as a JSON baseline.")
+    parser.add_argument("--compare", help="Compare against a saved JSON baseline.")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed p50 regression (fraction).")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0, help="Ignore regressions smaller than this.")
+    args = parser.parse_args()
+
+    env = _child_env()
+    run_child(env) # Writes the bytecode caches
+    import_ms, first_request_ms, deferred_loaded = [], [], set()
+    for i in range(args.runs):
+        result, _ = run_child(env)
+        import_ms.append(result["import_ms"])
+        first_request_ms.append(result["first_request_ms"])
+        deferred_loaded.update(result["deferred_loaded"])
+        print(f"Run {i + 1}/{args.runs}: import {result['import_ms']:.0f}ms, first request {result['first_request_ms']:.0f}ms",
+              file=sys.stderr)
+    _, packages = run_child(env, importtime=True)
+
+    results = {
+        "benchmark": "cold_start_imports",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": {
+            "cold_start": {"stages": {
+                "import_main": {"latency": summarize_latencies(import_ms)},
+                "first_request": {"latency": summarize_latencies(first_request_ms)},
+            }},
+        },
+        "deferred_loaded_at_import": sorted(deferred_loaded),
+        "top_packages": [{"package": package, "cumulative_ms": round(us / 1000, 1)} for us, package in packages[:args.top]],
+    }
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(rendered, encoding="utf-8")
+    else:
+        print(rendered)
+    print("Slowest packages imported at cold start (cumulative):", file=sys.stderr)
+    for entry in results["top_packages"]:
+        print(f"  {entry['package']:<32} {entry['cumulative_ms']:>8.1f} ms", file=sys.stderr)
+
+    failed = False
+    if deferred_loaded:
+        print(f"DEFERRED MODULES IMPORTED AT STARTUP: {', '.join(sorted(deferred_loaded))}", file=sys.stderr)
+        failed = True
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+        print(f"Baseline saved to {args.save_baseline}", file=sys.stderr)
+    if args.compare:
+        rows, regressions = compare_to_baseline(args.compare, results, threshold=args.threshold, min_delta_ms=args.min_delta_ms)
+        print("Comparison against baseline (p50):", file=sys.stderr)
+        print_comparison(rows)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# benchmarks/synthetic.py
+"""
+Synthetic inputs for the modification pipeline benchmarks: generated repositories
+(published to a local bare "remote"), generated plans and a fake LLM.
+"""
+import json
+import random
+from pathlib import Path
+
+import git
+
+# Extension -> line generator. Each generator receives (rng, index) and returns a line.
+_LANGUAGE_LINES = {
+    "py": lambda rng, i: rng.choice([
+        f"def handler_{i}(request, limit={rng.randint(1, 100)}):",
+        f"    value_{i} = compute(payload, key='k{i}')",
+        f"    logger.info(f\"Processed item {{item_{i}}}\")",
+        f"    return {{'status': 'ok', 'count': {i}}}",
+        "",
+    ]),
+    "js": lambda rng, i: rng.choice([
+        f"async function fetchItem{i}(id) {{",
+        f"    const data{i} = await callApi('/items/' + id, {{ limit: {rng.randint(1, 50)} }});",
+        f"    logger(`Loaded item ${{id}} ({i})`, 'info');",
+        "}",
+        "",
+    ]),
+    "css": lambda rng, i: rng.choice([
+        f".panel-{i} {{ margin: {rng.randint(0, 24)}px; padding: {rng.randint(0, 16)}px; }}",
+        f"#item-{i}:hover {{ color: #{rng.randint(0, 0xFFFFFF):06x}; }}",
+        "",
+    ]),
+    "md": lambda rng, i: rng.choice([
+        f"## Section {i}",
+        f"Paragraph {i} describing the behaviour of component {rng.randint(1, 40)} in detail.",
+        f"- bullet item {i}",
+        "",
+    ]),
+    "yml": lambda rng, i: rng.choice([
+        f"step_{i}:",
+        f"  name: Job step {i}",
+        f"  run: echo \"step {i}\" && sleep {rng.randint(0, 5)}",
+    ]),
+}
+
+DEFAULT_LANGUAGE_MIX = {"py": 0.4, "js": 0.25, "css": 0.1, "md": 0.15, "yml": 0.1}
+
+
+def parse_language_mix(spec):
+    """Parses 'py=0.5,js=0.3,md=0.2' into a normalized weight dict."""
+    if not spec:
+        return dict(DEFAULT_LANGUAGE_MIX)
+    mix = {}
+    for part in spec.split(","):
+        ext, _, weight = part.partition("=")
+        ext = ext.strip().lstrip(".")
+        if ext not in _LANGUAGE_LINES:
+            raise ValueError(f"Unsupported language '{ext}'. Choose from: {', '.join(sorted(_LANGUAGE_LINES))}")
+        mix[ext] = float(weight) if weight else 1.0
+    total = sum(mix.values())
+    return {ext: weight / total for ext, weight in mix.items()}
+
+
+def generate_files(file_count, lines_per_file, language_mix, seed):
+    """Returns {relative_path: content} for a synthetic project."""
+    rng = random.Random(seed)
+    extensions = list(language_mix)
+    weights = [language_mix[e] for e in extensions]
+    files = {}
+    for n in range(file_count):
+        ext = rng.choices(extensions, weights)[0]
+        line_count = max(1, int(rng.gauss(lines_per_file, lines_per_file * 0.25)))
+        path = f"pkg_{n % 8}/module_{n}.{ext}"
+        files[path] = "\n".join(_LANGUAGE_LINES[ext](rng, i) for i in range(line_count)) + "\n"
+    return files
+
+
+def create_fake_remote(root, owner, repo_name, files, branch="main"):
+    """
+    Commits 'files' into a scratch repo and publishes it as a bare repository at
+    <root>/<owner>/<repo_name>.git, which GitRepo can clone via a file:// URL template.
+
+    Returns:
+        str: A GITHUB_REPO_URL_TEMPLATE value pointing at the bare remote.
+    """
+    root = Path(root)
+    seed_dir = root / "_seed"
+    work = git.Repo.init(seed_dir)
+    work.git.symbolic_ref("HEAD", f"refs/heads/{branch}")
+    with work.config_writer() as cw:
+        cw.set_value("user", "name", "Bench Seeder").release()
+        cw.set_value("user", "email", "seed@localhost").release()
+    for rel_path, content in files.items():
+        full_path = seed_dir / rel_path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_text(content, encoding="utf-8")
+    work.index.add(list(files))
+    work.index.commit("Synthetic baseline")
+
+    bare_path = root / owner / f"{repo_name}.git"
+    bare_path.parent.mkdir(parents=True, exist_ok=True)
+    git.Repo.clone_from(str(seed_dir), str(bare_path), bare=True)
+    return f"file://{root.as_posix()}/{{owner}}/{{repo}}.git"
+
+
+def generate_plan(files_content, op_count, seed):
+    """
+    Builds a valid surgical plan with 'op_count' operations against 'files_content'.
+    Line numbers are tracked per file so that sequential ops stay within bounds,
+    mirroring how plan_executor applies them.
+    """
+    rng = random.Random(seed)
+    line_counts = {p: len(c.splitlines()) for p, c in files_content.items() if c is not None}
+    paths = sorted(line_counts)
+    plan = []
+    for i in range(op_count):
+        roll = rng.random()
+        if roll < 0.08 or not paths:
+            path = f"generated/new_file_{seed}_{i}.py"
+            body = [f"# generated {i}", "def generated():", f"    return {i}"]
+            plan.append({"operation": "create_file", "file_path": path, "new_content": "\n".join(body)})
+            line_counts[path] = len(body); paths.append(path)
+            continue
+        path = rng.choice(paths)
+        count = line_counts[path]
+        if roll < 0.12:
+            body = [f"# rewritten by op {i}"] + [f"line_{j} = {j}" for j in range(rng.randint(5, 30))]
+            plan.append({"operation": "replace_entire_file", "file_path": path, "new_content": "\n".join(body)})
+            line_counts[path] = len(body)
+        elif roll < 0.45 or count < 2:
+            new_lines = [f"inserted_{i}_{j} = True" for j in range(rng.randint(1, 6))]
+            plan.append({"operation": "insert_lines", "file_path": path, "after_line_number": rng.randint(0, count), "lines_to_insert": new_lines})
+            line_counts[path] = count + len(new_lines)
+        elif roll < 0.6:
+            start = rng.randint(1, count)
+            end = min(count, start + rng.randint(0, 3))
+            plan.append({"operation": "delete_lines", "file_path": path, "start_line_number": start, "end_line_number": end})
+            line_counts[path] = count - (end - start + 1)
+        else:
+            start = rng.randint(1, count)
+            end = min(count, start + rng.randint(0, 4))
+            replacement = [f"replaced_{i}_{j} = None" for j in range(rng.randint(1, 5))]
+            plan.append({"operation": "replace_lines", "file_path": path, "start_line_number": start, "end_line_number": end, "replacement_lines": replacement})
+            line_counts[path] = count - (end - start + 1) + len(replacement)
+    return plan
+
+
+class FakeLLM:
+    """Stands in for Vertex AI: returns a synthetic plan formatted like a model response."""
+    def __init__(self, op_count, seed=0):
+        self.op_count = op_count
+        self.seed = seed
+        self.calls = 0
+
+    def plan_response_text(self, files_content):
+        self.calls += 1
+        plan = generate_plan(files_content, self.op_count, self.seed + self.calls)
+        return "```json\n" + json.dumps(plan, indent=2) + "\n```"
@@ -8,6 +8,10 @@ document.addEventListener('DOMContentLoaded', () => {
     // Header name for API calls (as defined in backend/config.py)
     // ===> Confirmation: AUTH_HEADER_NAME matches config <===
     const AUTH_HEADER_NAME = 'X-Ecko-Auth'; // Should match backend
+    // Per-tab session ID: each tab keeps its own conversation on the backend
+    const SESSION_HEADER_NAME = 'X-Ecko-Session'; // Should match backend
+    // Stop following a modification job after this long (the backend also fails jobs whose instance went away)
+    const JOB_WATCH_TIMEOUT_MS = 20 * 60 * 1000;
 
     // --- State ---
     // Use sessionStorage to remember authentication *during the session* only.
@@ -16,6 +20,12 @@ document.addEventListener('DOMContentLoaded', () => {
     // needed for sending the header. Cleared on session end/failure.
     // ===> Confirmation: sessionAuthSecret stores password for session <===
     let sessionAuthSecret = null;
+    // sessionStorage is scoped to the tab, so reloads keep the conversation but new tabs get a new one
+    let sessionId = sessionStorage.getItem('eckoSessionId');
+    if (!sessionId) {
+        sessionId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+        sessionStorage.setItem('eckoSessionId', sessionId);
+    }
     // SSE connection placeholder
     let eventSource = null;
 
@@ -70,6 +80,19 @@ document.addEventListener('DOMContentLoaded', () => {
         p.appendChild(document.createTextNode(` ${message}`)); // Add space after sender
         chatbox.appendChild(p); scrollToBottom(chatbox);
     };
+    // Builds a chat line for stored history (no auto-scroll; caller decides placement)
+    const buildHistoryMessage = (msg) => {
+        const p = document.createElement('p');
+        const sender = msg.sender === 'User' ? 'Εσύ' : (msg.sender || 'System');
+        p.dataset.sender = sender; p.dataset.type = 'history';
+        p.style.whiteSpace = 'pre-wrap';
+        const strong = document.createElement('strong');
+        strong.textContent = sender;
+        p.appendChild(strong);
+        p.appendChild(document.createTextNode(` ${msg.message}`));
+        if (msg.timestamp) p.title = msg.timestamp;
+        return p;
+    };
 
     // --- Authentication ---
     function handlePasswordSubmit() {
@@ -170,7 +193,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // --- API Call Wrapper ---
-    async function callEckoApi(endpoint, method = 'GET', body = null) {
+    async function callEckoApi(endpoint, method = 'GET', body = null, { background = false } = {}) {
         // ===> Confirmation: Placeholder URL check exists <===
         if (ECKO_BACKEND_BASE_URL === '__BACKEND_URL_PLACEHOLDER__') {
              const configErrorMsg = "Σφάλμα Ρύθμισης Frontend: Το URL του Backend δεν έχει οριστεί (placeholder). Εκτελέστε ξανά το deploy του frontend.";
@@ -200,11 +223,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // ===> Confirmation: Auth header added AFTER check, using AUTH_HEADER_NAME <===
         options.headers[AUTH_HEADER_NAME] = sessionAuthSecret;
+        options.headers[SESSION_HEADER_NAME] = sessionId;
 
         if (body && options.method !== 'GET') options.body = JSON.stringify(body);
 
         logger(`API Call: ${options.method} ${url} (Auth Header Sent: Yes)`, 'api');
-        showLoading(deployLoading, `Calling ${endpoint}...`); // Use a generic indicator
+        if (!background) showLoading(deployLoading, `Calling ${endpoint}...`); // Use a generic indicator (not for long-polls)
 
         try {
             const response = await fetch(url, options);
@@ -265,7 +289,7 @@ document.addEventListener('DOMContentLoaded', () => {
             // Re-throw for caller's specific handling if needed
             throw error;
         } finally {
-            hideLoading(deployLoading);
+            if (!background) hideLoading(deployLoading);
         }
     }
 
@@ -286,7 +310,8 @@ document.addEventListener('DOMContentLoaded', () => {
              else addChatMessage('System', 'Ecko returned empty/unexpected response.', 'warn');
 
             // Display action feedback
-            if(data?.modification_status) {
+            if (data?.job_id) followJob(data.job_id); // Modification runs as a background job; stream its progress
+            else if(data?.modification_status) {
                 const statusType = data.modification_status.toLowerCase().includes("success") ? 'success' : 'error';
                 addChatMessage('System', `Modification: ${data.modification_status} (${data.details || 'No details'})`, statusType);
                 if (statusType === 'success' && isAuthenticated) fetchFileList(); // Refresh file list on success
@@ -303,11 +328,40 @@ document.addEventListener('DOMContentLoaded', () => {
     const API_ENDPOINTS = { // Define endpoints for clarity
         listFiles: '/list_files',
         getFileContent: '/get_file_content', // Needs ?path=...
-        getLogs: '/get_logs', // Needs ?source=...&limit=...[&run_id=...]
+        getLogs: '/get_logs', // Needs ?source=...&limit=...[&run_id=...]; backend_gcf also supports &tail=true&cursor=...&wait=...
         triggerDeploy: '/trigger_deploy', // Needs POST {target: ...}
-        deployStatus: '/deployment_status' // Needs ?target=...
+        deployStatus: '/deployment_status', // Needs ?target=...
+        deployStatuses: '/deployment_statuses', // All targets + recent runs (optional ?history=N)
+        deployEvents: '/deploy_events', // Needs ?watch_id=...&after=<seq>&wait=<seconds> (long-poll)
+        jobStatus: '/job_status', // Needs ?job_id=...&after=<version>&wait=<seconds> (long-poll)
+        jobEvents: '/job_events', // Needs ?job_id=...&after=<seq> (server-sent event stream, read with fetch)
+        conversationHistory: '/conversation_history' // Optional ?limit=...&before=<cursor>
     };
 
+    // --- Conversation History (cursor-paginated, oldest page loaded last) ---
+    let historyCursor = null; // Cursor for the next *older* page; null when exhausted
+    let historyLoading = false;
+    let historyLoadedOnce = false;
+    async function fetchConversationHistory(loadOlder = false) {
+        if (historyLoading || (loadOlder && !historyCursor)) return;
+        historyLoading = true;
+        try {
+            const query = loadOlder ? `?before=${encodeURIComponent(historyCursor)}` : '';
+            const data = await callEckoApi(`${API_ENDPOINTS.conversationHistory}${query}`);
+            const messages = data?.messages || [];
+            historyCursor = data?.next_cursor || null;
+            if (!messages.length) return;
+            const fragment = document.createDocumentFragment();
+            messages.forEach(m => fragment.appendChild(buildHistoryMessage(m)));
+            // Keep the viewport anchored when prepending older messages
+            const previousHeight = chatbox.scrollHeight;
+            chatbox.insertBefore(fragment, chatbox.firstChild);
+            if (loadOlder) chatbox.scrollTop += chatbox.scrollHeight - previousHeight;
+            else scrollToBottom(chatbox);
+        } catch (e) { logger(`History load failed: ${e.message}`, 'warn'); }
+        finally { historyLoading = false; }
+    }
+
     async function fetchFileList() {
         showLoading(fileLoading); fileExplorer.innerHTML = '';
         try {
@@ -346,11 +400,47 @@ document.addEventListener('DOMContentLoaded', () => {
         finally { hideLoading(document.getElementById('file-content-loading')); }
     }
 
+    // --- Live log tail (backend_gcf only) ---
+    // After the initial page the panel long-polls for lines newer than the last cursor
+    let logTailCursor = null;
+    let logTailGeneration = 0; // Bumped on every full reload so older poll loops exit
+
+    function appendLogLines(lines, maxLines) {
+        const atBottom = logViewerCode.parentElement.scrollHeight - logViewerCode.parentElement.scrollTop - logViewerCode.parentElement.clientHeight < 20;
+        const current = logViewerCode.textContent && !logViewerCode.textContent.startsWith('(') ? logViewerCode.textContent.split('\n') : [];
+        logViewerCode.textContent = current.concat(lines).slice(-maxLines).join('\n');
+        if (atBottom) logViewerCode.parentElement.scrollTop = logViewerCode.parentElement.scrollHeight;
+    }
+
+    async function pollLogTail(generation) {
+        while (generation === logTailGeneration && isAuthenticated && logSourceSelect.value === 'backend_gcf') {
+            if (document.hidden) { // Background tabs do not hold a long-poll (and an instance slot) open
+                await new Promise(resolve => document.addEventListener('visibilitychange', resolve, { once: true }));
+                continue;
+            }
+            const limit = logLimitInput.value;
+            const cursorParam = logTailCursor ? `&cursor=${encodeURIComponent(logTailCursor)}` : '';
+            try {
+                const data = await callEckoApi(`${API_ENDPOINTS.getLogs}?source=backend_gcf&tail=true&wait=20&limit=${limit}${cursorParam}`, 'GET', null, { background: true });
+                if (generation !== logTailGeneration) return; // A reload started while we waited
+                if (data?.reset) logViewerCode.textContent = '';
+                if (data?.logs?.length) appendLogLines(data.logs, limit);
+                logTailCursor = data?.cursor || logTailCursor;
+            } catch (e) { logger(`Live log tail stopped: ${e.message}`, 'warn'); return; }
+        }
+    }
+
     async function fetchLogs() {
         showLoading(logLoading); logViewerCode.textContent = '';
         const source = logSourceSelect.value; const limit = logLimitInput.value;
+        const generation = ++logTailGeneration; logTailCursor = null;
         try {
-            const data = await callEckoApi(`${API_ENDPOINTS.getLogs}?source=${source}&limit=${limit}`); // Auth handled by wrapper
+            const tailParam = source === 'backend_gcf' ? '&tail=true' : '';
+            const data = await callEckoApi(`${API_ENDPOINTS.getLogs}?source=${source}&limit=${limit}${tailParam}`); // Auth handled by wrapper
+            if (tailParam && generation === logTailGeneration) {
+                logTailCursor = data?.cursor || null;
+                pollLogTail(generation); // Runs in the background until the source or limit changes
+            }
 
             // ===> Confirmation: Handles various log response structures <===
             if (data?.logs) { // Primary field for log content (string or array)
@@ -383,11 +473,147 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const data = await callEckoApi(API_ENDPOINTS.triggerDeploy, 'POST', { target }); // Auth handled by wrapper
             addChatMessage('System', data?.message || `Trigger request for ${target} sent.`, data?.deployment_trigger_status === 'Success' ? 'success' : 'info');
-            setTimeout(() => { fetchDeploymentStatus(target); }, 4000); // Refresh status after delay
+            if (data?.watch_id) watchDeployment(target, data.watch_id); // Server pushes the dispatched run's transitions
+            else fetchDeploymentStatus(target);
         } catch(e){ /* Error handled by callEckoApi */ }
         finally { hideLoading(deployLoading); deployBackendBtn.disabled = false; deployFrontendBtn.disabled = false; }
     }
 
+    // --- Modification jobs: live progress stream (/job_events), long-poll of /job_status as fallback ---
+    function renderJobResult(job) { // job: a /job_status body or the 'done' stream event
+        const result = job.result || {};
+        const timings = (job.stages || []).filter(st => st.stage !== 'done').map(st => `${st.stage} ${((st.duration_ms || 0) / 1000).toFixed(1)}s`).join(', ');
+        if (result.response) addChatMessage('Ecko', result.response);
+        const status = result.modification_status || (result.error ? 'Failed' : 'Done');
+        const statusType = status.toLowerCase().includes('success') ? 'success' : (result.error ? 'error' : 'info');
+        const elapsed = job.elapsed_ms != null ? ` in ${(job.elapsed_ms / 1000).toFixed(1)}s` : '';
+        addChatMessage('System', `Modification: ${status}${result.error ? ` (${result.error})` : ''}${elapsed}${timings ? ` [${timings}]` : ''}`, statusType);
+        if (statusType === 'success') fetchFileList(); // Refresh file list on success
+    }
+
+    function jobWatchExpired(jobId, deadline) {
+        if (Date.now() < deadline) return false;
+        addChatMessage('System', `Stopped following modification job ${jobId} after ${JOB_WATCH_TIMEOUT_MS / 60000} minutes; check the repository or deploy status.`, 'warn');
+        return true;
+    }
+
+    async function followJob(jobId) {
+        let after = 0;
+        const deadline = Date.now() + JOB_WATCH_TIMEOUT_MS;
+        try {
+            // fetch() instead of EventSource so the auth header can be sent; the stream ends after 'done'
+            while (isAuthenticated && !jobWatchExpired(jobId, deadline)) {
+                const response = await fetch(`${ECKO_BACKEND_BASE_URL}${API_ENDPOINTS.jobEvents}?job_id=${encodeURIComponent(jobId)}&after=${after}`, {
+                    headers: { [AUTH_HEADER_NAME]: sessionAuthSecret, [SESSION_HEADER_NAME]: sessionId }, mode: 'cors' });
+                if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`); // e.g. job on another instance
+                const reader = response.body.getReader(); const decoder = new TextDecoder(); let buffer = '';
+                for (;;) {
+                    const { value, done } = await reader.read();
+                    if (done) break; // Server closed (max stream time): reconnect after the last seen event
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                        const block = buffer.slice(0, boundary); buffer = buffer.slice(boundary + 2);
+                        const data = block.split('\n').filter(l => l.startsWith('data:')).map(l => l.slice(5).trim()).join('\n');
+                        if (!data) continue; // retry/keep-alive lines
+                        const ev = JSON.parse(data); after = ev.seq;
+                        if (ev.type === 'done') { const status = await callEckoApi(`${API_ENDPOINTS.jobStatus}?job_id=${encodeURIComponent(jobId)}`, 'GET', null, { background: true }).catch(() => null); renderJobResult(status || ev); return; }
+                        if (ev.type === 'stage' && ev.state === 'queued') continue;
+                        addChatMessage('System', `[${(ev.elapsed_ms / 1000).toFixed(1)}s] ${ev.message}`, 'info');
+                    }
+                }
+            }
+        } catch (e) {
+            logger(`Job stream unavailable (${e.message}); polling job status instead.`, 'warn');
+            watchJob(jobId, deadline);
+        }
+    }
+
+    async function watchJob(jobId, deadline = Date.now() + JOB_WATCH_TIMEOUT_MS) {
+        let after = 0; let lastState = 'queued'; let failures = 0;
+        while (isAuthenticated && !jobWatchExpired(jobId, deadline)) {
+            let job;
+            try {
+                job = await callEckoApi(`${API_ENDPOINTS.jobStatus}?job_id=${encodeURIComponent(jobId)}&after=${after}&wait=20`, 'GET', null, { background: true });
+                failures = 0;
+            } catch (e) {
+                if (++failures >= 3) { logger(`Job ${jobId} polling stopped: ${e.message}`, 'warn'); break; }
+                await new Promise(resolve => setTimeout(resolve, 2000)); continue;
+            }
+            if (!job) break;
+            if (job.version === after) { await new Promise(resolve => setTimeout(resolve, 2000)); continue; } // Served from the store: no long-poll
+            after = job.version;
+            if (job.state !== lastState && !job.done) { addChatMessage('System', `Modification: ${job.message || job.state + '...'}`, 'info'); lastState = job.state; }
+            if (job.done) { renderJobResult(job); break; }
+        }
+    }
+
+    // --- Deploy watch (long-poll of the dispatched run's state transitions) ---
+    const deployWatchIds = { backend: null, frontend: null }; // Latest watch per target; older loops exit
+    async function watchDeployment(target, watchId) {
+        deployWatchIds[target] = watchId;
+        let after = 0;
+        while (deployWatchIds[target] === watchId && isAuthenticated) {
+            let data;
+            try {
+                data = await callEckoApi(`${API_ENDPOINTS.deployEvents}?watch_id=${encodeURIComponent(watchId)}&after=${after}&wait=20`, 'GET', null, { background: true });
+            } catch (e) { logger(`Deploy watch stopped: ${e.message}`, 'warn'); break; }
+            if (data?.unknown) { fetchDeploymentStatus(target); break; } // Served by another instance: plain status instead
+            (data?.events || []).forEach(ev => {
+                after = ev.seq;
+                renderRunStatus(target, { status: ev.state, conclusion: ev.conclusion, html_url: ev.html_url });
+            });
+            if (data?.done) {
+                const w = data.watch || {};
+                addChatMessage('System', `Deploy ${target}: ${w.conclusion || w.state}`, w.conclusion === 'success' ? 'success' : 'info');
+                break;
+            }
+        }
+        if (deployWatchIds[target] === watchId) deployWatchIds[target] = null;
+    }
+
+    function renderRunStatus(target, s) { // s is a run object from github_api.py (or a deploy watch event)
+        const statusSpan = target === 'backend' ? backendStatusSpan : frontendStatusSpan;
+        const urlLink = target === 'backend' ? backendUrlLink : frontendUrlLink;
+        let display = s.status || 'unknown'; let conclusion = s.conclusion;
+        let cssClass = `status-${(s.status || 'unknown').toLowerCase()}`;
+        if (display === 'completed') {
+             display = conclusion || '?';
+             cssClass += conclusion ? ` conclusion-${conclusion.toLowerCase()}` : '';
+        }
+        statusSpan.textContent = display; statusSpan.className = cssClass;
+        if (s.duration_seconds != null) statusSpan.textContent += ` (${formatDuration(s.duration_seconds)})`;
+        if (s.html_url) { urlLink.href = s.html_url; urlLink.style.display = 'inline'; } // Use html_url from GitHub API response
+        else if (s.url) { urlLink.href = s.url; urlLink.style.display = 'inline'; } // Fallback if key name differs
+    }
+
+    function formatDuration(seconds) {
+        const m = Math.floor(seconds / 60); const sec = seconds % 60;
+        return m ? `${m}m ${sec}s` : `${sec}s`;
+    }
+
+    async function fetchAllDeploymentStatuses() { // One request for every target (see /deployment_statuses)
+        showLoading(deployLoading);
+        const targets = { backend: backendStatusSpan, frontend: frontendStatusSpan };
+        Object.values(targets).forEach(span => { span.textContent = 'Checking...'; span.className = 'status-unknown'; });
+        try {
+            const data = await callEckoApi(API_ENDPOINTS.deployStatuses);
+            Object.entries(targets).forEach(([target, statusSpan]) => {
+                const entry = data?.targets?.[target];
+                const s = entry?.status_details;
+                if (!s || s.status === 'error') { statusSpan.textContent = 'Error'; statusSpan.className = 'status-error'; statusSpan.title = entry?.error || ''; }
+                else if (s.status === 'not_found') { statusSpan.textContent = "Not Found"; statusSpan.className = 'status-not_found'; }
+                else {
+                    if (deployWatchIds[target]) return; // A live deploy watch owns this target's display
+                    renderRunStatus(target, s);
+                    // Recent runs as a tooltip: '#12 success 2m 3s', newest first
+                    statusSpan.title = (entry.runs || []).map(r => `#${r.run_number} ${r.conclusion || r.status}${r.duration_seconds != null ? ' ' + formatDuration(r.duration_seconds) : ''}`).join('\n');
+                }
+            });
+        } catch(e){ Object.values(targets).forEach(span => { span.textContent = 'Error'; span.className = 'status-error'; }); }
+        finally { hideLoading(deployLoading); }
+    }
+
     async function fetchDeploymentStatus(target) {
         showLoading(deployLoading);
         const statusSpan = target === 'backend' ? backendStatusSpan : frontendStatusSpan;
@@ -396,16 +622,7 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const data = await callEckoApi(`${API_ENDPOINTS.deployStatus}?target=${target}`); // Auth handled by wrapper
             if (data?.status_details) { // Check for the details object
-                const s = data.status_details; // s is the run object from github_api.py
-                let display = s.status || 'unknown'; let conclusion = s.conclusion;
-                let cssClass = `status-${(s.status || 'unknown').toLowerCase()}`;
-                if (display === 'completed') {
-                     display = conclusion || '?';
-                     cssClass += conclusion ? ` conclusion-${conclusion.toLowerCase()}` : '';
-                }
-                statusSpan.textContent = display; statusSpan.className = cssClass;
-                if (s.html_url) { urlLink.href = s.html_url; urlLink.style.display = 'inline'; } // Use html_url from GitHub API response
-                else if (s.url) { urlLink.href = s.url; urlLink.style.display = 'inline'; } // Fallback if key name differs
+                renderRunStatus(target, data.status_details);
             } else if (data?.status_details?.status === "not_found" || data?.error?.toLowerCase().includes("not found")) { // Check multiple ways for not found
                  statusSpan.textContent = "Not Found"; statusSpan.className = 'status-not_found';
             }
@@ -533,8 +750,13 @@ document.addEventListener('DOMContentLoaded', () => {
         if (deployFrontendBtn && !deployFrontendBtn.dataset.listenerAttached) {
              deployFrontendBtn.addEventListener('click', () => triggerDeploy('frontend')); deployFrontendBtn.dataset.listenerAttached = 'true';
         }
+        if (chatbox && !chatbox.dataset.historyListenerAttached) {
+             // Scrolling to the top of the chat loads the next older history page
+             chatbox.addEventListener('scroll', () => { if (chatbox.scrollTop === 0) fetchConversationHistory(true); });
+             chatbox.dataset.historyListenerAttached = 'true';
+        }
         if (refreshDeployStatusBtn && !refreshDeployStatusBtn.dataset.listenerAttached) {
-             refreshDeployStatusBtn.addEventListener('click', () => { fetchDeploymentStatus('backend'); fetchDeploymentStatus('frontend'); });
+             refreshDeployStatusBtn.addEventListener('click', () => fetchAllDeploymentStatuses());
              refreshDeployStatusBtn.dataset.listenerAttached = 'true';
         }
 
@@ -553,9 +775,9 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!isAuthenticated) return;
         logger("Loading initial monitor panel data...", "init");
         fetchFileList();
-        fetchDeploymentStatus('backend');
-        fetchDeploymentStatus('frontend');
+        fetchAllDeploymentStatuses();
         fetchLogs(); // Fetch initial default logs
+        if (!historyLoadedOnce) { historyLoadedOnce = true; fetchConversationHistory(); } // Latest history page
     }
 
     function startApp() {
@@ -0,0 +1,21 @@
+# tests/conftest.py
+"""Puts backend/ on sys.path and sets the env vars config.py requires (dummy values)."""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+for key, value in {
+    "GCP_PROJECT_ID": "ecko-test",
+    "GCP_GITHUB_PAT_SECRET_NAME": "ecko-test-pat",
+    "GITHUB_REPO_OWNER": "ecko-test-owner",
+    "GITHUB_REPO_NAME": "ecko-test-repo",
+    "ECKO_SHARED_SECRET": "ecko-test-secret",
+    "ALLOWED_ORIGIN": "https://ecko-test.example",
+    "COMMIT_AUTHOR_EMAIL": "ecko-test@example.com",
+}.items():
+    os.environ.setdefault(key, value)
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
@@ -0,0 +1,44 @@
+# tests/test_ci_analytics.py
+import pytest
+
+import ci_analytics
+import github_api
+
+
+@pytest.fixture
+def history(monkeypatch):
+    """A workflow with history["total"] completed runs (ids 1..total, newest first)."""
+    state = {"total": 300, "calls": []}
+
+    def list_workflow_runs(pat, workflow_filename, per_page=10, page=1, **kwargs):
+        state["calls"].append((per_page, page))
+        ids = list(range(state["total"], 0, -1))[(page - 1) * per_page:page * per_page]
+        return [{"id": i, "created_at": f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z",
+                 "updated_at": "2024-01-02T00:00:00Z", "conclusion": "success"} for i in ids], None
+
+    monkeypatch.setattr(github_api, "list_workflow_runs", list_workflow_runs)
+    monkeypatch.setattr(github_api, "get_run_jobs", lambda pat, run_id, **kwargs: ([], None))
+    monkeypatch.setattr(ci_analytics, "_runs", {})
+    return state
+
+
+def test_small_window_does_not_shrink_the_cache(history):
+    for runs, expected in ((200, 200), (10, 10), (100, 100), (200, 200)):
+        analytics, err = ci_analytics.get_workflow_analytics("pat", "wf.yml", runs)
+        assert err is None and analytics["runs"] == expected
+        assert analytics["fetch"]["cached_runs"] == 200
+
+
+def test_larger_window_pages_past_known_runs(history):
+    ci_analytics.get_workflow_analytics("pat", "wf.yml", 10)
+    analytics, _ = ci_analytics.get_workflow_analytics("pat", "wf.yml", 200)
+    assert analytics["runs"] == 200 and analytics["fetch"]["new_runs"] == 190
+
+
+def test_full_cache_fetches_only_the_first_page(history):
+    ci_analytics.get_workflow_analytics("pat", "wf.yml", 200)
+    history["total"] += 5
+    history["calls"].clear()
+    analytics, _ = ci_analytics.get_workflow_analytics("pat", "wf.yml", 200)
+    assert history["calls"] == [(100, 1)]
+    assert analytics["fetch"]["new_runs"] == 5 and analytics["runs"] == 200
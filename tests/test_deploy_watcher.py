@@ -0,0 +1,39 @@
+# tests/test_deploy_watcher.py
+from datetime import datetime, timezone
+
+import pytest
+
+import config
+import deploy_watcher
+import github_api
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the poll intervals; the run is found on the fourth correlation attempt."""
+    recorded = []
+    monkeypatch.setattr(deploy_watcher.time, "sleep", recorded.append)
+    attempts = []
+    def correlate(watch, pat):
+        attempts.append(1)
+        return {"id": 42, "status": "completed", "conclusion": "success"} if len(attempts) == 4 else None
+    monkeypatch.setattr(deploy_watcher, "_correlate_run", correlate)
+    monkeypatch.setattr(config, "DEPLOY_WATCH_MIN_INTERVAL_SECONDS", 2.0)
+    monkeypatch.setattr(config, "DEPLOY_WATCH_BACKOFF_FACTOR", 1.5)
+    return recorded
+
+
+def test_polls_at_the_minimum_interval_until_correlated(sleeps):
+    watch = deploy_watcher.DeployWatch("backend", "deploy-backend.yml", datetime.now(timezone.utc))
+    deploy_watcher._run_watch(watch, lambda: ("pat", None))
+    assert sleeps == [2.0] * 4
+    assert watch.done and watch.run_id == 42
+
+
+def test_backs_off_when_status_lookups_fail(monkeypatch, sleeps):
+    lookups = iter([(None, "boom"), (None, "boom"), ({"id": 42, "status": "completed", "conclusion": "success"}, None)])
+    monkeypatch.setattr(github_api, "get_workflow_run", lambda pat, run_id, **kwargs: next(lookups))
+    watch = deploy_watcher.DeployWatch("backend", "deploy-backend.yml", datetime.now(timezone.utc))
+    watch.run_id = 42
+    deploy_watcher._run_watch(watch, lambda: ("pat", None))
+    assert sleeps == [2.0, 3.0, 4.5]
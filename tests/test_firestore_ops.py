@@ -0,0 +1,36 @@
+# tests/test_firestore_ops.py
+import pytest
+
+import config
+import firestore_ops
+
+
+@pytest.fixture(autouse=True)
+def buffer(monkeypatch):
+    monkeypatch.setattr(firestore_ops, "_pending_messages", [])
+    monkeypatch.setattr(firestore_ops, "_history_caches", firestore_ops.OrderedDict())
+    monkeypatch.setattr(firestore_ops, "_ensure_flusher_started", lambda: None)
+    monkeypatch.setattr(config, "HISTORY_FLUSH_MAX_MESSAGES", 100)
+    monkeypatch.setattr(config, "HISTORY_BUFFER_MAX_PENDING", 3)
+    monkeypatch.setattr(config, "HISTORY_BUFFER_FULL_WAIT_SECONDS", 0.2)
+
+
+def test_full_buffer_keeps_messages_while_firestore_is_down(monkeypatch):
+    flushes = []
+    monkeypatch.setattr(firestore_ops, "flush_conversation_history", lambda: flushes.append(1) or 0)
+    for i in range(6):
+        firestore_ops.add_to_conversation_history("user", f"message {i}")
+    assert [str(entry[2]["message"]) for entry in firestore_ops._pending_messages] == [f"message {i}" for i in range(6)]
+    assert len(flushes) > 3 # Each writer over the limit retried the flush
+
+
+def test_full_buffer_is_flushed_by_the_writer(monkeypatch):
+    written = []
+    def flush():
+        written.extend(firestore_ops._pending_messages)
+        firestore_ops._pending_messages.clear()
+        return len(written)
+    monkeypatch.setattr(firestore_ops, "flush_conversation_history", flush)
+    for i in range(4):
+        firestore_ops.add_to_conversation_history("user", f"message {i}")
+    assert len(written) == 4 and firestore_ops._pending_messages == []
@@ -0,0 +1,36 @@
+# tests/test_gcp_ops.py
+import pytest
+
+import gcp_ops
+
+
+class FakeLoggingClient:
+    def __init__(self):
+        self.calls = []
+
+    def list_entries(self, **kwargs):
+        self.calls.append(kwargs)
+        return iter([])
+
+
+@pytest.fixture
+def logging_client(monkeypatch):
+    client = FakeLoggingClient()
+    monkeypatch.setattr(gcp_ops, "logging_client", client)
+    monkeypatch.setattr(gcp_ops, "_init_clients", lambda **kwargs: None)
+    monkeypatch.setattr(gcp_ops, "_function_log_resource", lambda: ("cloud_run_revision", "service_name", "ecko"))
+    return client
+
+
+@pytest.mark.parametrize("limit, page_size", [(50, 50), (1000, 1000), (5000, 1000)])
+def test_gcf_log_pages_stay_within_the_api_limit(logging_client, limit, page_size):
+    _, err = gcp_ops.get_gcf_logs(limit, min_severity="DEFAULT")
+    assert err is None
+    (call,) = logging_client.calls
+    assert (call["max_results"], call["page_size"]) == (limit, page_size)
+
+
+def test_unknown_severity_is_rejected_by_the_filter_builder():
+    with pytest.raises(ValueError, match="Use one of: DEFAULT, DEBUG"):
+        gcp_ops.build_gcf_log_filter("cloud_run_revision", "service_name", "ecko", min_severity="loud")
+    assert "severity>=NOTICE" in gcp_ops.build_gcf_log_filter("cloud_run_revision", "service_name", "ecko", min_severity="notice")
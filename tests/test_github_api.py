@@ -0,0 +1,68 @@
+# tests/test_github_api.py
+import io
+import zipfile
+
+import pytest
+import requests
+
+import config
+import github_api
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body, self.status_code = body, status_code
+        self.headers = {}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, text in files.items():
+            archive.writestr(name, text)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def download(monkeypatch):
+    def serve(response):
+        class Session:
+            def get(self, *args, **kwargs):
+                return response
+        monkeypatch.setattr(github_api, "_get_session", lambda: Session())
+        return github_api.download_and_extract_log_content("https://logs", "pat")
+    return serve
+
+
+def test_extracts_members(download):
+    response = FakeResponse(_zip({"build/1_Setup.txt": "setup ok", "build/2_Test.txt": "tests ok"}))
+    content, err = download(response)
+    assert err is None and "--- Log File: build/2_Test.txt ---\ntests ok" in content
+    assert response.closed
+
+
+@pytest.mark.parametrize("response", [FakeResponse(b"x" * 64), FakeResponse(b"", status_code=502)])
+def test_response_is_closed_when_the_download_fails(monkeypatch, download, response):
+    monkeypatch.setattr(config, "LOG_ARCHIVE_MAX_DOWNLOAD_BYTES", 16)
+    monkeypatch.setattr(config, "LOG_ARCHIVE_READ_CHUNK_BYTES", 8)
+    content, err = download(response)
+    assert content is None and err
+    assert response.closed
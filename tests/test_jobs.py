@@ -0,0 +1,50 @@
+# tests/test_jobs.py
+import threading
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Store whose writes can be held mid-flight; records the order writes complete in."""
+    state = {"docs": {}, "writes": [], "hold": None}
+
+    def save(job_dict):
+        hold = state["hold"]
+        if hold is not None and job_dict["state"] == hold["state"]:
+            hold["entered"].set()
+            hold["release"].wait(5)
+        state["docs"][job_dict["job_id"]] = job_dict
+        state["writes"].append(job_dict["state"])
+        return None
+
+    monkeypatch.setattr(jobs, "_store_save", save)
+    monkeypatch.setattr(jobs, "_store_load", lambda job_id: (state["docs"].get(job_id), None))
+    return state
+
+
+def test_heartbeat_in_flight_cannot_overwrite_done(store):
+    job = jobs.Job("modify", "test")
+    job.advance("pushing")
+    store["hold"] = {"state": "pushing", "entered": threading.Event(), "release": threading.Event()}
+    heartbeat = threading.Thread(target=jobs._persist, args=(job,), kwargs={"heartbeat": True})
+    heartbeat.start()
+    assert store["hold"]["entered"].wait(5)
+    finisher = threading.Thread(target=job.finish, args=({"response": "ok"}, 200))
+    finisher.start()
+    finisher.join(0.2)
+    assert finisher.is_alive() # The done write waits for the heartbeat write
+    store["hold"]["release"].set()
+    heartbeat.join(5); finisher.join(5)
+    assert store["writes"][-2:] == ["pushing", "done"]
+    assert store["docs"][job.job_id]["done"]
+
+
+def test_heartbeat_skips_finished_jobs(store):
+    job = jobs.Job("modify", "test")
+    job.finish({"response": "ok"}, 200)
+    writes = len(store["writes"])
+    jobs._persist(job, heartbeat=True)
+    assert len(store["writes"]) == writes
@@ -0,0 +1,42 @@
+# tests/test_log_search.py
+import re
+
+import pytest
+
+import config
+import log_search
+
+
+@pytest.mark.parametrize("pattern", [
+    r"timeout", r"error.*db", r"(foo|bar) failed", r"\d{3,5}ms", r"(?:ab)+c", r"[(+*)]+x", r"(\w+)@example\.com", r"a{2}",
+])
+def test_safe_regexes_compile(pattern):
+    assert log_search.compile_regex(pattern).flags & re.IGNORECASE
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(a+)+$", r"(a*)*b", r"(a|aa)+$", r"((ab)*c)+", r"(\d+){2,}", r"(a?){25}", r"(a)\1", r"(?=a)a", r"(?<!x)y",
+    r"a.*b.*c.*d.*e", "x" * 201, r"(unclosed",
+])
+def test_unsafe_or_invalid_regexes_are_rejected(pattern):
+    with pytest.raises(ValueError):
+        log_search.compile_regex(pattern)
+
+
+def test_scan_stops_at_the_deadline(monkeypatch):
+    index = log_search.LogIndex().add_lines("gcf", [f"[2024-01-01 12:00:00 UTC] [INFO] line {i}" for i in range(2000)])
+    monkeypatch.setattr(config, "LOG_SEARCH_MAX_SCAN_SECONDS", -1)
+    found = index.search(regex=log_search.compile_regex("line"))
+    assert found["truncated"] and found["total"] < 2000
+    assert not index.search(terms=["line"])["truncated"] # Term-only scans are not bounded
+
+
+def test_gcf_windows_are_bucketed():
+    assert [log_search.gcf_window_minutes(m) for m in (1, 15, 15.5, 61, 10 ** 6)] == [15, 15, 60, 360, config.LOG_QUERY_MAX_WINDOW_MINUTES]
+
+
+def test_failed_loads_release_their_build_lock(monkeypatch):
+    monkeypatch.setattr(log_search, "_build_locks", {})
+    index, err = log_search.get_index(("gcf", "failing"), lambda: ("gcf", [], "Cloud Logging unavailable"))
+    assert index is None and err == "Cloud Logging unavailable"
+    assert log_search._build_locks == {}
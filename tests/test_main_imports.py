@@ -0,0 +1,37 @@
+# tests/test_main_imports.py
+import sys
+
+import pytest
+
+import config
+from conftest import BACKEND_DIR
+
+SIBLINGS = ("config", "run_log_cache", "tracing", "gcp_ops", "github_api", "firestore_ops",
+            "log_search", "deploy_watcher", "ci_analytics", "jobs")
+
+
+@pytest.fixture
+def entry_point(monkeypatch):
+    """main.py loaded the way Functions Framework loads it (as a package named 'main')."""
+    _function_registry = pytest.importorskip("functions_framework._function_registry")
+    monkeypatch.setattr(config, "SECRET_PREFETCH_ON_START", False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    module, spec = _function_registry.load_function_module(str(BACKEND_DIR / "main.py"))
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_sibling_modules_are_loaded_once(entry_point):
+    for name in SIBLINGS:
+        assert getattr(entry_point, name) is sys.modules[name], name
+        assert f"main.{name}" not in sys.modules, name
+    import ci_analytics, deploy_watcher
+    assert deploy_watcher.github_api is entry_point.github_api
+    # CI analytics' background fetches must share main's scheduler (and its interactive reserve)
+    assert ci_analytics.github_api is entry_point.github_api
+
+
+def test_auth_failure_hook_reaches_the_shared_github_api(entry_point):
+    import github_api
+    assert entry_point.gcp_ops.invalidate_github_pat in github_api._auth_failure_hooks
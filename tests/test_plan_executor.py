@@ -0,0 +1,74 @@
+# tests/test_plan_executor.py
+import plan_executor
+
+
+def _text(*lines):
+    return "\n".join(lines)
+
+
+BASE = {"a.py": _text("a", "b", "c", "d", "e")}
+REPLACE_C = [{"operation": "replace_lines", "file_path": "a.py", "start_line_number": 3, "end_line_number": 3,
+              "replacement_lines": ["C"]}]
+
+
+def test_rebase_unchanged_file_executes_plan_as_is():
+    changes, warnings, conflicts = plan_executor.rebase_plan(REPLACE_C, BASE, dict(BASE))
+    assert conflicts == [] and warnings == []
+    assert changes == {"a.py": _text("a", "b", "C", "d", "e")}
+
+
+def test_rebase_moves_line_numbers_past_upstream_insert():
+    head = {"a.py": _text("x", "y", "a", "b", "c", "d", "e")}
+    changes, _, conflicts = plan_executor.rebase_plan(REPLACE_C, BASE, head)
+    assert conflicts == []
+    assert changes == {"a.py": _text("x", "y", "a", "b", "C", "d", "e")}
+
+
+def test_chained_rebases_translate_from_the_original_base():
+    # The remote moves twice (insert at the top, then append); each rebase starts from
+    # the content the plan was generated against, never from the previous rebase
+    first_head = {"a.py": _text("x", "y", "a", "b", "c", "d", "e")}
+    second_head = {"a.py": _text("x", "y", "a", "b", "c", "d", "e", "z")}
+    changes, _, conflicts = plan_executor.rebase_plan(REPLACE_C, BASE, first_head)
+    assert conflicts == [] and changes["a.py"] == _text("x", "y", "a", "b", "C", "d", "e")
+    changes, _, conflicts = plan_executor.rebase_plan(REPLACE_C, BASE, second_head)
+    assert conflicts == []
+    assert changes == {"a.py": _text("x", "y", "a", "b", "C", "d", "e", "z")}
+
+
+def test_rebase_conflicts_when_edited_line_changed_upstream():
+    head = {"a.py": _text("a", "b", "c2", "d", "e")}
+    changes, _, conflicts = plan_executor.rebase_plan(REPLACE_C, BASE, head)
+    assert changes is None and len(conflicts) == 1
+
+
+def test_rebase_insert_conflicts_when_anchor_neighbours_split():
+    plan = [{"operation": "insert_lines", "file_path": "a.py", "after_line_number": 2, "lines_to_insert": ["new"]}]
+    head = {"a.py": _text("a", "b", "upstream", "c", "d", "e")}
+    changes, _, conflicts = plan_executor.rebase_plan(plan, BASE, head)
+    assert changes is None and conflicts
+
+
+def test_rebase_sequential_ops_on_one_file():
+    plan = [
+        {"operation": "insert_lines", "file_path": "a.py", "after_line_number": 0, "lines_to_insert": ["top"]},
+        {"operation": "delete_lines", "file_path": "a.py", "start_line_number": 5, "end_line_number": 5},
+    ]
+    head = {"a.py": _text("a", "b", "c", "d", "e", "tail")}
+    changes, _, conflicts = plan_executor.rebase_plan(plan, BASE, head)
+    assert conflicts == []
+    assert changes == {"a.py": _text("top", "a", "b", "c", "e", "tail")}
+
+
+def test_rebase_whole_file_rewrite_conflicts_on_changed_file():
+    plan = [{"operation": "replace_entire_file", "file_path": "a.py", "new_content": "new"}]
+    head = {"a.py": _text("a", "b", "c", "d", "e", "z")}
+    changes, _, conflicts = plan_executor.rebase_plan(plan, BASE, head)
+    assert changes is None and conflicts
+
+
+def test_rebase_leaves_other_files_alone():
+    base = {**BASE, "b.py": _text("one")}
+    head = {"a.py": _text("x", "a", "b", "c", "d", "e")}
+    changes, _, conflicts = plan_executor.rebase_plan(REPLACE_C, base, head)
+    assert conflicts == [] and set(changes) == {"a.py"}
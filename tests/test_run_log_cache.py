@@ -0,0 +1,47 @@
+# tests/test_run_log_cache.py
+from collections import OrderedDict
+
+import pytest
+
+import config
+import github_api
+import run_log_cache
+
+LOG = "--- Log File: build/1_Set up job.txt ---\nsetup line\n\n--- Log File: build/2_Run tests.txt ---\ntest line 1\ntest line 2\n"
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "RUN_LOG_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "RUN_LOG_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(run_log_cache, "_index", OrderedDict())
+    monkeypatch.setattr(run_log_cache, "_index_loaded", False)
+    return tmp_path
+
+
+def test_steps_are_served_from_the_index():
+    assert run_log_cache.put(7, LOG)
+    assert [step["name"] for step in run_log_cache.list_steps(7)] == ["build/1_Set up job.txt", "build/2_Run tests.txt"]
+    assert run_log_cache.get_step(7, "build/2_Run tests.txt") == "test line 1\ntest line 2"
+    assert run_log_cache.get_step(7, "build/3_Missing.txt") is None
+    assert run_log_cache.list_steps(8) is None
+
+
+def test_index_is_rebuilt_from_disk(monkeypatch):
+    run_log_cache.put(7, LOG)
+    monkeypatch.setattr(run_log_cache, "_index", OrderedDict())
+    monkeypatch.setattr(run_log_cache, "_index_loaded", False)
+    assert run_log_cache.get_step(7, "build/1_Set up job.txt") == "setup line"
+
+
+@pytest.mark.parametrize("failed, cached", [([], True), (["build/2_Run tests.txt"], False)])
+def test_partial_extractions_are_not_cached(monkeypatch, failed, cached):
+    def download(url, pat, failed_members=None, **kwargs):
+        failed_members.extend(failed)
+        return LOG, None
+
+    monkeypatch.setattr(github_api, "get_workflow_log_url", lambda pat, run_id, **kwargs: ({"log_archive_url": "https://logs"}, None))
+    monkeypatch.setattr(github_api, "download_and_extract_log_content", download)
+    content, err, status = github_api.get_run_log_content("pat", {"id": 7, "status": "completed"})
+    assert (content, err, status) == (LOG, None, "downloaded")
+    assert (run_log_cache.get(7) is not None) == cached